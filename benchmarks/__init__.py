@@ -0,0 +1,4 @@
+"""
+Benchmark suite for indexing and query performance
+Run: python -m benchmarks --help
+"""
@@ -0,0 +1,97 @@
+"""
+CLI: python -m benchmarks --docs 1000 --concurrency 1,4,16 --output results.json
+"""
+import argparse
+import contextlib
+import json
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from src.index_factory import INDEX_TYPES
+from src.quantization import CACHE_DTYPES
+from src.search_engine import SEARCH_MODES
+from .corpus import generate_corpus, generate_queries
+from .suite import bench_embedding, bench_cache, bench_build, bench_search
+
+def _git_revision() -> str:
+    """Commit of the benchmarked tree, "unknown" outside a git checkout"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark embedding, caching, indexing and search")
+    parser.add_argument("--docs", type=int, default=1000, help="synthetic corpus size")
+    parser.add_argument("--words", type=int, default=200, help="mean words per document")
+    parser.add_argument("--queries", type=int, default=400, help="search requests in total")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated client thread counts")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--mode", default="vector", choices=SEARCH_MODES)
+    parser.add_argument("--index-type", default="flat", choices=INDEX_TYPES)
+    parser.add_argument("--workers", type=int, default=1, help="embedding worker processes")
+    parser.add_argument("--batch-size", type=int, default=32, help="encode batch size per worker")
+    parser.add_argument("--cache-rows", type=int, default=10000, help="rows for the cache benchmark")
+    parser.add_argument("--cache-dtype", default="float32", choices=CACHE_DTYPES)
+    parser.add_argument("--skip", default="", help="comma-separated benchmarks to skip: embed,cache,build,search")
+    parser.add_argument("--work-dir", help="directory for corpus and caches (default: temporary)")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    skip = set(filter(None, args.skip.split(",")))
+    concurrency = [int(level) for level in args.concurrency.split(",")]
+    work_dir = Path(args.work_dir) if args.work_dir else Path(tempfile.mkdtemp(prefix="search-bench-"))
+    docs_dir = work_dir / "docs"
+    cache_path = work_dir / "embeddings.db"
+
+    report = {
+        "revision": _git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "config": vars(args),
+        "results": {},
+    }
+    results = report["results"]
+
+    # Progress output of the engine goes to stderr, stdout carries the JSON
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            print(f"Generating {args.docs} documents in {docs_dir}...")
+            doc_paths = generate_corpus(docs_dir, args.docs, words_per_doc=args.words)
+
+            if "embed" not in skip:
+                results["embedding"] = bench_embedding(doc_paths, cache_path, args.workers, args.batch_size)
+
+            if "cache" not in skip:
+                results["cache"] = bench_cache(work_dir / "cache_bench.db", args.cache_rows, dtype=args.cache_dtype)
+
+            if not {"build", "search"} <= skip:
+                build, engine = bench_build(
+                    docs_dir, work_dir / "index", cache_path,
+                    index_type=args.index_type, cache_dtype=args.cache_dtype, result_cache_size=0
+                )
+                if "build" not in skip:
+                    results["build"] = build
+                if "search" not in skip:
+                    queries = generate_queries(args.queries + 1)
+                    results["search"] = bench_search(engine, queries, concurrency, args.top_k, args.mode)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n", encoding='utf-8')
+        print(f"✓ Results written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Synthetic corpora and queries with a Zipf-distributed vocabulary
+"""
+from pathlib import Path
+from typing import List
+import numpy as np
+
+# Same naming scheme as setup.py, so category filters work on synthetic docs
+CATEGORIES = ("rec.sport.baseball", "sci.space", "comp.graphics", "talk.politics.misc")
+
+def _vocabulary(size: int, rng: np.random.Generator) -> np.ndarray:
+    """Pronounceable pseudo-words"""
+    consonants = list("bcdfghklmnprstvz")
+    vowels = list("aeiou")
+    words = set()
+    while len(words) < size:
+        syllables = rng.integers(1, 4)
+        words.add("".join(rng.choice(consonants) + rng.choice(vowels) for _ in range(syllables)))
+    return np.array(sorted(words))
+
+def _zipf_words(vocabulary: np.ndarray, count: int, rng: np.random.Generator) -> List[str]:
+    """count words drawn with Zipf-like frequencies"""
+    ranks = rng.zipf(1.3, size=count) - 1
+    return list(vocabulary[ranks % len(vocabulary)])
+
+def generate_corpus(docs_dir: Path, n_docs: int, words_per_doc: int = 200,
+                    vocabulary_size: int = 5000, seed: int = 0) -> List[Path]:
+    """Write n_docs documents of about words_per_doc words, returns their paths"""
+    rng = np.random.default_rng(seed)
+    vocabulary = _vocabulary(vocabulary_size, rng)
+    docs_dir = Path(docs_dir)
+    docs_dir.mkdir(parents=True, exist_ok=True)
+
+    paths = []
+    for idx in range(n_docs):
+        category = CATEGORIES[idx % len(CATEGORIES)]
+        length = max(1, int(rng.normal(words_per_doc, words_per_doc / 4)))
+        path = docs_dir / f"doc_{idx:04d}_{category.replace('.', '_')}.txt"
+        path.write_text(" ".join(_zipf_words(vocabulary, length, rng)), encoding='utf-8')
+        paths.append(path)
+    return paths
+
+def generate_queries(n_queries: int, words_per_query: int = 4, vocabulary_size: int = 5000,
+                     seed: int = 0) -> List[str]:
+    """Distinct queries drawn from the corpus vocabulary"""
+    rng = np.random.default_rng(seed)
+    vocabulary = _vocabulary(vocabulary_size, rng)
+    queries = []
+    seen = set()
+    while len(queries) < n_queries:
+        query = " ".join(_zipf_words(vocabulary, words_per_query, rng))
+        if query not in seen:
+            seen.add(query)
+            queries.append(query)
+    return queries
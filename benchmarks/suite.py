@@ -0,0 +1,135 @@
+"""
+Individual benchmarks; each returns a JSON-serializable dict
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Tuple
+import numpy as np
+from src.cache_manager import CacheManager
+from src.embedder import EmbeddingGenerator
+from src.search_engine import SearchEngine
+
+def latency_summary(latencies: List[float], wall_time: float) -> dict:
+    """p50/p95/p99/mean in milliseconds plus requests per second"""
+    ms = np.array(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+        "qps": round(len(latencies) / wall_time, 2),
+    }
+
+def bench_embedding(doc_paths: List[Path], cache_path: Path, num_workers: int = 1,
+                    batch_size: int = 32) -> dict:
+    """embed_documents throughput on a cold cache, then on a warm one"""
+    embedder = EmbeddingGenerator(cache_path=str(cache_path))
+    try:
+        start = time.perf_counter()
+        embedder.embed_documents(doc_paths, force_recompute=True, num_workers=num_workers,
+                                 batch_size=batch_size)
+        cold = time.perf_counter() - start
+
+        start = time.perf_counter()
+        embedder.embed_documents(doc_paths)
+        warm = time.perf_counter() - start
+    finally:
+        embedder.cache.close()
+
+    return {
+        "documents": len(doc_paths),
+        "workers": num_workers,
+        "batch_size": batch_size,
+        "cold_seconds": round(cold, 3),
+        "cold_docs_per_sec": round(len(doc_paths) / cold, 2),
+        "warm_seconds": round(warm, 3),
+        "warm_docs_per_sec": round(len(doc_paths) / warm, 2),
+    }
+
+def bench_cache(cache_path: Path, n_rows: int = 10000, dimension: int = 384,
+                dtype: str = "float32", seed: int = 0) -> dict:
+    """CacheManager bulk write, hit and miss throughput"""
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n_rows, dimension)).astype('float32')
+    rows = [(f"doc_{i}", vectors[i], f"hash_{i}") for i in range(n_rows)]
+
+    cache = CacheManager(str(cache_path), dtype=dtype, dim=dimension)
+    try:
+        cache.clear()
+
+        start = time.perf_counter()
+        cache.set_many(rows)
+        write = time.perf_counter() - start
+
+        start = time.perf_counter()
+        hits = cache.get_many((doc_id, text_hash) for doc_id, _, text_hash in rows)
+        read_hit = time.perf_counter() - start
+
+        start = time.perf_counter()
+        misses = cache.get_many((doc_id, "stale") for doc_id, _, _ in rows)
+        read_miss = time.perf_counter() - start
+    finally:
+        cache.close()
+
+    if len(hits) != n_rows or misses:
+        raise RuntimeError(f"Cache returned {len(hits)} hits and {len(misses)} misses for {n_rows} rows")
+    return {
+        "rows": n_rows,
+        "dtype": dtype,
+        "write_rows_per_sec": round(n_rows / write, 2),
+        "hit_rows_per_sec": round(n_rows / read_hit, 2),
+        "miss_rows_per_sec": round(n_rows / read_miss, 2),
+        "db_bytes": cache_path.stat().st_size,
+    }
+
+def bench_build(docs_dir: Path, index_dir: Path, cache_path: Path,
+                **engine_options) -> Tuple[dict, SearchEngine]:
+    """
+    build_index from a warm embedding cache, then reload from the snapshot
+    Returns the timings and the engine, ready for bench_search
+    """
+    engine = SearchEngine(index_dir=str(index_dir), cache_path=str(cache_path), **engine_options)
+
+    start = time.perf_counter()
+    engine.build_index(str(docs_dir), force_rebuild=True)
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    engine.build_index(str(docs_dir))
+    load = time.perf_counter() - start
+
+    return {
+        "vectors": int(engine.index.ntotal),
+        "build_seconds": round(build, 3),
+        "snapshot_load_seconds": round(load, 3),
+    }, engine
+
+def bench_search(engine: SearchEngine, queries: List[str], concurrency: List[int],
+                 top_k: int = 5, mode: str = "vector") -> dict:
+    """
+    search() latency percentiles and QPS per concurrency level
+    Every request uses a distinct query, so query caches do not help
+    """
+    # Warm up the model and index outside the measurements
+    engine.search(queries[0], top_k, mode=mode)
+
+    def timed(query: str) -> float:
+        start = time.perf_counter()
+        engine.search(query, top_k, mode=mode)
+        return time.perf_counter() - start
+
+    levels = {}
+    offset = 1
+    per_level = max(1, (len(queries) - 1) // len(concurrency))
+    for threads in concurrency:
+        batch = queries[offset:offset + per_level]
+        offset += per_level
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            start = time.perf_counter()
+            latencies = list(pool.map(timed, batch))
+            wall = time.perf_counter() - start
+        levels[str(threads)] = latency_summary(latencies, wall)
+
+    return {"top_k": top_k, "mode": mode, "concurrency": levels}
@@ -1,11 +1,22 @@
 """
 FastAPI backend
 """
-from fastapi import FastAPI, HTTPException
+import os
+import secrets
+import time
+from fastapi import FastAPI, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List
-from .search_engine import SearchEngine
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional, Union
+from .search_engine import (
+    SearchEngine, SEARCH_MODES, PAGINATION_DEPTH, DEFAULT_NPROBE, DEFAULT_EF_SEARCH, CursorExpired
+)
+from .fusion import FUSION_METHODS
+from .worker_pool import WorkerPool, PoolSaturated
+from .metrics import REGISTRY, STAGE_SECONDS
+
+HTTP_SECONDS = REGISTRY.histogram("http_request_seconds", "End-to-end request time by route")
 
 app = FastAPI(title="Multi-Document Search API")
 
@@ -20,19 +31,195 @@ app.add_middleware(
 # Initialize search engine
 search_engine = None
 
+# Blocking search work runs here so the event loop stays responsive
+worker_pool = WorkerPool(
+    max_workers=int(os.environ.get("SEARCH_MAX_WORKERS", "4")),
+    max_pending=int(os.environ.get("SEARCH_MAX_PENDING", "64")),
+)
+
+# Bearer token of administrative routes (model re-embedding); unset disables them
+ADMIN_TOKEN = os.environ.get("SEARCH_ADMIN_TOKEN")
+
+# Largest ranked list a client may ask /search/page to rank and keep behind a cursor
+MAX_PAGINATION_DEPTH = int(os.environ.get("SEARCH_MAX_DEPTH", "1000"))
+
+# Largest top_k of /search and /search/batch, and most queries in one batch
+MAX_TOP_K = int(os.environ.get("SEARCH_MAX_TOP_K", "100"))
+MAX_BATCH_QUERIES = int(os.environ.get("SEARCH_MAX_BATCH", "64"))
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Run a blocking engine call on the worker pool, 503 when saturated
+    Time spent waiting for a worker is recorded as the queue_wait stage
+    (and in kwargs["timings"] when the call collects timings)
+    """
+    timings = kwargs.get("timings")
+    submitted = time.perf_counter()
+
+    def job():
+        wait = time.perf_counter() - submitted
+        STAGE_SECONDS.observe(wait, stage="queue_wait")
+        if timings is not None:
+            timings["queue_wait"] = round(wait * 1000, 3)
+        return func(*args, **kwargs)
+
+    try:
+        return await worker_pool.run(job)
+    except PoolSaturated:
+        raise HTTPException(
+            status_code=503,
+            detail="Server busy, retry later",
+            headers={"Retry-After": "1"}
+        )
+
 class SearchRequest(BaseModel):
     query: str
-    top_k: int = 5
+    top_k: int = Field(5, ge=1, le=MAX_TOP_K)
+    nprobe: Optional[int] = None  # IVF indexes only
+    ef_search: Optional[int] = None  # HNSW index only
+    mode: str = "vector"  # vector, keyword (BM25) or hybrid
+    fusion: str = "rrf"  # hybrid only: rrf or weighted
+    alpha: float = 0.5  # weighted fusion: share of the vector score
+    filters: Optional[Dict[str, Union[str, List[str]]]] = None  # e.g. {"category": "rec.sport"}
+    debug_timings: bool = False  # include per-stage milliseconds in the response
+
+def validate_mode(mode: str, fusion: str):
+    """Reject unknown search modes / fusion methods with 400"""
+    if mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {list(SEARCH_MODES)}")
+    
+    if fusion not in FUSION_METHODS:
+        raise HTTPException(status_code=400, detail=f"fusion must be one of {list(FUSION_METHODS)}")
+
+def validate_filters(filters: Optional[dict]):
+    """Reject unknown filter fields with 400"""
+    try:
+        search_engine.metadata.validate(filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def require_admin(authorization: Optional[str]):
+    """404 when administrative routes are disabled, 403 without the admin token"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not found")
+
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not secrets.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Admin token required")
 
 class SearchResponse(BaseModel):
     results: List[dict]
+    debug_timings: Optional[Dict[str, float]] = None
+
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    top_k: int = Field(5, ge=1, le=MAX_TOP_K)
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
+    mode: str = "vector"
+    fusion: str = "rrf"
+    alpha: float = 0.5
+    filters: Optional[Dict[str, Union[str, List[str]]]] = None
+    debug_timings: bool = False
+
+class BatchSearchResponse(BaseModel):
+    results: List[List[dict]]
+    debug_timings: Optional[Dict[str, float]] = None
+
+class PageRequest(BaseModel):
+    query: Optional[str] = None  # first page only
+    cursor: Optional[str] = None  # next_cursor of the previous page
+    page_size: int = 10
+    depth: int = PAGINATION_DEPTH  # results ranked by the first call
+    min_score: Optional[float] = None  # range search above this similarity
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
+    mode: str = "vector"
+    fusion: str = "rrf"
+    alpha: float = 0.5
+    filters: Optional[Dict[str, Union[str, List[str]]]] = None
+
+class ReembedRequest(BaseModel):
+    model: str
+    revision: Optional[str] = None
+    switch: bool = True  # swap to the new model once its index is built
+
+class PageResponse(BaseModel):
+    results: List[dict]
+    next_cursor: Optional[str]
+    total: int
+
+@app.middleware("http")
+async def record_timings(request: Request, call_next):
+    """
+    Request duration per route; for search routes the time outside the
+    handler (response validation and serialization) is the serialize stage
+    """
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+
+    route = request.scope.get("route")
+    HTTP_SECONDS.observe(elapsed, path=getattr(route, "path", "unmatched"), status=response.status_code)
+    handler_seconds = getattr(request.state, "handler_seconds", None)
+    if handler_seconds is not None:
+        STAGE_SECONDS.observe(max(0.0, elapsed - handler_seconds), stage="serialize")
+    return response
+
+def register_gauges(engine: SearchEngine):
+    """Expose engine, cache and queue sizes on /metrics"""
+    REGISTRY.gauge("search_index_vectors", "Vectors in the FAISS index",
+                   lambda: engine.index.ntotal if engine.index is not None else 0)
+    REGISTRY.gauge("search_documents", "Indexed documents", lambda: len(engine.doc_id_map) + len(engine.duplicates))
+    REGISTRY.gauge("search_index_version", "Index mutations since start", lambda: engine.index_version)
+    REGISTRY.gauge("worker_pool_pending", "Searches queued or running on the worker pool",
+                   lambda: worker_pool.pending)
+    REGISTRY.gauge("worker_pool_rejected_total", "Searches rejected with 503",
+                   lambda: worker_pool.rejected, kind="counter")
+
+    # Read at scrape time: reembed() replaces the embedder and its query cache
+    caches = {"result": lambda: engine.result_cache, "query_embedding": lambda: engine.embedder.query_cache,
+              "cursor": lambda: engine.cursors}
+    for name, cache in caches.items():
+        if cache() is None:
+            continue
+        REGISTRY.gauge(f"{name}_cache_entries", f"Entries in the {name} cache", lambda c=cache: len(c()))
+        REGISTRY.gauge(f"{name}_cache_hits_total", f"{name} cache hits", lambda c=cache: c().hits, kind="counter")
+        REGISTRY.gauge(f"{name}_cache_misses_total", f"{name} cache misses",
+                       lambda c=cache: c().misses, kind="counter")
+
+    REGISTRY.gauge("embed_batcher_queued", "Queries waiting for an encode batch",
+                   lambda: engine.embedder.batcher.stats()["queued"] if engine.embedder.batcher else 0)
 
 @app.on_event("startup")
 async def startup_event():
     """Build search index on startup"""
     global search_engine
-    search_engine = SearchEngine()
+    # Unset SEARCH_MODEL keeps the snapshot's model, e.g. one switched to by /models/reembed
+    search_engine = SearchEngine(
+        model_name=os.environ.get("SEARCH_MODEL"),
+        model_revision=os.environ.get("SEARCH_MODEL_REVISION"),
+        n_shards=int(os.environ.get("SEARCH_SHARDS", "1")),
+        nprobe=int(os.environ.get("SEARCH_NPROBE", DEFAULT_NPROBE)),
+        ef_search=int(os.environ.get("SEARCH_EF_SEARCH", DEFAULT_EF_SEARCH))
+    )
     search_engine.build_index()
+    register_gauges(search_engine)
+    
+    # Coalesce concurrent queries into shared encode calls (0 disables)
+    batch_wait_ms = float(os.environ.get("EMBED_BATCH_WAIT_MS", "5"))
+    if batch_wait_ms > 0:
+        search_engine.embedder.enable_batching(
+            max_batch_size=int(os.environ.get("EMBED_BATCH_MAX_SIZE", "32")),
+            max_wait_ms=batch_wait_ms
+        )
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Wait for in-flight searches, then persist a scheduled snapshot and release the index"""
+    worker_pool.shutdown()
+    if search_engine is not None:
+        search_engine.close()
 
 @app.get("/")
 async def root():
@@ -40,22 +227,157 @@ async def root():
         "message": "Multi-Document Search API",
         "endpoints": {
             "/search": "POST - Search documents",
+            "/search/batch": "POST - Search many queries at once",
+            "/search/page": "POST - Paginated search with cursors",
+            "/metrics": "GET - Prometheus metrics",
+            "/categories": "GET - Values accepted by the category filter",
+            "/models": "GET - Active model, cached namespaces and re-embedding progress",
+            "/models/reembed": "POST - Re-embed documents with another model in the background",
             "/docs": "API documentation"
         }
     }
 
 @app.post("/search", response_model=SearchResponse)
-async def search(request: SearchRequest):
+async def search(request: SearchRequest, http_request: Request):
     """Search documents"""
+    start = time.perf_counter()
     if search_engine is None:
         raise HTTPException(status_code=503, detail="Search engine not initialized")
     
     if not request.query.strip():
         raise HTTPException(status_code=400, detail="Query cannot be empty")
     
-    results = search_engine.search(request.query, request.top_k)
+    validate_mode(request.mode, request.fusion)
+    validate_filters(request.filters)
+    
+    timings = {} if request.debug_timings else None
+    results = await run_blocking(
+        search_engine.search,
+        request.query,
+        request.top_k,
+        nprobe=request.nprobe,
+        ef_search=request.ef_search,
+        mode=request.mode,
+        fusion=request.fusion,
+        alpha=request.alpha,
+        filters=request.filters,
+        timings=timings
+    )
+    
+    http_request.state.handler_seconds = time.perf_counter() - start
+    return {"results": results, "debug_timings": timings}
+
+@app.post("/search/batch", response_model=BatchSearchResponse)
+async def search_batch(request: BatchSearchRequest, http_request: Request):
+    """Search many queries with one batched encode and index search"""
+    start = time.perf_counter()
+    if search_engine is None:
+        raise HTTPException(status_code=503, detail="Search engine not initialized")
+    
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="Queries cannot be empty")
+    
+    if len(request.queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_QUERIES} queries per batch")
+    
+    if any(not query.strip() for query in request.queries):
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+    
+    validate_mode(request.mode, request.fusion)
+    validate_filters(request.filters)
+    
+    timings = {} if request.debug_timings else None
+    results = await run_blocking(
+        search_engine.search_many,
+        request.queries,
+        request.top_k,
+        nprobe=request.nprobe,
+        ef_search=request.ef_search,
+        mode=request.mode,
+        fusion=request.fusion,
+        alpha=request.alpha,
+        filters=request.filters,
+        timings=timings
+    )
+    
+    http_request.state.handler_seconds = time.perf_counter() - start
+    return {"results": results, "debug_timings": timings}
+
+@app.post("/search/page", response_model=PageResponse)
+async def search_page(request: PageRequest):
+    """First page for a query, or the next page of a cursor"""
+    if search_engine is None:
+        raise HTTPException(status_code=503, detail="Search engine not initialized")
+    
+    if request.cursor is None:
+        if not request.query or not request.query.strip():
+            raise HTTPException(status_code=400, detail="Query cannot be empty")
+        if request.depth > MAX_PAGINATION_DEPTH:
+            raise HTTPException(status_code=400, detail=f"depth must be at most {MAX_PAGINATION_DEPTH}")
+        validate_mode(request.mode, request.fusion)
+        validate_filters(request.filters)
+    
+    try:
+        return await run_blocking(
+            search_engine.search_page,
+            request.query,
+            request.page_size,
+            cursor=request.cursor,
+            depth=request.depth,
+            min_score=request.min_score,
+            nprobe=request.nprobe,
+            ef_search=request.ef_search,
+            mode=request.mode,
+            fusion=request.fusion,
+            alpha=request.alpha,
+            filters=request.filters
+        )
+    except CursorExpired as e:
+        raise HTTPException(status_code=410, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Counters, gauges and stage latency histograms in Prometheus text format"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/categories")
+async def categories():
+    """Document categories available as filters"""
+    if search_engine is None:
+        raise HTTPException(status_code=503, detail="Search engine not initialized")
+    
+    return {"categories": search_engine.metadata.values("category")}
+
+@app.get("/models")
+async def models():
+    """Active model, every cache namespace and the last re-embedding"""
+    if search_engine is None:
+        raise HTTPException(status_code=503, detail="Search engine not initialized")
+    
+    embedder = search_engine.embedder
+    return {
+        "active": {"model": embedder.model_name, "revision": embedder.model_revision, "dim": embedder.dimension},
+        "namespaces": await run_blocking(embedder.cache.namespaces),
+        "reembed": search_engine.reembed_status,
+    }
+
+@app.post("/models/reembed", status_code=202)
+async def reembed(request: ReembedRequest, authorization: Optional[str] = Header(None)):
+    """
+    Start re-embedding into the model's namespace; searches keep using the current model
+    Admin only: requires "Authorization: Bearer $SEARCH_ADMIN_TOKEN"
+    """
+    require_admin(authorization)
+    if search_engine is None:
+        raise HTTPException(status_code=503, detail="Search engine not initialized")
     
-    return {"results": results}
+    try:
+        status = await run_blocking(search_engine.reembed, request.model, request.revision, switch=request.switch)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"reembed": status}
 
 @app.get("/document/{doc_id}")
 async def get_document(doc_id: str):
@@ -63,7 +385,7 @@ async def get_document(doc_id: str):
     if search_engine is None:
         raise HTTPException(status_code=503, detail="Search engine not initialized")
     
-    text = search_engine.get_document(doc_id)
+    text = await run_blocking(search_engine.get_document, doc_id)
     
     if not text:
         raise HTTPException(status_code=404, detail="Document not found")
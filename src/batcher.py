@@ -0,0 +1,110 @@
+"""
+Dynamic micro-batching: coalesce concurrent single-item calls into one batch call
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List
+
+_STOP = object()
+
+class MicroBatcher:
+    def __init__(self, batch_fn: Callable[[List], List], max_batch_size: int = 32,
+                 max_wait_ms: float = 5.0):
+        """
+        batch_fn: maps a list of items to a same-length sequence of results
+        max_batch_size: flush as soon as this many items are waiting
+        max_wait_ms: longest the first item of a batch waits for company
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        self._closed = False
+        self._submit_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._loop, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, item) -> Future:
+        """
+        Queue an item, the future resolves with its result
+        After close() the item runs alone on the calling thread
+        """
+        future = Future()
+        with self._submit_lock:
+            if not self._closed:
+                self._queue.put((item, future))
+                return future
+        self._run([(item, future)])
+        return future
+
+    def __call__(self, item):
+        """Blocking single-item call"""
+        return self.submit(item).result()
+
+    def _loop(self):
+        """Collect items until the batch is full or the wait window closes"""
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+
+            batch = [first]
+            stop = False
+            deadline = time.monotonic() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if entry is _STOP:
+                    stop = True
+                    break
+                batch.append(entry)
+
+            self._run(batch)
+
+            if stop:
+                return
+
+    def _run(self, batch: List):
+        """Call batch_fn once and fan results back to the waiting futures"""
+        items = [item for item, _ in batch]
+
+        try:
+            outputs = self.batch_fn(items)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.items += len(items)
+
+        for (_, future), output in zip(batch, outputs):
+            future.set_result(output)
+
+    def stats(self) -> dict:
+        """Batch counters for monitoring"""
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "queued": self._queue.qsize(),
+        }
+
+    def close(self):
+        """Flush queued items and stop the worker thread"""
+        with self._submit_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join()
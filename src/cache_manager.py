@@ -2,101 +2,529 @@
 SQLite-based embedding cache
 """
 import sqlite3
+import threading
+import time
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Iterable, List, Optional, Tuple
 import numpy as np
 from datetime import datetime
+from .quantization import CACHE_DTYPES, encode_vector, decode_vector
+from .hashing import HASH_ALGORITHMS
+from .metrics import REGISTRY
+
+CACHE_LOOKUPS = REGISTRY.counter("embedding_cache_lookups_total", "Embedding cache lookups by table and result")
+CACHE_WRITES = REGISTRY.counter("embedding_cache_writes_total", "Rows written to the embedding cache by table")
+CACHE_SECONDS = REGISTRY.histogram("embedding_cache_seconds", "SQLite time per bulk cache operation")
+
+# Vector dimension of a stored embedding blob (see quantization.encode_vector)
+DIM_SQL = """CASE dtype WHEN 'float16' THEN length(embedding) / 2
+                        WHEN 'int8' THEN length(embedding) - 4
+                        ELSE length(embedding) / 4 END"""
 
 class CacheManager:
-    def __init__(self, cache_path: str = "data/cache/embeddings.db"):
-        """Initialize cache database"""
+    def __init__(self, cache_path: str = "data/cache/embeddings.db", dtype: str = "float32",
+                 hash_algo: str = "sha256", model: str = "sentence-transformers/all-MiniLM-L6-v2",
+                 revision: str = "", dim: int = 384):
+        """
+        Initialize cache database
+        Vectors are content-addressed by (namespace, hash algorithm, content
+        hash), so identical texts share one row; doc_hashes and passage_hashes
+        map documents and passages onto them
+        dtype: storage format for new rows (float32, float16 or int8);
+        every row records its own dtype, so mixed caches stay readable
+        hash_algo: algorithm of the content hashes looked up and written;
+        rows record theirs, lookups only match rows of the same algorithm
+        model, revision, dim: namespace of the vectors read and written;
+        several models' vectors live side by side in one file
+        """
+        if dtype not in CACHE_DTYPES:
+            raise ValueError(f"Unknown cache dtype '{dtype}', expected one of {CACHE_DTYPES}")
+        if hash_algo not in HASH_ALGORITHMS:
+            raise ValueError(f"Unknown hash algorithm '{hash_algo}', expected one of {HASH_ALGORITHMS}")
+        self.dtype = dtype
+        self.hash_algo = hash_algo
+        self.model = model
+        self.revision = revision
+        self.dim = dim
+        self.namespace = None  # Row id in namespaces, set by _init_db
         self.cache_path = Path(cache_path)
         self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        # One connection shared by all threads, serialized by the lock
+        self._conn = sqlite3.connect(self.cache_path, check_same_thread=False)
+        self._lock = threading.Lock()
         self._init_db()
-    
+
     def _init_db(self):
-        """Create cache table if not exists"""
-        conn = sqlite3.connect(self.cache_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS embeddings (
-                doc_id TEXT PRIMARY KEY,
-                embedding BLOB NOT NULL,
-                hash TEXT NOT NULL,
-                updated_at TEXT NOT NULL
-            )
+        """Create cache tables if not exists, migrating per-document caches"""
+        with self._lock:
+            cursor = self._conn.cursor()
+
+            # WAL lets readers run alongside the writer and makes commits cheap
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+
+            # One namespace per (model, revision, dimension)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS namespaces (
+                    id INTEGER PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    revision TEXT NOT NULL,
+                    dim INTEGER NOT NULL,
+                    created_at TEXT NOT NULL,
+                    UNIQUE (model, revision, dim)
+                )
+            """)
+
+            # Vectors keyed by model name only, before namespaces
+            if "model" in self._columns(cursor, "vectors"):
+                cursor.execute("ALTER TABLE vectors RENAME TO vectors_by_model")
+
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS vectors (
+                    namespace INTEGER NOT NULL,
+                    hash_algo TEXT NOT NULL,
+                    hash TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    dtype TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    PRIMARY KEY (namespace, hash_algo, hash)
+                )
+            """)
+
+            if "model" in self._columns(cursor, "vectors_by_model"):
+                self._copy_vectors(cursor, "vectors_by_model", "model")
+                cursor.execute("DROP TABLE vectors_by_model")
+
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS doc_hashes (
+                    doc_id TEXT PRIMARY KEY,
+                    hash TEXT NOT NULL,
+                    hash_algo TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+            """)
+
+            # Passages of chunked documents
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS passage_hashes (
+                    doc_id TEXT NOT NULL,
+                    chunk_no INTEGER NOT NULL,
+                    hash TEXT NOT NULL,
+                    hash_algo TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    PRIMARY KEY (doc_id, chunk_no)
+                )
+            """)
+
+            # Stat signature and content hash of every file read, so an
+            # unchanged file is recognized without reading it again
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    inode INTEGER NOT NULL,
+                    hash TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+            """)
+
+            # Caches created before pluggable hashing hold sha256 hashes
+            self._add_column(cursor, "files", "hash_algo", "TEXT NOT NULL DEFAULT 'sha256'")
+            self._migrate_keyed_by_doc(cursor, "embeddings", "doc_hashes", ("doc_id",))
+            self._migrate_keyed_by_doc(cursor, "passages", "passage_hashes", ("doc_id", "chunk_no"))
+
+            self.namespace = self._namespace_id(cursor, self.model, self.revision, self.dim)
+            self._conn.commit()
+
+    def _columns(self, cursor, table: str) -> set:
+        """Column names of a table, empty if it does not exist"""
+        cursor.execute(f"PRAGMA table_info({table})")
+        return {row[1] for row in cursor.fetchall()}
+
+    def _add_column(self, cursor, table: str, column: str, declaration: str):
+        """Add a column to an existing table if it is missing"""
+        if column not in self._columns(cursor, table):
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+    def _namespace_id(self, cursor, model: str, revision: str, dim: int) -> int:
+        """Row id of a namespace, created on first use"""
+        cursor.execute(
+            "INSERT OR IGNORE INTO namespaces (model, revision, dim, created_at) VALUES (?, ?, ?, ?)",
+            (model, revision, dim, datetime.now().isoformat())
+        )
+        cursor.execute(
+            "SELECT id FROM namespaces WHERE model = ? AND revision = ? AND dim = ?", (model, revision, dim)
+        )
+        return cursor.fetchone()[0]
+
+    def _copy_vectors(self, cursor, table: str, model_column: Optional[str] = None):
+        """
+        Copy vector rows of an older layout into vectors
+        Their revision is unknown (recorded as ""), the dimension is read off
+        each blob; without a model column rows go to this cache's model
+        """
+        model = model_column or "?"
+        params = [] if model_column else [self.model]
+        cursor.execute(f"SELECT DISTINCT {model}, {DIM_SQL} FROM {table}", params)
+        for row_model, dim in cursor.fetchall():
+            namespace = self._namespace_id(cursor, row_model, "", dim)
+            cursor.execute(f"""
+                INSERT OR IGNORE INTO vectors (namespace, hash_algo, hash, embedding, dtype, updated_at)
+                SELECT ?, hash_algo, hash, embedding, dtype, updated_at FROM {table}
+                WHERE {model} = ? AND {DIM_SQL} = ?
+            """, [namespace] + params + [row_model, dim])
+
+    def _migrate_keyed_by_doc(self, cursor, legacy: str, mapping: str, key: Tuple[str, ...]):
+        """
+        Move a legacy table of per-document vectors into vectors plus a mapping
+        Legacy rows carry no model and are attributed to this cache's model
+        (a vector of another dimension lands in a namespace of its own)
+        """
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (legacy,))
+        if cursor.fetchone() is None:
+            return
+
+        # Rows written before quantized storage or pluggable hashing
+        self._add_column(cursor, legacy, "dtype", "TEXT NOT NULL DEFAULT 'float32'")
+        self._add_column(cursor, legacy, "hash_algo", "TEXT NOT NULL DEFAULT 'sha256'")
+
+        columns = ", ".join(key)
+        self._copy_vectors(cursor, legacy)
+        cursor.execute(f"""
+            INSERT OR REPLACE INTO {mapping} ({columns}, hash, hash_algo, updated_at)
+            SELECT {columns}, hash, hash_algo, updated_at FROM {legacy}
         """)
-        
-        conn.commit()
-        conn.close()
-    
+        cursor.execute(f"DROP TABLE {legacy}")
+
+    def _get_vectors(self, cursor, hashes: List[str], chunk_size: int) -> Dict[str, np.ndarray]:
+        """{hash: embedding} of the given hashes present in this namespace for this algorithm"""
+        found = {}
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(hashes), chunk_size):
+            chunk = hashes[start:start + chunk_size]
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(
+                f"SELECT hash, embedding, dtype FROM vectors "
+                f"WHERE namespace = ? AND hash_algo = ? AND hash IN ({placeholders})",
+                [self.namespace, self.hash_algo] + chunk
+            )
+            for text_hash, stored_embedding, dtype in cursor.fetchall():
+                found[text_hash] = decode_vector(stored_embedding, dtype)
+        return found
+
+    def _get_mapped(self, cursor, mapping: str, doc_ids: List[str], chunk_size: int,
+                    other_algos: bool = False) -> List[tuple]:
+        """
+        Vectors reached through a mapping table for documents' current rows:
+        [(doc_id, chunk_no or None, hash_algo, hash, embedding)]; other_algos
+        only returns rows hashed with another algorithm than this cache's
+        """
+        chunk_column = "m.chunk_no" if mapping == "passage_hashes" else "NULL"
+        condition = "m.hash_algo != ?" if other_algos else "m.hash_algo = ?"
+        rows = []
+        for start in range(0, len(doc_ids), chunk_size):
+            chunk = doc_ids[start:start + chunk_size]
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(f"""
+                SELECT m.doc_id, {chunk_column}, m.hash_algo, m.hash, v.embedding, v.dtype
+                FROM {mapping} m JOIN vectors v
+                  ON v.namespace = ? AND v.hash_algo = m.hash_algo AND v.hash = m.hash
+                WHERE {condition} AND m.doc_id IN ({placeholders})
+            """, [self.namespace, self.hash_algo] + chunk)
+            for doc_id, chunk_no, hash_algo, text_hash, stored_embedding, dtype in cursor.fetchall():
+                rows.append((doc_id, chunk_no, hash_algo, text_hash, decode_vector(stored_embedding, dtype)))
+        return rows
+
     def get(self, doc_id: str, current_hash: str) -> Optional[np.ndarray]:
         """
         Get cached embedding if hash matches
         Returns None if not found or hash mismatch
         """
-        conn = sqlite3.connect(self.cache_path)
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            "SELECT embedding, hash FROM embeddings WHERE doc_id = ?",
-            (doc_id,)
-        )
-        
-        row = cursor.fetchone()
-        conn.close()
-        
-        if row is None:
-            return None
-        
-        stored_embedding, stored_hash = row
-        
-        # Check if hash matches
-        if stored_hash != current_hash:
-            return None
-        
-        # Deserialize
-        embedding = np.frombuffer(stored_embedding, dtype=np.float32)
-        return embedding
-    
+        return self.get_many([(doc_id, current_hash)]).get(doc_id)
+
+    def get_many(self, items: Iterable[Tuple[str, str]], chunk_size: int = 500,
+                 stale: Optional[dict] = None) -> Dict[str, np.ndarray]:
+        """
+        Bulk lookup of (doc_id, current_hash) pairs
+        Returns {doc_id: embedding} for entries whose content is cached,
+        under whatever doc_id it was first embedded; a hash of None takes the
+        document's last recorded content (e.g. reranking indexed vectors)
+        stale: receives {doc_id: (hash_algo, hash, embedding)} of documents
+        last hashed with another algorithm, for the caller to verify against
+        the text
+        """
+        wanted = dict(items)
+        results = {}
+        start = time.perf_counter()
+
+        with self._lock:
+            cursor = self._conn.cursor()
+            hashes = list({text_hash for text_hash in wanted.values() if text_hash is not None})
+            found = self._get_vectors(cursor, hashes, chunk_size)
+            for doc_id, text_hash in wanted.items():
+                if text_hash in found:
+                    results[doc_id] = found[text_hash]
+
+            unhashed = [doc_id for doc_id, text_hash in wanted.items() if text_hash is None]
+            for doc_id, _, _, _, embedding in self._get_mapped(cursor, "doc_hashes", unhashed, chunk_size):
+                results[doc_id] = embedding
+
+            missing = [doc_id for doc_id in wanted if doc_id not in results]
+            if stale is not None and missing:
+                for doc_id, _, hash_algo, text_hash, embedding in self._get_mapped(
+                        cursor, "doc_hashes", missing, chunk_size, other_algos=True):
+                    stale[doc_id] = (hash_algo, text_hash, embedding)
+
+        CACHE_SECONDS.observe(time.perf_counter() - start, op="get", table="embeddings")
+        CACHE_LOOKUPS.inc(len(results), table="embeddings", result="hit")
+        CACHE_LOOKUPS.inc(len(wanted) - len(results), table="embeddings", result="miss")
+        return results
+
     def set(self, doc_id: str, embedding: np.ndarray, text_hash: str):
         """Store embedding in cache"""
-        conn = sqlite3.connect(self.cache_path)
-        cursor = conn.cursor()
-        
-        # Serialize
-        embedding_blob = embedding.astype(np.float32).tobytes()
+        self.set_many([(doc_id, embedding, text_hash)])
+
+    def set_many(self, rows: Iterable[Tuple[str, Optional[np.ndarray], str]]):
+        """
+        Store many (doc_id, embedding, hash) rows in one transaction
+        An embedding of None only records the document's hash (content
+        already cached under another doc_id)
+        """
+        rows = list(rows)
+        start = time.perf_counter()
+        with self._lock, self._conn:
+            written = self._put_vectors((text_hash, embedding) for _, embedding, text_hash in rows)
+            self._map(
+                "doc_hashes", ("doc_id",), ((doc_id, text_hash) for doc_id, _, text_hash in rows)
+            )
+        CACHE_SECONDS.observe(time.perf_counter() - start, op="set", table="embeddings")
+        CACHE_WRITES.inc(written, table="embeddings")
+
+    def _put_vectors(self, rows: Iterable[Tuple[str, Optional[np.ndarray]]]) -> int:
+        """Write (hash, embedding) rows once per distinct hash, returns rows written"""
         timestamp = datetime.now().isoformat()
-        
-        cursor.execute("""
-            INSERT OR REPLACE INTO embeddings (doc_id, embedding, hash, updated_at)
-            VALUES (?, ?, ?, ?)
-        """, (doc_id, embedding_blob, text_hash, timestamp))
-        
-        conn.commit()
-        conn.close()
-    
+        vectors = {text_hash: embedding for text_hash, embedding in rows if embedding is not None}
+        for embedding in vectors.values():
+            if len(embedding) != self.dim:
+                raise ValueError(f"Embedding of dimension {len(embedding)} does not fit namespace "
+                                 f"'{self.model}' ({self.dim} dimensions)")
+        params = [
+            (self.namespace, self.hash_algo, text_hash, encode_vector(embedding, self.dtype), self.dtype,
+             timestamp)
+            for text_hash, embedding in vectors.items()
+        ]
+        self._conn.executemany("""
+            INSERT OR REPLACE INTO vectors (namespace, hash_algo, hash, embedding, dtype, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, params)
+        return len(params)
+
+    def _map(self, mapping: str, key: Tuple[str, ...], rows: Iterable[tuple]):
+        """Point (key..., hash) rows of a mapping table at their content, skipping unchanged ones"""
+        timestamp = datetime.now().isoformat()
+        columns = ", ".join(key)
+        self._conn.executemany(f"""
+            INSERT INTO {mapping} ({columns}, hash, hash_algo, updated_at)
+            VALUES ({", ".join("?" * len(key))}, ?, ?, ?)
+            ON CONFLICT ({columns}) DO UPDATE SET
+                hash = excluded.hash, hash_algo = excluded.hash_algo, updated_at = excluded.updated_at
+            WHERE hash != excluded.hash OR hash_algo != excluded.hash_algo
+        """, [row + (self.hash_algo, timestamp) for row in rows])
+
+    def get_passages_many(self, items: Iterable[Tuple[str, int, str]], chunk_size: int = 500,
+                          stale: Optional[dict] = None) -> Dict[Tuple[str, int], np.ndarray]:
+        """
+        Bulk lookup of (doc_id, chunk_no, passage_hash) triples
+        Returns {(doc_id, chunk_no): embedding} for entries whose content is
+        cached, a hash of None takes the passage's last recorded content
+        stale: as in get_many, keyed by (doc_id, chunk_no)
+        """
+        wanted = {(doc_id, chunk_no): text_hash for doc_id, chunk_no, text_hash in items}
+        results = {}
+        start = time.perf_counter()
+
+        with self._lock:
+            cursor = self._conn.cursor()
+            hashes = list({text_hash for text_hash in wanted.values() if text_hash is not None})
+            found = self._get_vectors(cursor, hashes, chunk_size)
+            for key, text_hash in wanted.items():
+                if text_hash in found:
+                    results[key] = found[text_hash]
+
+            unhashed = list({doc_id for (doc_id, _), text_hash in wanted.items() if text_hash is None})
+            for doc_id, chunk_no, _, _, embedding in self._get_mapped(
+                    cursor, "passage_hashes", unhashed, chunk_size):
+                if wanted.get((doc_id, chunk_no), "") is None:
+                    results[(doc_id, chunk_no)] = embedding
+
+            missing = list({doc_id for doc_id, chunk_no in wanted if (doc_id, chunk_no) not in results})
+            if stale is not None and missing:
+                for doc_id, chunk_no, hash_algo, text_hash, embedding in self._get_mapped(
+                        cursor, "passage_hashes", missing, chunk_size, other_algos=True):
+                    key = (doc_id, chunk_no)
+                    if key in wanted and key not in results:
+                        stale[key] = (hash_algo, text_hash, embedding)
+
+        CACHE_SECONDS.observe(time.perf_counter() - start, op="get", table="passages")
+        CACHE_LOOKUPS.inc(len(results), table="passages", result="hit")
+        CACHE_LOOKUPS.inc(len(wanted) - len(results), table="passages", result="miss")
+        return results
+
+    def set_passages_many(self, rows: Iterable[Tuple[str, int, Optional[np.ndarray], str]],
+                          counts: Optional[Dict[str, int]] = None):
+        """
+        Store many (doc_id, chunk_no, embedding, passage_hash) rows in one transaction
+        An embedding of None only records the passage's hash
+        counts: {doc_id: passages} drops leftover passages of documents that shrank
+        """
+        rows = list(rows)
+        start = time.perf_counter()
+        with self._lock, self._conn:
+            written = self._put_vectors((text_hash, embedding) for _, _, embedding, text_hash in rows)
+            self._map(
+                "passage_hashes", ("doc_id", "chunk_no"),
+                ((doc_id, chunk_no, text_hash) for doc_id, chunk_no, _, text_hash in rows)
+            )
+            if counts:
+                self._conn.executemany(
+                    "DELETE FROM passage_hashes WHERE doc_id = ? AND chunk_no >= ?",
+                    list(counts.items())
+                )
+        CACHE_SECONDS.observe(time.perf_counter() - start, op="set", table="passages")
+        CACHE_WRITES.inc(written, table="passages")
+
+    def get_file_hashes(self, stats: Dict[str, Tuple[int, int, int]],
+                        chunk_size: int = 500) -> Dict[str, str]:
+        """
+        Bulk manifest lookup of {path: (size, mtime_ns, inode)}
+        Returns {path: hash} for files whose stat signature is unchanged
+        and whose hash was taken with this cache's algorithm
+        """
+        paths = list(stats)
+        results = {}
+
+        with self._lock:
+            cursor = self._conn.cursor()
+            for start in range(0, len(paths), chunk_size):
+                chunk = paths[start:start + chunk_size]
+                placeholders = ",".join("?" * len(chunk))
+                cursor.execute(
+                    f"SELECT path, size, mtime_ns, inode, hash FROM files "
+                    f"WHERE hash_algo = ? AND path IN ({placeholders})",
+                    [self.hash_algo] + chunk
+                )
+                for path, size, mtime_ns, inode, text_hash in cursor.fetchall():
+                    if stats[path] == (size, mtime_ns, inode):
+                        results[path] = text_hash
+
+        CACHE_LOOKUPS.inc(len(results), table="files", result="hit")
+        CACHE_LOOKUPS.inc(len(paths) - len(results), table="files", result="miss")
+        return results
+
+    def set_file_hashes(self, rows: Iterable[Tuple[str, int, int, int, str]]):
+        """Record many (path, size, mtime_ns, inode, hash) rows in one transaction"""
+        timestamp = datetime.now().isoformat()
+        params = [row + (timestamp, self.hash_algo) for row in rows]
+
+        with self._lock, self._conn:
+            self._conn.executemany("""
+                INSERT OR REPLACE INTO files (path, size, mtime_ns, inode, hash, updated_at, hash_algo)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, params)
+        CACHE_WRITES.inc(len(params), table="files")
+
     def get_all(self) -> dict:
-        """Get all cached embeddings"""
-        conn = sqlite3.connect(self.cache_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT doc_id, embedding FROM embeddings")
-        rows = cursor.fetchall()
-        conn.close()
-        
+        """Get all cached document embeddings of this namespace"""
+        with self._lock:
+            cursor = self._conn.cursor()
+            cursor.execute("""
+                SELECT d.doc_id, v.embedding, v.dtype
+                FROM doc_hashes d JOIN vectors v
+                  ON v.namespace = ? AND v.hash_algo = d.hash_algo AND v.hash = d.hash
+            """, (self.namespace,))
+            rows = cursor.fetchall()
+
         results = {}
-        for doc_id, embedding_blob in rows:
-            embedding = np.frombuffer(embedding_blob, dtype=np.float32)
+        for doc_id, embedding_blob, dtype in rows:
+            embedding = decode_vector(embedding_blob, dtype)
             results[doc_id] = embedding
-        
+
         return results
-    
+
+    def namespaces(self) -> List[dict]:
+        """Every namespace in the file with its vector count"""
+        with self._lock:
+            cursor = self._conn.cursor()
+            cursor.execute("""
+                SELECT n.model, n.revision, n.dim, n.created_at, COUNT(v.hash)
+                FROM namespaces n LEFT JOIN vectors v ON v.namespace = n.id
+                GROUP BY n.id ORDER BY n.id
+            """)
+            rows = cursor.fetchall()
+
+        return [
+            {"model": model, "revision": revision, "dim": dim, "created_at": created_at, "vectors": count,
+             "active": (model, revision, dim) == (self.model, self.revision, self.dim)}
+            for model, revision, dim, created_at, count in rows
+        ]
+
+    def drop_namespace(self, model: str, revision: str = "", dim: Optional[int] = None) -> int:
+        """
+        Delete another model's vectors (every dimension when dim is None)
+        Returns vectors deleted; the active namespace cannot be dropped
+        """
+        if model == self.model and revision == self.revision and dim in (None, self.dim):
+            raise ValueError("Cannot drop the namespace in use")
+
+        query = "SELECT id FROM namespaces WHERE model = ? AND revision = ?"
+        params = [model, revision]
+        if dim is not None:
+            query += " AND dim = ?"
+            params.append(dim)
+
+        deleted = 0
+        with self._lock, self._conn:
+            ids = [row[0] for row in self._conn.execute(query, params).fetchall()]
+            for namespace in ids:
+                deleted += self._conn.execute("DELETE FROM vectors WHERE namespace = ?", (namespace,)).rowcount
+                self._conn.execute("DELETE FROM namespaces WHERE id = ?", (namespace,))
+        return deleted
+
+    def prune(self, keep_doc_ids: Optional[Iterable[str]] = None) -> int:
+        """
+        Delete vectors no document or passage points at any more, returns rows deleted
+        keep_doc_ids: first forget the documents and passages of every other
+        doc_id (documents gone from the corpus)
+        """
+        with self._lock, self._conn:
+            if keep_doc_ids is not None:
+                self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS keep_docs (doc_id TEXT PRIMARY KEY)")
+                self._conn.execute("DELETE FROM keep_docs")
+                self._conn.executemany("INSERT OR IGNORE INTO keep_docs VALUES (?)",
+                                       ((doc_id,) for doc_id in keep_doc_ids))
+                for mapping in ("doc_hashes", "passage_hashes"):
+                    self._conn.execute(f"DELETE FROM {mapping} WHERE doc_id NOT IN (SELECT doc_id FROM keep_docs)")
+                self._conn.execute("DELETE FROM keep_docs")
+
+            # The subquery is materialized once, the mappings have no index on hash
+            cursor = self._conn.execute("""
+                DELETE FROM vectors WHERE (hash_algo, hash) NOT IN (
+                    SELECT hash_algo, hash FROM doc_hashes
+                    UNION SELECT hash_algo, hash FROM passage_hashes
+                )
+            """)
+            return cursor.rowcount
+
     def clear(self):
         """Clear all cache"""
-        conn = sqlite3.connect(self.cache_path)
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM embeddings")
-        conn.commit()
-        conn.close()
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM vectors")
+            self._conn.execute("DELETE FROM doc_hashes")
+            self._conn.execute("DELETE FROM passage_hashes")
+            self._conn.execute("DELETE FROM files")
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,33 @@
+"""
+Split documents into overlapping word-window passages
+"""
+import re
+import numpy as np
+
+_WORD = re.compile(r'\S+')
+
+# FAISS ids of passages pack (document number, passage number) into one int64
+CHUNK_BITS = 16
+MAX_PASSAGES = 1 << CHUNK_BITS
+
+def passage_spans(text: str, window: int = 200, stride: int = 150) -> np.ndarray:
+    """
+    Character spans of passages of `window` words, starting every `stride` words
+    The default window stays under all-MiniLM-L6-v2's 256 word-piece limit
+    Returns an (n, 2) int64 array of [start, end) offsets, at least one row
+    """
+    if stride <= 0 or window <= 0:
+        raise ValueError("window and stride must be positive")
+
+    words = [match.span() for match in _WORD.finditer(text)]
+    if not words:
+        return np.zeros((1, 2), dtype=np.int64)
+
+    spans = []
+    for start in range(0, len(words), stride):
+        end = min(start + window, len(words))
+        spans.append((words[start][0], words[end - 1][1]))
+        if end == len(words) or len(spans) == MAX_PASSAGES:
+            break
+
+    return np.array(spans, dtype=np.int64)
@@ -0,0 +1,331 @@
+"""
+Memory-mapped document store: one packed data file plus an offset table
+"""
+import mmap
+import os
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Tuple
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Not on POSIX: no cross-process writer lock
+    fcntl = None
+
+COMPRESSION = (None, "zlib", "zstd", "lz4")
+
+def _codec(name: Optional[str]):
+    """(compress, decompress) functions for a per-record compression codec"""
+    if name is None:
+        return bytes, bytes
+
+    if name == "zlib":
+        import zlib
+        return zlib.compress, zlib.decompress
+
+    if name == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("zstd compression requires: pip install zstandard")
+        return zstandard.ZstdCompressor().compress, zstandard.ZstdDecompressor().decompress
+
+    if name == "lz4":
+        try:
+            import lz4.frame
+        except ImportError:
+            raise ImportError("lz4 compression requires: pip install lz4")
+        return lz4.frame.compress, lz4.frame.decompress
+
+    raise ValueError(f"Unknown compression '{name}', expected one of {COMPRESSION}")
+
+class StoreLocked(RuntimeError):
+    """Another process holds the store's writer lock"""
+
+class DocumentStore:
+    def __init__(self, store_dir: str = "data/cache/index/docstore", compression: Optional[str] = None):
+        """
+        Open (or create) a store in store_dir
+        Records are appended to docs.dat and located through the offset
+        table in docs.idx.npz; reads go through a shared read-only mmap so
+        resident memory does not grow with corpus size
+        Any number of processes may read one store; the first to write takes
+        the writer lock (docs.lock) until release() or close(), writes from
+        the others raise StoreLocked (acquire() can wait for it instead).
+        Taking the lock re-reads the table, which another writer may have
+        changed. clear() and compact() swap in a new data file, so other
+        processes keep reading their mapping of the old one
+        compression: None, "zlib", "zstd" or "lz4", applied per record
+        """
+        self.store_dir = Path(store_dir)
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        self.data_path = self.store_dir / "docs.dat"
+        self.table_path = self.store_dir / "docs.idx.npz"
+        self.lock_path = self.store_dir / "docs.lock"
+
+        self.slots = {}  # doc_id -> row in offsets/lengths
+        self.offsets = array('q')
+        self.lengths = array('q')
+        # Existing stores keep their codec until clear() starts them over
+        self.requested_compression = compression
+        self.compression = compression
+        self._lock = threading.RLock()
+        self._mmap = None
+        self._writer = None
+        self._lock_file = None
+
+        if self.table_path.exists() and self.data_path.exists():
+            self._load_table()  # Opens empty if the table does not fit the data file
+        else:
+            try:
+                self.clear()
+                self.release()
+            except StoreLocked:
+                pass  # Being created by another process: empty until reopened
+
+        self._compress, self._decompress = _codec(self.compression)
+
+    def acquire(self, timeout: float = 0):
+        """
+        Take the writer lock now, waiting up to timeout seconds for another
+        process to release it; raises StoreLocked after that
+        """
+        with self._lock:
+            self._acquire_writer(timeout)
+
+    def release(self):
+        """Flush and give up the writer lock; reads keep working"""
+        with self._lock:
+            if self._writer is not None:
+                self.flush()
+                self._writer.close()
+                self._writer = None
+            if self._lock_file is not None:
+                self._lock_file.close()  # Releases the flock
+                self._lock_file = None
+
+    def _acquire_writer(self, timeout: float = 0):
+        """Take the cross-process writer lock and open the data file for appending"""
+        if self._writer is not None:
+            return
+        if fcntl is not None and self._lock_file is None:
+            lock_file = open(self.lock_path, 'a')
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except OSError:
+                    if time.monotonic() >= deadline:
+                        lock_file.close()
+                        raise StoreLocked(f"Document store {self.store_dir} is being written by another process")
+                    time.sleep(0.1)
+            self._lock_file = lock_file
+            self._reload()
+        self._writer = open(self.data_path, 'ab')
+
+    def _reload(self):
+        """Re-read the table and remap the data file, both possibly rewritten by the previous writer"""
+        self.slots = {}
+        self.offsets = array('q')
+        self.lengths = array('q')
+        self.compression = self.requested_compression
+        if self.table_path.exists() and self.data_path.exists():
+            self._load_table()
+        self._compress, self._decompress = _codec(self.compression)
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def _load_table(self) -> bool:
+        """
+        Read the offset table written by flush()
+        A table pointing past the end of the data file (left behind by a
+        crash) is rejected: the store stays empty and False is returned
+        """
+        with np.load(self.table_path) as table:
+            offsets, lengths = table["offsets"], table["lengths"]
+            doc_ids = bytes(table["doc_ids"]).decode('utf-8').split("\n") if len(offsets) else []
+            compression = str(table["compression"]) or None
+
+        live = lengths >= 0
+        if len(offsets) and int((offsets + lengths)[live].max(initial=0)) > self.data_path.stat().st_size:
+            return False
+
+        self.offsets = array('q', offsets.tolist())
+        self.lengths = array('q', lengths.tolist())
+        self.compression = compression
+        self.slots = {doc_id: slot for slot, doc_id in enumerate(doc_ids) if self.lengths[slot] >= 0}
+        return True
+
+    def put(self, doc_id: str, text: str):
+        """Append a document; an existing record for doc_id becomes dead space"""
+        self.put_many([(doc_id, text)])
+
+    def put_many(self, items: Iterable[Tuple[str, str]]):
+        """Append many documents with one write per record"""
+        with self._lock:
+            self._acquire_writer()
+            for doc_id, text in items:
+                record = self._compress(text.encode('utf-8'))
+                offset = self._writer.tell()
+                self._writer.write(record)
+
+                slot = self.slots.get(doc_id)
+                if slot is None:
+                    self.slots[doc_id] = len(self.offsets)
+                    self.offsets.append(offset)
+                    self.lengths.append(len(record))
+                else:
+                    self.offsets[slot] = offset
+                    self.lengths[slot] = len(record)
+
+    def get(self, doc_id: str) -> Optional[str]:
+        """Document text, None if unknown"""
+        with self._lock:
+            slot = self.slots.get(doc_id)
+            if slot is None:
+                return None
+            offset, length = self.offsets[slot], self.lengths[slot]
+            if length == 0:
+                return ""
+            view = self._view(offset + length)
+            record = view[offset:offset + length]
+        return self._decompress(record).decode('utf-8')
+
+    def _view(self, needed: int) -> mmap.mmap:
+        """Read-only mapping of the data file covering at least needed bytes"""
+        if self._mmap is None or len(self._mmap) < needed:
+            if self._writer is not None:
+                self._writer.flush()
+            if self._mmap is not None:
+                self._mmap.close()
+            with open(self.data_path, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def remove(self, doc_id: str):
+        """Forget a document; its bytes stay until compact()"""
+        with self._lock:
+            self._acquire_writer()
+            slot = self.slots.pop(doc_id, None)
+            if slot is not None:
+                self.lengths[slot] = -1
+
+    def items(self) -> Iterator[Tuple[str, str]]:
+        """Iterate (doc_id, text) over live documents"""
+        for doc_id in list(self.slots):
+            text = self.get(doc_id)
+            if text is not None:
+                yield doc_id, text
+
+    def dead_space(self) -> float:
+        """Share of the data file held by removed or overwritten records"""
+        with self._lock:
+            if self._writer is not None:
+                self._writer.flush()
+            size = self.data_path.stat().st_size
+            if not size:
+                return 0.0
+            lengths = np.frombuffer(self.lengths, dtype=np.int64)
+            live = int(lengths[lengths > 0].sum())
+            return 1 - live / size
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.slots
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def flush(self):
+        """Sync data and atomically write the offset table"""
+        with self._lock:
+            self._acquire_writer()
+            self._writer.flush()
+            os.fsync(self._writer.fileno())
+
+            doc_ids = [None] * len(self.offsets)
+            for doc_id, slot in self.slots.items():
+                doc_ids[slot] = doc_id
+            lengths = array('q', self.lengths)
+            for slot, doc_id in enumerate(doc_ids):
+                if doc_id is None:
+                    doc_ids[slot] = ""
+                    lengths[slot] = -1
+
+            tmp_table = self.table_path.with_suffix(".tmp.npz")
+            np.savez(
+                tmp_table,
+                doc_ids=np.frombuffer("\n".join(doc_ids).encode('utf-8'), dtype=np.uint8),
+                offsets=np.array(self.offsets, dtype=np.int64),
+                lengths=np.array(lengths, dtype=np.int64),
+                compression=np.array(self.compression or "")
+            )
+            os.replace(tmp_table, self.table_path)
+
+    def clear(self):
+        """
+        Drop all documents, starting a new empty data file
+        The empty offset table is written first, so a crash in between
+        leaves an empty store rather than a table pointing into nothing.
+        The old file is replaced, not truncated: a process that has it
+        memory-mapped would crash (SIGBUS) reading past a truncated end
+        """
+        with self._lock:
+            self._acquire_writer()
+            self.slots = {}
+            self.offsets = array('q')
+            self.lengths = array('q')
+            self.compression = self.requested_compression
+            self._compress, self._decompress = _codec(self.compression)
+            self.flush()
+
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
+            self._writer.close()
+            tmp_data = self.data_path.with_suffix(".dat.tmp")
+            with open(tmp_data, 'wb'):
+                pass
+            os.replace(tmp_data, self.data_path)
+            self._writer = open(self.data_path, 'ab')
+
+    def compact(self):
+        """Rewrite the data file without dead records, streaming record by record"""
+        with self._lock:
+            self._acquire_writer()
+            self._writer.flush()
+            tmp_data = self.data_path.with_suffix(".dat.tmp")
+            slots = {}
+            offsets = array('q')
+            lengths = array('q')
+            view = self._view(self._writer.tell()) if self._writer.tell() else b""
+
+            with open(tmp_data, 'wb') as out:
+                for doc_id, slot in self.slots.items():
+                    offset, length = self.offsets[slot], self.lengths[slot]
+                    slots[doc_id] = len(offsets)
+                    offsets.append(out.tell())
+                    lengths.append(length)
+                    out.write(view[offset:offset + length])
+
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
+            self._writer.close()
+            os.replace(tmp_data, self.data_path)
+            self._writer = open(self.data_path, 'ab')
+
+            self.slots, self.offsets, self.lengths = slots, offsets, lengths
+            self.flush()
+
+    def close(self):
+        """Flush (when this process wrote) and release file handles and the writer lock"""
+        with self._lock:
+            self.release()
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
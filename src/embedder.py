@@ -1,72 +1,478 @@
 """
 Embedding generation with caching
 """
-import hashlib
+import argparse
+import os
+import time
+from itertools import islice
 from pathlib import Path
-from typing import List, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple, Union
 import numpy as np
 from sentence_transformers import SentenceTransformer
 from .cache_manager import CacheManager
+from .batcher import MicroBatcher
+from .query_cache import LRUCache, normalize_query
+from .chunker import passage_spans
+from .quantization import CACHE_DTYPES
+from .hashing import ContentHasher, HASH_ALGORITHMS
+from .metrics import REGISTRY
+
+TEXTS_EMBEDDED = REGISTRY.counter("embedder_texts_encoded_total", "Texts run through the model by kind")
+ENCODE_SECONDS = REGISTRY.histogram("embedder_encode_seconds", "model.encode time per call by kind")
+
+def read_document_bytes(doc_path: Path) -> Tuple[str, bytes, os.stat_result]:
+    """
+    (doc_id, UTF-8 content, stat) of one file, read with a single read call
+    stat is taken from the open file, before reading
+    Newlines are translated like text-mode open() so hashes stay comparable
+    """
+    with open(doc_path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        data = f.read()
+    return Path(doc_path).stem, data.replace(b'\r\n', b'\n').replace(b'\r', b'\n'), stat
+
+def read_document(doc_path: Path) -> Tuple[str, str, os.stat_result]:
+    """(doc_id, text, stat) of one file"""
+    doc_id, data, stat = read_document_bytes(doc_path)
+    return doc_id, data.decode('utf-8'), stat
+
+def stat_signature(stat: os.stat_result) -> Tuple[int, int, int]:
+    """(size, mtime_ns, inode): a file with the same signature is assumed unchanged"""
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 
 class EmbeddingGenerator:
-    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
-        """Initialize embedding model"""
+    def __init__(self, model_name: str = DEFAULT_MODEL, model_revision: Optional[str] = None,
+                 query_cache_size: int = 10000, query_cache_bytes: Optional[int] = 64 * 1024 * 1024,
+                 query_cache_ttl: Optional[float] = 3600, cache_dtype: str = "float32",
+                 cache_path: str = "data/cache/embeddings.db", hash_algo: Optional[str] = None):
+        """
+        Initialize embedding model
+        model_revision: pinned model revision (branch, tag or commit);
+        cached vectors are namespaced by model, revision and dimension
+        query_cache_*: bounds of the in-memory query embedding cache (size 0 disables)
+        cache_dtype: float32, float16 or int8 storage in the embedding cache
+        cache_path: SQLite file of the embedding cache
+        hash_algo: content hash (xxh3_128, blake3 or sha256), None picks the
+        fastest installed; cached rows of another algorithm are re-verified
+        """
         print(f"Loading model: {model_name}...")
-        self.model = SentenceTransformer(model_name)
-        self.cache = CacheManager()
+        self.model_name = model_name
+        self.model_revision = model_revision or ""
+        self.model = SentenceTransformer(model_name, revision=model_revision)
+        self.dimension = self.model.get_sentence_embedding_dimension()
+        self.hasher = ContentHasher(hash_algo)
+        self._legacy_hashers = {}
+        self.cache = CacheManager(
+            cache_path, dtype=cache_dtype, hash_algo=self.hasher.algorithm,
+            model=model_name, revision=self.model_revision, dim=self.dimension
+        )
+        self.batcher = None
+        self.query_cache = None
+        self.last_throughput = None
+        if query_cache_size > 0:
+            self.query_cache = LRUCache(
+                max_entries=query_cache_size,
+                max_bytes=query_cache_bytes,
+                ttl_seconds=query_cache_ttl,
+                sizeof=lambda embedding: embedding.nbytes
+            )
         
-    def compute_hash(self, text: str) -> str:
-        """Compute SHA256 hash of text"""
-        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+    def compute_hash(self, content: Union[str, bytes]) -> str:
+        """Content hash of a text or its UTF-8 bytes, with the configured algorithm"""
+        return self.hasher(content)
+    
+    def enable_batching(self, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        """
+        Coalesce concurrent embed_text calls into shared encode batches
+        Worth it when many threads embed queries at once (API workers)
+        """
+        if self.batcher is not None:
+            self.batcher.close()
+        self.batcher = MicroBatcher(self._encode, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
     
     def embed_text(self, text: str) -> np.ndarray:
-        """Generate embedding for single text"""
-        embedding = self.model.encode(text, convert_to_numpy=True)
-        # Normalize for cosine similarity
-        embedding = embedding / np.linalg.norm(embedding)
+        """Generate embedding for single text (served from the query cache when possible)"""
+        key = normalize_query(text)
+        if self.query_cache is not None:
+            cached = self.query_cache.get(key)
+            if cached is not None:
+                return cached
+        
+        if self.batcher is not None:
+            embedding = self.batcher(text)
+        else:
+            embedding = self._encode([text])[0]
+        
+        if self.query_cache is not None:
+            self.query_cache.set(key, embedding)
         return embedding
     
-    def embed_documents(self, doc_paths: List[Path], force_recompute: bool = False) -> dict:
+    def embed_texts(self, texts: List[str]) -> np.ndarray:
+        """Generate normalized embeddings for many texts, encoding cache misses in one call"""
+        if self.query_cache is None:
+            return self._encode(texts)
+        
+        keys = [normalize_query(text) for text in texts]
+        embeddings = [self.query_cache.get(key) for key in keys]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        
+        if missing:
+            encoded = self._encode([texts[i] for i in missing])
+            for i, embedding in zip(missing, encoded):
+                embeddings[i] = embedding
+                self.query_cache.set(keys[i], embedding)
+        
+        return np.vstack(embeddings)
+    
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        """One model.encode call, normalized for cosine similarity"""
+        start = time.perf_counter()
+        embeddings = self.model.encode(texts, convert_to_numpy=True)
+        ENCODE_SECONDS.observe(time.perf_counter() - start, kind="query")
+        TEXTS_EMBEDDED.inc(len(texts), kind="query")
+        return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    
+    def read_documents(self, doc_paths: Iterable[Path], chunk_size: int = 1000, num_readers: int = 1,
+                       skip_unchanged: bool = False) -> Iterator[Tuple[str, Optional[str], str]]:
         """
-        Embed all documents with caching
-        Returns: {doc_id: embedding}
+        Read and hash each file at most once, yielding (doc_id, text, hash) in
+        input order; hashes are recorded in the cache's file manifest
+        skip_unchanged: files whose (size, mtime_ns, inode) match the manifest
+        are not read at all and come back as (doc_id, None, recorded hash)
+        num_readers > 1 reads on a thread pool, one chunk ahead of the consumer,
+        so file I/O overlaps with encoding
         """
-        results = {}
-        to_embed = []
+        doc_paths = iter(doc_paths)
+        readers = None
+        if num_readers > 1:
+            readers = ThreadPoolExecutor(max_workers=num_readers, thread_name_prefix="reader")
+
+        try:
+            pending = []
+            while True:
+                chunk_paths = list(islice(doc_paths, chunk_size))
+                ahead = self._start_reads(chunk_paths, readers, skip_unchanged)
+                yield from self._finish_reads(pending)
+                if not ahead:
+                    break
+                pending = ahead
+        finally:
+            if readers is not None:
+                readers.shutdown()
+
+    def _start_reads(self, chunk_paths: List[Path], readers, skip_unchanged: bool) -> list:
+        """Per file: a finished (doc_id, None, hash) when unchanged, else a pending read"""
+        known = {}
+        if skip_unchanged and chunk_paths:
+            stats = {}
+            for doc_path in chunk_paths:
+                try:
+                    stats[str(doc_path)] = stat_signature(os.stat(doc_path))
+                except OSError:
+                    continue  # Reported when the read fails
+            known = self.cache.get_file_hashes(stats)
+
+        entries = []
+        for doc_path in chunk_paths:
+            text_hash = known.get(str(doc_path))
+            if text_hash is not None:
+                entries.append((Path(doc_path).stem, None, text_hash))
+            elif readers is not None:
+                entries.append((doc_path, readers.submit(self._read_and_hash, doc_path)))
+            else:
+                entries.append((doc_path, self._read_and_hash(doc_path)))
+        return entries
+
+    def _finish_reads(self, entries: list) -> List[Tuple[str, Optional[str], str]]:
+        """Resolve a chunk from _start_reads and record new hashes in the manifest"""
+        documents = []
+        manifest = []
+        for entry in entries:
+            if len(entry) == 3:
+                documents.append(entry)
+                continue
+            doc_path, result = entry
+            if isinstance(result, Future):
+                result = result.result()
+            doc_id, text, text_hash, stat = result
+            documents.append((doc_id, text, text_hash))
+            manifest.append((str(doc_path),) + stat_signature(stat) + (text_hash,))
+
+        if manifest:
+            self.cache.set_file_hashes(manifest)
+        return documents
+
+    def _read_and_hash(self, doc_path: Path) -> Tuple[str, str, str, os.stat_result]:
+        """(doc_id, text, hash, stat) of one file, hashed from the bytes read"""
+        doc_id, data, stat = read_document_bytes(doc_path)
+        return doc_id, data.decode('utf-8'), self.compute_hash(data), stat
+
+    def _adopt_stale(self, stale: dict, text_of: Callable[[object], str]) -> List[tuple]:
+        """
+        Cached rows hashed with another algorithm whose text still matches
+        Returns [(key, embedding)] to use and re-record under the current hash
+        """
+        adopted = []
+        for key, (hash_algo, stored_hash, embedding) in stale.items():
+            hasher = self._legacy_hashers.get(hash_algo)
+            if hasher is None:
+                try:
+                    hasher = self._legacy_hashers[hash_algo] = ContentHasher(hash_algo)
+                except (ImportError, ValueError):
+                    continue
+            if hasher(text_of(key)) == stored_hash:
+                adopted.append((key, embedding))
+        return adopted
+
+    def iter_embeddings(self, doc_paths: Iterable[Path], chunk_size: int = 1000,
+                        force_recompute: bool = False, num_workers: int = 1,
+                        batch_size: int = 32, window: Optional[int] = None,
+                        stride: Optional[int] = None, num_readers: int = 1,
+                        on_document: Optional[Callable[[str, str], None]] = None,
+                        skip_unchanged: bool = False) -> Iterator[List[tuple]]:
+        """
+        Streaming pipeline: read, hash, look up, encode and cache documents
+        chunk_size at a time, so memory stays flat regardless of corpus size
+        num_workers > 1 shards each chunk's encoding across worker processes
+        Yields one list per chunk of (doc_id, hash, embedding) rows, or with
+        window set, (doc_id, hash, passage spans, passage embeddings) rows
+        Each file is read once; on_document(doc_id, text) gets the same text
+        (e.g. to fill a document store and keyword statistics)
+        skip_unchanged: files unchanged since they were last hashed are only
+        read if their embedding is missing from the cache (and, being unread,
+        are not passed to on_document)
+        """
+        doc_paths = list(doc_paths)
+        paths = {Path(doc_path).stem: doc_path for doc_path in doc_paths}
+        documents = self.read_documents(doc_paths, chunk_size, num_readers, skip_unchanged)
+        return self.iter_text_embeddings(
+            documents, chunk_size=chunk_size, force_recompute=force_recompute, num_workers=num_workers,
+            batch_size=batch_size, window=window, stride=stride, on_document=on_document,
+            load_text=lambda doc_id: read_document(paths[doc_id])[1]
+        )
+
+    def iter_text_embeddings(self, documents: Iterable[tuple], chunk_size: int = 1000,
+                             force_recompute: bool = False, num_workers: int = 1,
+                             batch_size: int = 32, window: Optional[int] = None,
+                             stride: Optional[int] = None,
+                             on_document: Optional[Callable[[str, str], None]] = None,
+                             load_text: Optional[Callable[[str], str]] = None) -> Iterator[List[tuple]]:
+        """
+        iter_embeddings over (doc_id, text) or (doc_id, text, hash) documents
+        A missing hash is computed; a missing text (None) is fetched with
+        load_text only if the document has to be encoded
+        """
+        documents = iter(documents)
+        pool = None
+        if num_workers > 1:
+            print(f"Starting {num_workers} embedding worker processes...")
+            pool = self.model.start_multi_process_pool(target_devices=["cpu"] * num_workers)
         
-        print(f"Processing {len(doc_paths)} documents...")
+        embedded = 0
+        encode_seconds = 0.0
         
-        for doc_path in doc_paths:
-            doc_id = doc_path.stem
-            
-            # Read document
-            with open(doc_path, 'r', encoding='utf-8') as f:
-                text = f.read()
-            
-            text_hash = self.compute_hash(text)
+        try:
+            while True:
+                chunk_docs = list(islice(documents, chunk_size))
+                if not chunk_docs:
+                    break
+                
+                chunk_docs = [self._with_hash(document) for document in chunk_docs]
+                if on_document is not None:
+                    for doc_id, text, _ in chunk_docs:
+                        if text is not None:
+                            on_document(doc_id, text)
+                
+                if window is None:
+                    chunk, encoded, seconds = self._embed_chunk(
+                        chunk_docs, force_recompute, pool, batch_size, load_text
+                    )
+                else:
+                    # Passage spans need every text
+                    chunk_docs = [
+                        (doc_id, text if text is not None else load_text(doc_id), text_hash)
+                        for doc_id, text, text_hash in chunk_docs
+                    ]
+                    chunk, encoded, seconds = self._embed_passage_chunk(
+                        chunk_docs, force_recompute, pool, batch_size, window, stride or window
+                    )
+                embedded += encoded
+                encode_seconds += seconds
+                yield chunk
+        finally:
+            if pool is not None:
+                self.model.stop_multi_process_pool(pool)
             
-            # Check cache
-            if not force_recompute:
-                cached = self.cache.get(doc_id, text_hash)
-                if cached is not None:
-                    results[doc_id] = cached
-                    continue
-            
-            # Need to embed
-            to_embed.append((doc_id, text, text_hash))
+            if embedded:
+                rate = embedded / encode_seconds if encode_seconds else 0.0
+                unit = "documents" if window is None else "passages"
+                print(f"✓ Embedded {embedded} {unit} in {encode_seconds:.1f}s ({rate:.1f}/s)")
+            self.last_throughput = {
+                "docs_embedded": embedded,
+                "encode_seconds": round(encode_seconds, 3),
+                "docs_per_second": round(embedded / encode_seconds, 2) if encode_seconds else 0.0,
+                "num_workers": num_workers,
+                "batch_size": batch_size,
+            }
+    
+    def _with_hash(self, document: tuple) -> Tuple[str, Optional[str], str]:
+        """(doc_id, text, hash), hashing texts that arrive without one"""
+        if len(document) == 3:
+            return document
+        doc_id, text = document
+        return doc_id, text, self.compute_hash(text)
+
+    def _embed_chunk(self, chunk_docs: List[Tuple[str, Optional[str], str]], force_recompute: bool, pool,
+                     batch_size: int, load_text: Optional[Callable[[str], str]] = None
+                     ) -> Tuple[List[Tuple[str, str, np.ndarray]], int, float]:
+        """
+        Run one chunk of (doc_id, text, hash) through the pipeline
+        Returns (rows, documents encoded, seconds spent encoding)
+        """
+        hashes = {}
+        doc_texts = {}
+        for doc_id, text, text_hash in chunk_docs:
+            doc_texts[doc_id] = text
+            hashes[doc_id] = text_hash
+        
+        def text_of(doc_id: str) -> str:
+            if doc_texts[doc_id] is None:
+                doc_texts[doc_id] = load_text(doc_id)
+            return doc_texts[doc_id]
+        
+        # Check cache in one bulk lookup; content is shared across doc_ids
+        results = {}
+        new_vectors = {}
+        if not force_recompute:
+            stale = {}
+            results = self.cache.get_many(hashes.items(), stale=stale)
+            for doc_id, embedding in self._adopt_stale(stale, text_of):
+                results[doc_id] = new_vectors[doc_id] = embedding
+        
+        # Need to embed, each distinct text once
+        to_embed = {}
+        for doc_id, text_hash in hashes.items():
+            if doc_id not in results:
+                to_embed.setdefault(text_hash, doc_id)
         
         # Batch embed
+        seconds = 0.0
         if to_embed:
             print(f"Embedding {len(to_embed)} new/changed documents...")
-            texts = [item[1] for item in to_embed]
-            embeddings = self.model.encode(texts, convert_to_numpy=True, show_progress_bar=True)
-            
-            # Normalize
-            embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
-            
-            # Cache and store
-            for (doc_id, _, text_hash), embedding in zip(to_embed, embeddings):
-                self.cache.set(doc_id, embedding, text_hash)
+            texts = [text_of(doc_id) for doc_id in to_embed.values()]
+            embeddings, seconds = self._encode_documents(texts, pool, batch_size)
+            for doc_id, embedding in zip(to_embed.values(), embeddings):
+                new_vectors[doc_id] = embedding
+            encoded = dict(zip(to_embed, embeddings))
+            for doc_id, text_hash in hashes.items():
+                results.setdefault(doc_id, encoded.get(text_hash))
+        
+        # New vectors and every document's hash in a single transaction
+        self.cache.set_many(
+            (doc_id, new_vectors.get(doc_id), text_hash) for doc_id, text_hash in hashes.items()
+        )
+        
+        rows = [(doc_id, text_hash, results[doc_id]) for doc_id, text_hash in hashes.items()]
+        return rows, len(to_embed), seconds
+    
+    def _embed_passage_chunk(self, chunk_docs: List[Tuple[str, str, str]], force_recompute: bool, pool,
+                             batch_size: int, window: int, stride: int) -> Tuple[List[tuple], int, float]:
+        """
+        Chunked variant of _embed_chunk: every document is split into passages
+        which are cached and embedded individually
+        Returns (rows, passages encoded, seconds spent encoding)
+        """
+        docs = []
+        keys = []
+        passage_texts = {}
+        for doc_id, text, text_hash in chunk_docs:
+            spans = passage_spans(text, window, stride)
+            docs.append((doc_id, text_hash, spans))
+            for chunk_no, (start, end) in enumerate(spans):
+                passage = text[start:end]
+                keys.append((doc_id, chunk_no, self.compute_hash(passage)))
+                passage_texts[(doc_id, chunk_no)] = passage
+        
+        # Check cache in one bulk lookup; content is shared across passages
+        results = {}
+        new_vectors = {}
+        if not force_recompute:
+            stale = {}
+            results = self.cache.get_passages_many(keys, stale=stale)
+            for key, embedding in self._adopt_stale(stale, passage_texts.get):
+                results[key] = new_vectors[key] = embedding
+        
+        # Need to embed, each distinct passage text once
+        to_embed = {}
+        for doc_id, chunk_no, text_hash in keys:
+            if (doc_id, chunk_no) not in results:
+                to_embed.setdefault(text_hash, (doc_id, chunk_no))
+        
+        # Batch embed
+        seconds = 0.0
+        if to_embed:
+            print(f"Embedding {len(to_embed)} new/changed passages...")
+            texts = [passage_texts[key] for key in to_embed.values()]
+            embeddings, seconds = self._encode_documents(texts, pool, batch_size)
+            for key, embedding in zip(to_embed.values(), embeddings):
+                new_vectors[key] = embedding
+            encoded = dict(zip(to_embed, embeddings))
+            for doc_id, chunk_no, text_hash in keys:
+                results.setdefault((doc_id, chunk_no), encoded.get(text_hash))
+        
+        # New vectors and every passage's hash in a single transaction,
+        # dropping passages past each document's new end
+        self.cache.set_passages_many(
+            ((doc_id, chunk_no, new_vectors.get((doc_id, chunk_no)), text_hash)
+             for doc_id, chunk_no, text_hash in keys),
+            counts={doc_id: len(spans) for doc_id, _, spans in docs}
+        )
+        
+        rows = [
+            (doc_id, text_hash, spans, np.vstack([results[(doc_id, n)] for n in range(len(spans))]))
+            for doc_id, text_hash, spans in docs
+        ]
+        return rows, len(to_embed), seconds
+    
+    def _encode_documents(self, texts: List[str], pool, batch_size: int) -> Tuple[np.ndarray, float]:
+        """
+        Encode document texts, on the multi-process pool when given
+        Returns (normalized embeddings, seconds spent encoding)
+        """
+        start = time.perf_counter()
+        if pool is not None:
+            embeddings = self.model.encode_multi_process(texts, pool, batch_size=batch_size)
+        else:
+            embeddings = self.model.encode(
+                texts, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=True
+            )
+        seconds = time.perf_counter() - start
+        ENCODE_SECONDS.observe(seconds, kind="document")
+        TEXTS_EMBEDDED.inc(len(texts), kind="document")
+        
+        # Normalize
+        embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings, seconds
+    
+    def embed_documents(self, doc_paths: List[Path], force_recompute: bool = False,
+                        num_workers: int = 1, batch_size: int = 32) -> dict:
+        """
+        Embed all documents with caching
+        Returns: {doc_id: embedding}
+        """
+        results = {}
+        
+        print(f"Processing {len(doc_paths)} documents...")
+        
+        chunks = self.iter_embeddings(
+            doc_paths, force_recompute=force_recompute, num_workers=num_workers, batch_size=batch_size,
+            skip_unchanged=not force_recompute
+        )
+        for chunk in chunks:
+            for doc_id, _, embedding in chunk:
                 results[doc_id] = embedding
         
         print(f"✓ Total embeddings: {len(results)}")
@@ -74,6 +480,17 @@ class EmbeddingGenerator:
 
 def main():
     """CLI tool to generate embeddings"""
+    parser = argparse.ArgumentParser(description="Generate document embeddings")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="sentence-transformers model")
+    parser.add_argument("--revision", help="model revision to pin (branch, tag or commit)")
+    parser.add_argument("--workers", type=int, default=1, help="embedding worker processes")
+    parser.add_argument("--batch-size", type=int, default=32, help="encode batch size per worker")
+    parser.add_argument("--cache-dtype", default="float32", choices=CACHE_DTYPES,
+                        help="storage format of cached embeddings")
+    parser.add_argument("--hash-algo", choices=HASH_ALGORITHMS,
+                        help="content hash for change detection (default: fastest installed)")
+    args = parser.parse_args()
+    
     docs_dir = Path("data/docs")
     
     if not docs_dir.exists():
@@ -86,8 +503,10 @@ def main():
         print("No documents found!")
         return
     
-    embedder = EmbeddingGenerator()
-    embeddings = embedder.embed_documents(doc_paths)
+    embedder = EmbeddingGenerator(
+        args.model, model_revision=args.revision, cache_dtype=args.cache_dtype, hash_algo=args.hash_algo
+    )
+    embeddings = embedder.embed_documents(doc_paths, num_workers=args.workers, batch_size=args.batch_size)
     
     print(f"\\n✓ Generated {len(embeddings)} embeddings")
     print("Cache stored in: data/cache/embeddings.db")
@@ -0,0 +1,47 @@
+"""
+Score fusion for hybrid (vector + BM25) retrieval
+"""
+from typing import Dict, List, Tuple
+
+FUSION_METHODS = ("rrf", "weighted")
+
+def reciprocal_rank_fusion(ranked_lists: List[List[Tuple[str, float]]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Reciprocal-rank fusion: sum of 1 / (k + rank) over the lists a document appears in
+    Only ranks are used, so the lists' score scales don't need to agree
+    """
+    fused: Dict[str, float] = {}
+    for hits in ranked_lists:
+        for rank, (doc_id, _) in enumerate(hits, 1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+def _min_max(hits: List[Tuple[str, float]]) -> Dict[str, float]:
+    """Scale scores of one list into [0, 1]"""
+    if not hits:
+        return {}
+    scores = [score for _, score in hits]
+    low, high = min(scores), max(scores)
+    if high == low:
+        return {doc_id: 1.0 for doc_id, _ in hits}
+    return {doc_id: (score - low) / (high - low) for doc_id, score in hits}
+
+def weighted_fusion(vector_hits: List[Tuple[str, float]], keyword_hits: List[Tuple[str, float]],
+                    alpha: float = 0.5) -> List[Tuple[str, float]]:
+    """alpha * normalized vector score + (1 - alpha) * normalized BM25 score"""
+    vector = _min_max(vector_hits)
+    keyword = _min_max(keyword_hits)
+    fused = {
+        doc_id: alpha * vector.get(doc_id, 0.0) + (1 - alpha) * keyword.get(doc_id, 0.0)
+        for doc_id in set(vector) | set(keyword)
+    }
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+def fuse(vector_hits: List[Tuple[str, float]], keyword_hits: List[Tuple[str, float]],
+         method: str = "rrf", alpha: float = 0.5) -> List[Tuple[str, float]]:
+    """Combine both candidate lists with the chosen method"""
+    if method == "rrf":
+        return reciprocal_rank_fusion([vector_hits, keyword_hits])
+    if method == "weighted":
+        return weighted_fusion(vector_hits, keyword_hits, alpha)
+    raise ValueError(f"Unknown fusion method '{method}', expected one of {FUSION_METHODS}")
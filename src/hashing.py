@@ -0,0 +1,50 @@
+"""
+Content hashing for cache invalidation (not security)
+"""
+import hashlib
+from typing import Callable, Optional
+
+HASH_ALGORITHMS = ("xxh3_128", "blake3", "sha256")
+
+def _hasher(name: str) -> Callable[[bytes], str]:
+    """bytes -> hex digest function of a hash algorithm"""
+    if name == "sha256":
+        return lambda data: hashlib.sha256(data).hexdigest()
+
+    if name == "xxh3_128":
+        try:
+            import xxhash
+        except ImportError:
+            raise ImportError("xxh3_128 hashing requires: pip install xxhash")
+        return xxhash.xxh3_128_hexdigest
+
+    if name == "blake3":
+        try:
+            from blake3 import blake3
+        except ImportError:
+            raise ImportError("blake3 hashing requires: pip install blake3")
+        return lambda data: blake3(data, max_threads=1).hexdigest()
+
+    raise ValueError(f"Unknown hash algorithm '{name}', expected one of {HASH_ALGORITHMS}")
+
+def default_algorithm() -> str:
+    """Fastest installed algorithm: xxh3_128, then blake3, then hashlib's sha256"""
+    for name in HASH_ALGORITHMS:
+        try:
+            _hasher(name)
+        except ImportError:
+            continue
+        return name
+    return "sha256"
+
+class ContentHasher:
+    def __init__(self, algorithm: Optional[str] = None):
+        """algorithm: one of HASH_ALGORITHMS, None picks default_algorithm()"""
+        self.algorithm = algorithm or default_algorithm()
+        self._hash = _hasher(self.algorithm)
+
+    def __call__(self, content) -> str:
+        """Hex digest of bytes, or of a str encoded as UTF-8"""
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        return self._hash(content)
@@ -0,0 +1,216 @@
+"""
+FAISS index factory: exact, approximate (IVF, HNSW) and quantized (SQ, PQ) indexes
+"""
+import math
+from typing import Optional
+import numpy as np
+import faiss
+from .sharded_index import ShardedIndex
+
+INDEX_TYPES = ("flat", "hnsw", "ivf", "ivfpq", "sq8", "sqfp16", "pq")
+
+# Indexes storing lossy codes; their candidates are worth reranking exactly
+QUANTIZED_INDEX_TYPES = ("ivfpq", "sq8", "sqfp16", "pq")
+
+# Training vectors for scalar quantizers, which only learn per-dimension ranges
+SQ_TRAINING_SAMPLE = 10000
+
+# FAISS wants roughly this many training points per IVF centroid
+MIN_POINTS_PER_CENTROID = 39
+
+# Filtered IVF / HNSW searches are widened until the part of the index they
+# visit holds about this many times k vectors accepted by the filter
+FILTER_OVERSEARCH = 4
+
+def default_nlist(n_vectors: int) -> int:
+    """Rule of thumb: ~4 * sqrt(N) inverted lists"""
+    return max(1, int(4 * math.sqrt(n_vectors)))
+
+def default_pq_m(dimension: int) -> int:
+    """Largest sub-quantizer count <= dimension / 8 that divides dimension"""
+    m = max(1, dimension // 8)
+    while dimension % m:
+        m -= 1
+    return m
+
+def create_index(index_type: str, dimension: int, n_vectors: int,
+                 nlist: Optional[int] = None, pq_m: Optional[int] = None,
+                 hnsw_m: int = 32):
+    """
+    Create an empty index that accepts add_with_ids/remove_ids
+    flat, hnsw, sq* and pq are wrapped in IndexIDMap2, IVF indexes store ids natively
+    sq8/sqfp16 keep 1/2 bytes per dimension, pq keeps pq_m bytes per vector
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+
+    metric = faiss.METRIC_INNER_PRODUCT
+
+    if index_type == "flat":
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+
+    if index_type == "hnsw":
+        return faiss.IndexIDMap2(faiss.index_factory(dimension, f"HNSW{hnsw_m},Flat", metric))
+
+    if index_type == "sq8":
+        return faiss.IndexIDMap2(faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit, metric))
+
+    if index_type == "sqfp16":
+        return faiss.IndexIDMap2(faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16, metric))
+
+    pq_m = pq_m or default_pq_m(dimension)
+    if index_type == "pq":
+        return faiss.IndexIDMap2(faiss.index_factory(dimension, f"PQ{pq_m}", metric))
+
+    nlist = nlist or default_nlist(n_vectors)
+    if index_type == "ivf":
+        return faiss.index_factory(dimension, f"IVF{nlist},Flat", metric)
+
+    return faiss.index_factory(dimension, f"IVF{nlist},PQ{pq_m}", metric)
+
+def needs_training(index_type: str) -> bool:
+    """IVF coarse quantizers, PQ codebooks and SQ8 ranges must be trained before adding"""
+    return index_type in ("ivf", "ivfpq", "sq8", "pq")
+
+def sample_size(index) -> Optional[int]:
+    """Number of training vectors wanted by the index, None if untrained type"""
+    if index.is_trained:
+        return None
+
+    index = _first_shard(index)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return ivf.nlist * MIN_POINTS_PER_CENTROID * 4
+
+    pq = getattr(_unwrap(index), "pq", None)
+    if pq is not None:
+        return (1 << pq.nbits) * MIN_POINTS_PER_CENTROID * 4
+
+    return SQ_TRAINING_SAMPLE
+
+def training_sample(embeddings: np.ndarray, index, seed: int = 0) -> np.ndarray:
+    """Random sample of cached embeddings large enough to train the index"""
+    wanted = sample_size(index)
+    if wanted is None or len(embeddings) <= wanted:
+        return embeddings
+
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(embeddings), size=wanted, replace=False)
+    return embeddings[rows]
+
+class ReservoirSampler:
+    """Uniform fixed-size sample of a vector stream of unknown length"""
+
+    def __init__(self, size: int, seed: int = 0):
+        self.size = size
+        self.seen = 0
+        self.rows = []
+        self._rng = np.random.default_rng(seed)
+
+    def add(self, vector: np.ndarray):
+        if len(self.rows) < self.size:
+            self.rows.append(vector)
+        else:
+            slot = int(self._rng.integers(0, self.seen + 1))
+            if slot < self.size:
+                self.rows[slot] = vector
+        self.seen += 1
+
+    def sample(self) -> np.ndarray:
+        return np.array(self.rows).astype('float32')
+
+def can_train(index, n_vectors: int) -> bool:
+    """IVF needs at least nlist points, PQ codebooks need 2^nbits points"""
+    index = _first_shard(index)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None:
+        base, needed = _unwrap(index), 1
+    else:
+        base, needed = faiss.downcast_index(ivf), ivf.nlist
+
+    pq = getattr(base, "pq", None)
+    if pq is not None:
+        needed = max(needed, 1 << pq.nbits)
+    return n_vectors >= needed
+
+def search_params(index, nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                  selector=None, n_selected: Optional[int] = None, k: int = 1):
+    """
+    Per-query search parameters for the given index, None for defaults
+    selector: faiss.IDSelector restricting the search to some ids; index
+    defaults are carried over since parameter objects replace them. Only
+    for indexes where supports_selector() holds, others must be post-filtered
+    n_selected: number of ids the selector accepts; nprobe / efSearch then
+    grow as the filter gets more selective, so that k hits are still found
+    """
+    # Selected ids are spread over the shards like all others
+    selected_share = n_selected / index.ntotal if n_selected and index.ntotal else None
+    index = _first_shard(index)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and (nprobe is not None or selector is not None):
+        nprobe = nprobe or ivf.nprobe
+        if selector is not None and selected_share:
+            selected_per_list = selected_share * index.ntotal / ivf.nlist
+            wanted = math.ceil(FILTER_OVERSEARCH * k / max(selected_per_list, 1e-9))
+            nprobe = max(nprobe, min(wanted, ivf.nlist))
+        return faiss.SearchParametersIVF(nprobe=nprobe, sel=selector)
+
+    base = _unwrap(index)
+    if isinstance(base, faiss.IndexHNSW) and (ef_search is not None or selector is not None):
+        ef_search = ef_search or base.hnsw.efSearch
+        if selector is not None and selected_share:
+            wanted = math.ceil(FILTER_OVERSEARCH * k / selected_share)
+            ef_search = max(ef_search, min(wanted, max(1, index.ntotal)))
+        return faiss.SearchParametersHNSW(efSearch=ef_search, sel=selector)
+
+    if selector is not None:
+        return faiss.SearchParameters(sel=selector)
+
+    return None
+
+def id_selector(ids: np.ndarray):
+    """Selector accepting exactly the given FAISS ids"""
+    ids = np.ascontiguousarray(ids, dtype='int64')
+    return faiss.IDSelectorBatch(len(ids), faiss.swig_ptr(ids))
+
+def exclusion_selector(ids: np.ndarray):
+    """Selector accepting every FAISS id except the given ones"""
+    return faiss.IDSelectorNot(id_selector(ids))
+
+def supports_selector(index) -> bool:
+    """IndexPQ rejects search-time IDSelectors"""
+    index = _first_shard(index)
+    return not isinstance(_unwrap(index), faiss.IndexPQ)
+
+def supports_removal(index) -> bool:
+    """HNSW graphs cannot drop vectors in place"""
+    index = _first_shard(index)
+    return not isinstance(_unwrap(index), faiss.IndexHNSW)
+
+def is_quantized(index) -> bool:
+    """Index stores lossy codes (QUANTIZED_INDEX_TYPES); false for their flat fallback"""
+    index = _unwrap(_first_shard(index))
+    return isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexPQ, faiss.IndexIVFPQ))
+
+def _first_shard(index):
+    """Representative FAISS index of a sharded index (all shards share one type)"""
+    if isinstance(index, ShardedIndex):
+        return index.shard(0)
+    return index
+
+def _unwrap(index):
+    """Underlying index of an IndexIDMap/IndexIDMap2"""
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return index
+
+def recall_at_k(approx_ids: np.ndarray, exact_ids: np.ndarray) -> float:
+    """Mean fraction of the exact top-k found by the approximate top-k"""
+    hits = []
+    for approx, exact in zip(approx_ids, exact_ids):
+        exact = set(int(i) for i in exact if i >= 0)
+        if not exact:
+            continue
+        hits.append(len(exact & set(int(i) for i in approx)) / len(exact))
+    return float(np.mean(hits)) if hits else 0.0
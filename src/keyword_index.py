@@ -0,0 +1,264 @@
+"""
+Keyword index: precomputed explanation statistics and a BM25 inverted index
+"""
+import math
+import os
+import threading
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+import numpy as np
+
+def tokenize(text: str) -> List[str]:
+    """Same tokenization the explanations have always used"""
+    return text.lower().split()
+
+class KeywordIndex:
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        """
+        Shared vocabulary, per-document sorted token-id arrays and word counts,
+        and BM25 postings (doc number + term frequency arrays per term)
+        """
+        self.k1 = k1
+        self.b = b
+        self.vocab: Dict[str, int] = {}
+        self.doc_tokens: Dict[str, np.ndarray] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        # Postings reference internal doc numbers; re-added documents get a
+        # new number and the old one is marked dead
+        self.doc_nums: Dict[str, int] = {}
+        self.num_to_doc: List[str] = []
+        self.postings: Dict[int, Tuple[array, array]] = {}
+        self.total_length = 0
+        self._alive = np.zeros(1024, dtype=bool)
+        self._lengths = np.zeros(1024, dtype=np.int32)
+        self._lock = threading.Lock()
+
+    def add(self, doc_id: str, text: str):
+        """Index (or re-index) one document"""
+        tokens = tokenize(text)
+        counts = Counter(tokens)
+
+        with self._lock:
+            self._remove(doc_id)
+
+            num = len(self.num_to_doc)
+            self.num_to_doc.append(doc_id)
+            self.doc_nums[doc_id] = num
+            self._grow(num + 1)
+            self._alive[num] = True
+            self._lengths[num] = len(tokens)
+            self.total_length += len(tokens)
+
+            ids = []
+            for token, count in counts.items():
+                token_id = self.vocab.get(token)
+                if token_id is None:
+                    token_id = self.vocab[token] = len(self.vocab)
+                    self.postings[token_id] = (array('i'), array('i'))
+                docs, tfs = self.postings[token_id]
+                docs.append(num)
+                tfs.append(count)
+                ids.append(token_id)
+
+            self.doc_tokens[doc_id] = np.array(sorted(ids), dtype=np.int32)
+            self.doc_lengths[doc_id] = len(tokens)
+
+    def remove(self, doc_id: str):
+        """Forget a document (vocabulary entries are kept)"""
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id: str):
+        """Mark the document's postings dead (lock held)"""
+        num = self.doc_nums.pop(doc_id, None)
+        if num is not None:
+            self._alive[num] = False
+            self.total_length -= int(self._lengths[num])
+        self.doc_tokens.pop(doc_id, None)
+        self.doc_lengths.pop(doc_id, None)
+
+    def _grow(self, size: int):
+        """Double the per-number arrays until they hold size entries"""
+        if size <= len(self._alive):
+            return
+        capacity = len(self._alive)
+        while capacity < size:
+            capacity *= 2
+        self._alive = np.resize(self._alive, capacity)
+        self._alive[len(self.num_to_doc):] = False
+        self._lengths = np.resize(self._lengths, capacity)
+
+    def compact(self):
+        """Drop the dead postings of removed and re-added documents, renumbering the live ones"""
+        with self._lock:
+            self._compact()
+
+    def _compact(self):
+        """compact() with the lock held"""
+        size = len(self.num_to_doc)
+        if len(self.doc_nums) == size:
+            return
+
+        alive = self._alive[:size]
+        renumber = np.cumsum(alive, dtype=np.int32) - 1
+        for token_id, (docs, tfs) in self.postings.items():
+            docs = np.frombuffer(docs, dtype=np.int32)
+            live = alive[docs]
+            self.postings[token_id] = (array('i', renumber[docs[live]].tobytes()),
+                                       array('i', np.frombuffer(tfs, dtype=np.int32)[live].tobytes()))
+
+        self.num_to_doc = [doc_id for num, doc_id in enumerate(self.num_to_doc) if alive[num]]
+        self.doc_nums = {doc_id: num for num, doc_id in enumerate(self.num_to_doc)}
+        lengths = self._lengths[:size][alive]
+        self._alive = np.zeros(max(1024, len(lengths)), dtype=bool)
+        self._alive[:len(lengths)] = True
+        self._lengths = np.zeros(len(self._alive), dtype=np.int32)
+        self._lengths[:len(lengths)] = lengths
+
+    def save(self, path: Path, tag: str = ""):
+        """
+        Compact, then write vocabulary, postings and document lengths to one
+        .npz file atomically; tag is stored for the loader to check
+        """
+        path = Path(path)
+        with self._lock:
+            self._compact()
+            words = sorted(self.vocab, key=self.vocab.get)
+            postings = [self.postings[token_id] for token_id in range(len(words))]
+            tmp_path = path.with_suffix(".tmp.npz")
+            np.savez(
+                tmp_path,
+                tag=np.array(tag),
+                words=_encode_lines(words),
+                doc_ids=_encode_lines(self.num_to_doc),
+                lengths=self._lengths[:len(self.num_to_doc)],
+                offsets=np.concatenate([[0], np.cumsum([len(docs) for docs, _ in postings], dtype=np.int64)]),
+                docs=np.frombuffer(b"".join(docs.tobytes() for docs, _ in postings), dtype=np.int32),
+                tfs=np.frombuffer(b"".join(tfs.tobytes() for _, tfs in postings), dtype=np.int32),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path, tag: str = "", k1: float = 1.5, b: float = 0.75) -> Optional["KeywordIndex"]:
+        """Index written by save() with the same tag, None if missing, unreadable or another tag"""
+        try:
+            with np.load(path, allow_pickle=False) as stored:
+                if str(stored["tag"]) != tag:
+                    return None
+                words = _decode_lines(stored["words"])
+                doc_ids = _decode_lines(stored["doc_ids"])
+                lengths = stored["lengths"].astype(np.int32)
+                offsets, docs, tfs = stored["offsets"], stored["docs"], stored["tfs"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+        index = cls(k1=k1, b=b)
+        index.vocab = {word: token_id for token_id, word in enumerate(words)}
+        index.num_to_doc = doc_ids
+        index.doc_nums = {doc_id: num for num, doc_id in enumerate(doc_ids)}
+        index._grow(len(doc_ids))
+        index._alive[:len(doc_ids)] = True
+        index._lengths[:len(doc_ids)] = lengths
+        index.total_length = int(lengths.sum())
+        index.postings = {
+            token_id: (array('i', docs[offsets[token_id]:offsets[token_id + 1]].tobytes()),
+                       array('i', tfs[offsets[token_id]:offsets[token_id + 1]].tobytes()))
+            for token_id in range(len(words))
+        }
+
+        # Per-document token ids are the postings inverted, sorted by token id
+        terms = np.repeat(np.arange(len(words), dtype=np.int32), np.diff(offsets))
+        order = np.lexsort((terms, docs))
+        bounds = np.searchsorted(docs[order], np.arange(len(doc_ids) + 1))
+        sorted_terms = terms[order]
+        for num, doc_id in enumerate(doc_ids):
+            index.doc_tokens[doc_id] = sorted_terms[bounds[num]:bounds[num + 1]]
+            index.doc_lengths[doc_id] = int(lengths[num])
+        return index
+
+    def query_terms(self, query: str) -> Tuple[List[str], np.ndarray]:
+        """
+        Unique query words in query order, and the vocabulary ids of those
+        that occur anywhere in the corpus (-1 for unknown words)
+        """
+        words = list(dict.fromkeys(tokenize(query)))
+        ids = np.array([self.vocab.get(word, -1) for word in words], dtype=np.int32)
+        return words, ids
+
+    def explain(self, doc_id: str, words: List[str], ids: np.ndarray) -> dict:
+        """
+        Keyword overlap of a prepared query with one document
+        Cost is O(query words * log(document vocabulary))
+        """
+        doc_tokens = self.doc_tokens.get(doc_id)
+        overlap = []
+
+        if doc_tokens is not None and len(doc_tokens):
+            positions = np.searchsorted(doc_tokens, ids)
+            positions = np.minimum(positions, len(doc_tokens) - 1)
+            found = (doc_tokens[positions] == ids) & (ids >= 0)
+            overlap = [word for word, hit in zip(words, found) if hit]
+
+        return {
+            "keyword_overlap": overlap[:5],  # Top 5 overlapping words
+            "overlap_ratio": round(len(overlap) / len(words), 2) if words else 0,
+            "doc_length": self.doc_lengths.get(doc_id, 0),
+        }
+
+    def search(self, query: str, top_k: int = 5, allowed: Optional[Set[str]] = None) -> List[Tuple[str, float]]:
+        """
+        BM25 ranking over the inverted index
+        Only postings of the query terms are touched
+        allowed: restrict results to these doc_ids (metadata filters)
+        Returns [(doc_id, score)] best first
+        """
+        with self._lock:
+            n_docs = len(self.doc_nums)
+            if n_docs == 0:
+                return []
+
+            size = len(self.num_to_doc)
+            alive = self._alive[:size]
+            lengths = self._lengths[:size]
+            avgdl = self.total_length / n_docs if self.total_length else 1.0
+            scores = np.zeros(size, dtype=np.float32)
+
+            _, ids = self.query_terms(query)
+            for token_id in ids:
+                if token_id < 0:
+                    continue
+                docs, tfs = self.postings[int(token_id)]
+                docs = np.frombuffer(docs, dtype=np.int32)
+                tfs = np.frombuffer(tfs, dtype=np.int32).astype(np.float32)
+
+                live = alive[docs]
+                docs, tfs = docs[live], tfs[live]
+                df = len(docs)
+                if df == 0:
+                    continue
+
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * lengths[docs] / avgdl)
+                scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+
+            if allowed is not None:
+                keep = np.zeros(size, dtype=bool)
+                keep[[self.doc_nums[doc_id] for doc_id in allowed if doc_id in self.doc_nums]] = True
+                scores[~keep] = 0
+
+            matched = np.flatnonzero(scores > 0)
+            if len(matched) > top_k:
+                matched = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+            matched = matched[np.argsort(-scores[matched])]
+
+            return [(self.num_to_doc[num], float(scores[num])) for num in matched]
+
+def _encode_lines(items: List[str]) -> np.ndarray:
+    """Newline-joined UTF-8 bytes (tokens and doc_ids never contain newlines)"""
+    return np.frombuffer("\n".join(items).encode('utf-8'), dtype=np.uint8)
+
+def _decode_lines(data: np.ndarray) -> List[str]:
+    text = data.tobytes().decode('utf-8')
+    return text.split("\n") if text else []
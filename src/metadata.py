@@ -0,0 +1,112 @@
+"""
+Per-document metadata parsed from filenames, with an inverted index for filters
+"""
+import re
+import threading
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+# setup.py names documents doc_<number>_<category with "." replaced by "_">
+_DOC_NAME = re.compile(r'^doc_\d+_(.+)$')
+
+FILTER_FIELDS = ("category",)
+
+Filters = Dict[str, Union[str, List[str]]]
+
+def parse_metadata(doc_id: str) -> Dict[str, str]:
+    """
+    Metadata encoded in a document's file name, {} if it has none
+    Newsgroup names never contain "_", so the dots can be restored
+    """
+    match = _DOC_NAME.match(doc_id)
+    if match is None:
+        return {}
+    return {"category": match.group(1).replace('_', '.')}
+
+def filter_key(filters: Optional[Filters]) -> Optional[Tuple]:
+    """Hashable, order-independent form of a filter dict (for cache keys)"""
+    if not filters:
+        return None
+    return tuple(sorted(
+        (field, tuple(sorted([values] if isinstance(values, str) else values)))
+        for field, values in filters.items()
+    ))
+
+class MetadataStore:
+    """
+    doc_id -> metadata plus (field, value) -> doc_ids postings
+    Category values are hierarchical: filtering on "rec.sport" matches
+    rec.sport.baseball and rec.sport.hockey
+    """
+
+    def __init__(self):
+        self.docs: Dict[str, Dict[str, str]] = {}
+        self.postings: Dict[Tuple[str, str], Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def _terms(self, metadata: Dict[str, str]) -> List[Tuple[str, str]]:
+        """(field, value) postings keys of one document"""
+        terms = []
+        for field, value in metadata.items():
+            parts = value.split('.')
+            terms.extend((field, '.'.join(parts[:n])) for n in range(1, len(parts) + 1))
+        return terms
+
+    def add(self, doc_id: str, metadata: Optional[Dict[str, str]] = None):
+        """Index (or re-index) a document, parsing its file name by default"""
+        if metadata is None:
+            metadata = parse_metadata(doc_id)
+        with self._lock:
+            self._remove(doc_id)
+            self.docs[doc_id] = metadata
+            for term in self._terms(metadata):
+                self.postings.setdefault(term, set()).add(doc_id)
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id: str):
+        metadata = self.docs.pop(doc_id, None)
+        if metadata is None:
+            return
+        for term in self._terms(metadata):
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.discard(doc_id)
+                if not docs:
+                    del self.postings[term]
+
+    def clear(self):
+        with self._lock:
+            self.docs = {}
+            self.postings = {}
+
+    def get(self, doc_id: str) -> Dict[str, str]:
+        return self.docs.get(doc_id, {})
+
+    def values(self, field: str) -> List[str]:
+        """Leaf values of a field, e.g. all categories"""
+        with self._lock:
+            return sorted({metadata[field] for metadata in self.docs.values() if field in metadata})
+
+    def validate(self, filters: Optional[Filters]):
+        """Raise ValueError for unknown fields or empty value lists"""
+        for field, values in (filters or {}).items():
+            if field not in FILTER_FIELDS:
+                raise ValueError(f"Unknown filter field '{field}', expected one of {FILTER_FIELDS}")
+            if not isinstance(values, str) and not values:
+                raise ValueError(f"Filter '{field}' needs at least one value")
+
+    def match(self, filters: Filters) -> Set[str]:
+        """doc_ids matching every field (any of the values given for a field)"""
+        self.validate(filters)
+        matched = None
+        with self._lock:
+            for field, values in filters.items():
+                if isinstance(values, str):
+                    values = [values]
+                docs = set()
+                for value in values:
+                    docs |= self.postings.get((field, value), set())
+                matched = docs if matched is None else matched & docs
+        return matched if matched is not None else set(self.docs)
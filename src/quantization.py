@@ -0,0 +1,38 @@
+"""
+Compact serialization of embedding vectors (float32 / float16 / scalar int8)
+"""
+import numpy as np
+
+CACHE_DTYPES = ("float32", "float16", "int8")
+
+def encode_vector(vector: np.ndarray, dtype: str = "float32") -> bytes:
+    """
+    Serialize one vector
+    int8 stores a float32 scale (max |value|) followed by 127-level codes
+    """
+    if dtype == "float32":
+        return vector.astype(np.float32).tobytes()
+
+    if dtype == "float16":
+        return vector.astype(np.float16).tobytes()
+
+    if dtype == "int8":
+        scale = float(np.max(np.abs(vector))) or 1.0
+        codes = np.clip(np.round(vector / scale * 127), -127, 127).astype(np.int8)
+        return np.float32(scale).tobytes() + codes.tobytes()
+
+    raise ValueError(f"Unknown cache dtype '{dtype}', expected one of {CACHE_DTYPES}")
+
+def decode_vector(blob: bytes, dtype: str = "float32") -> np.ndarray:
+    """Deserialize one vector back to float32"""
+    if dtype == "float32":
+        return np.frombuffer(blob, dtype=np.float32)
+
+    if dtype == "float16":
+        return np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+
+    if dtype == "int8":
+        scale = np.frombuffer(blob[:4], dtype=np.float32)[0]
+        return np.frombuffer(blob[4:], dtype=np.int8).astype(np.float32) * (scale / 127)
+
+    raise ValueError(f"Unknown cache dtype '{dtype}', expected one of {CACHE_DTYPES}")
@@ -0,0 +1,92 @@
+"""
+Bounded in-memory LRU cache with TTL for query embeddings and result sets
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+def normalize_query(text: str) -> str:
+    """Cache key for query text: lowercase, collapsed whitespace"""
+    return " ".join(text.lower().split())
+
+class LRUCache:
+    def __init__(self, max_entries: int = 10000, max_bytes: Optional[int] = None,
+                 ttl_seconds: Optional[float] = None, sizeof: Optional[Callable] = None):
+        """
+        max_entries: evict least recently used beyond this many entries
+        max_bytes: also evict beyond this many bytes, as measured by sizeof(value)
+        ttl_seconds: entries older than this are treated as missing
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.sizeof = sizeof or (lambda value: 0)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._data = OrderedDict()  # key -> (value, stored_at, size)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return cached value or None, refreshing its LRU position"""
+        with self._lock:
+            entry = self._data.get(key)
+
+            if entry is not None and self.ttl_seconds is not None:
+                if time.monotonic() - entry[1] > self.ttl_seconds:
+                    self._pop(key)
+                    entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        """Insert or replace a value, evicting old entries to stay in bounds"""
+        size = self.sizeof(value)
+
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+
+            self._data[key] = (value, time.monotonic(), size)
+            self.bytes += size
+
+            while self._data and (
+                len(self._data) > self.max_entries
+                or (self.max_bytes is not None and self.bytes > self.max_bytes)
+            ):
+                self._pop(next(iter(self._data)))
+                self.evictions += 1
+
+    def _pop(self, key):
+        """Remove key and release its bytes (lock held)"""
+        _, _, size = self._data.pop(key)
+        self.bytes -= size
+
+    def clear(self):
+        """Drop all entries, counters are kept"""
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current size"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -1,96 +1,1497 @@
 """
 FAISS-based vector search engine
 """
+import json
+import os
+import secrets
+import threading
+import time
 from pathlib import Path
-from typing import List, Tuple
+from typing import List, Optional, Set, Tuple
 import numpy as np
 import faiss
-from .embedder import EmbeddingGenerator
-from .cache_manager import CacheManager
+from .embedder import EmbeddingGenerator, read_document, DEFAULT_MODEL
+from .query_cache import LRUCache, normalize_query
+from .keyword_index import KeywordIndex
+from .fusion import FUSION_METHODS, fuse
+from .chunker import CHUNK_BITS
+from .doc_store import DocumentStore
+from .rwlock import ReadWriteLock
+from .sharded_index import ShardedIndex
+from .metadata import MetadataStore, Filters, filter_key
+from .metrics import REGISTRY, stage_timer
+from .index_factory import (
+    create_index, needs_training, sample_size, training_sample, ReservoirSampler,
+    can_train, search_params, supports_removal, supports_selector, recall_at_k, is_quantized,
+    id_selector, exclusion_selector
+)
+
+SEARCH_QUERIES = REGISTRY.counter("search_queries_total", "Queries searched by mode and result-cache outcome")
+
+# Bump when the on-disk snapshot layout changes
+SNAPSHOT_VERSION = 4
+
+SEARCH_MODES = ("vector", "keyword", "hybrid")
+
+# Hybrid mode fuses candidate lists this many times deeper than top_k
+HYBRID_CANDIDATE_FACTOR = 4
+
+PASSAGE_POOLING = ("max", "sum")
+
+# Passage mode fetches this many passages per wanted document before pooling
+PASSAGE_OVERFETCH = 4
+
+# Reranking rescores this many times more candidates than it keeps
+RERANK_FACTOR = 4
+
+# Inverted lists probed (IVF) and graph candidates kept (HNSW) by searches
+# that do not set their own; FAISS's own defaults (1 and 16) cost most of the recall
+DEFAULT_NPROBE = 16
+DEFAULT_EF_SEARCH = 64
+
+# Results ranked (and cached behind a cursor) by the first search_page call
+PAGINATION_DEPTH = 200
+
+# Share of tombstoned vectors (left in an HNSW graph by removals) that
+# triggers a background rebuild of the index without them; the same share
+# of dead records compacts the document store when the snapshot is written
+COMPACTION_THRESHOLD = 0.1
+
+# Seconds build_index waits for another engine (e.g. another API worker
+# process) rebuilding the same index_dir before giving up with StoreLocked
+STORE_LOCK_TIMEOUT = 600.0
+
+# Incremental updates are persisted this many seconds after the first of a burst
+SNAPSHOT_DELAY = 2.0
+
+class CursorExpired(ValueError):
+    """Pagination cursor evicted from the cursor cache or never issued"""
 
 class SearchEngine:
-    def __init__(self):
-        """Initialize search engine"""
-        self.embedder = EmbeddingGenerator()
-        self.cache = CacheManager()
+    def __init__(self, index_dir: str = "data/cache/index", index_type: str = "flat",
+                 model_name: Optional[str] = None, model_revision: Optional[str] = None,
+                 nlist: Optional[int] = None, pq_m: Optional[int] = None, hnsw_m: int = 32,
+                 nprobe: int = DEFAULT_NPROBE, ef_search: int = DEFAULT_EF_SEARCH,
+                 result_cache_size: int = 1000, result_cache_ttl: Optional[float] = 300,
+                 passage_window: Optional[int] = None, passage_stride: Optional[int] = None,
+                 passage_pooling: str = "max", pooling_top_n: int = 3,
+                 doc_store_compression: Optional[str] = None, cache_dtype: str = "float32",
+                 rerank: Optional[bool] = None, rerank_factor: int = RERANK_FACTOR,
+                 n_shards: int = 1, cursor_cache_size: int = 1000, cursor_ttl: Optional[float] = 600,
+                 cache_path: str = "data/cache/embeddings.db", hash_algo: Optional[str] = None,
+                 collapse_duplicates: bool = False, snapshot_delay: float = SNAPSHOT_DELAY):
+        """
+        Initialize search engine
+        index_type: flat (exact), hnsw, ivf or ivfpq (approximate),
+        sq8, sqfp16 or pq (quantized, compressed in memory)
+        nprobe (IVF) and ef_search (HNSW): search parameters of queries that
+        do not pass their own
+        model_name, model_revision: embedding model; see reembed() to switch.
+        None keeps the model of the snapshot in index_dir (so a switch
+        survives a restart), DEFAULT_MODEL when there is none
+        result_cache_*: bounds of the result-set cache (size 0 disables)
+        passage_window/stride: index word-window passages instead of whole
+        documents; passage scores are pooled per document by max or by the
+        sum of the pooling_top_n best passages
+        doc_store_compression: None, zlib, zstd or lz4 for the document store
+        cache_dtype: float32, float16 or int8 storage in the embedding cache
+        rerank: rescore rerank_factor * k candidates with the cached vectors;
+        None reranks when the index built is quantized (not when too few
+        documents made it fall back to flat)
+        n_shards: split the index into this many shards searched in parallel
+        cursor_*: bounds of the cache of ranked lists behind pagination cursors
+        cache_path: SQLite file of the embedding cache
+        hash_algo: content hash for change detection, None picks the fastest installed
+        collapse_duplicates: index documents with identical content once;
+        the copies are listed in each result's "duplicates"
+        snapshot_delay: seconds an update waits before the snapshot is written,
+        so that a burst of updates is persisted once
+        """
+        if passage_pooling not in PASSAGE_POOLING:
+            raise ValueError(f"Unknown passage pooling '{passage_pooling}', expected one of {PASSAGE_POOLING}")
+
+        if n_shards < 1:
+            raise ValueError("n_shards must be at least 1")
+
+        self.index_dir = Path(index_dir)
+        if model_name is None:
+            manifest = self._read_manifest() or {}
+            model_name = manifest.get("model", DEFAULT_MODEL)
+            model_revision = model_revision or manifest.get("model_revision") or None
+
+        self.embedder = EmbeddingGenerator(
+            model_name, model_revision=model_revision, cache_dtype=cache_dtype, cache_path=cache_path,
+            hash_algo=hash_algo
+        )
+        self.cache = self.embedder.cache  # Share one SQLite connection
         self.index = None
         self.doc_ids = []
-        self.doc_texts = {}
-        
-    def build_index(self, docs_dir: str = "data/docs"):
-        """Build FAISS index from documents"""
+        self.doc_id_map = {}
+        self.keywords = KeywordIndex()
+        self.metadata = MetadataStore()
+        self.files = {}
+        # Document texts live on disk (memory-mapped), not in a dict
+        self.doc_store = DocumentStore(self.index_dir / "docstore", compression=doc_store_compression)
+        self.chunking = None
+        if passage_window is not None:
+            self.chunking = {"window": passage_window, "stride": passage_stride or passage_window}
+        self.passage_pooling = passage_pooling
+        self.pooling_top_n = pooling_top_n
+        # FAISS id = document number << chunk bits | passage number
+        self._chunk_bits = CHUNK_BITS if self.chunking else 0
+        self.passages = {}  # doc_id -> (n, 2) passage char spans, passage mode only
+        self.collapse_duplicates = collapse_duplicates
+        self.duplicates = {}  # doc_id -> indexed doc_id with the same content, when collapsing
+        self._copies = {}  # indexed doc_id -> its duplicates
+        self._owners = {}  # content hash -> indexed doc_id
+        # FAISS ids of removed documents still in an index without removal
+        # (HNSW), excluded from searches by _tombstone_selector until compaction
+        self.tombstones = np.zeros(0, dtype='int64')
+        self._tombstone_selector = None
+        self._compaction_thread = None
+        self.index_config = {
+            "index_type": index_type,
+            "nlist": nlist,
+            "pq_m": pq_m,
+            "hnsw_m": hnsw_m,
+            "shards": n_shards,
+        }
+        self.rerank = rerank
+        self.rerank_factor = rerank_factor
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        # Searches share the lock, index mutations hold it exclusively
+        self._lock = ReadWriteLock()
+        self.snapshot_delay = snapshot_delay
+        self._snapshot_timer = None
+        self._snapshot_timer_lock = threading.Lock()
+        self._snapshot_write_lock = threading.Lock()  # One snapshot write at a time
+        # Bumped on every index change; part of the result cache key
+        self.index_version = 0
+        # Bumped when reembed() switches models; queries encoded across a switch are re-encoded
+        self.model_version = 0
+        self.reembed_status = None
+        self._reembed_thread = None
+        self._reembed_lock = threading.Lock()  # One re-embedding at a time, checked without the index lock
+        self.result_cache = None
+        if result_cache_size > 0:
+            self.result_cache = LRUCache(max_entries=result_cache_size, ttl_seconds=result_cache_ttl)
+        # Cursor token -> ranked hits of a paginated search
+        self.cursors = LRUCache(
+            max_entries=cursor_cache_size,
+            ttl_seconds=cursor_ttl,
+            max_bytes=64 * 1024 * 1024,
+            sizeof=lambda entry: 200 * len(entry["hits"])
+        )
+        # (filter key, index_version) -> (allowed doc_ids, FAISS IDSelector)
+        self._selectors = LRUCache(max_entries=64)
+
+    def build_index(self, docs_dir: str = "data/docs", force_rebuild: bool = False,
+                    chunk_size: int = 1000, num_workers: int = 1, num_readers: int = 1):
+        """
+        Build FAISS index from documents
+        Loads the on-disk snapshot instead when the corpus is unchanged
+        Embeddings are streamed into the index chunk_size documents at a time,
+        encoded by num_workers processes
+        Every file is read once (by num_readers threads); the same text feeds
+        the hash, the cache lookup, the document store and keyword statistics
+        A stale snapshot is rebuilt holding the document store's writer lock;
+        other engines on the same index_dir wait for it, then load the
+        snapshot it wrote. The lock is released once the snapshot is written
+        """
         docs_path = Path(docs_dir)
         doc_paths = sorted(docs_path.glob("*.txt"))
-        
+
         if not doc_paths:
             raise ValueError(f"No documents found in {docs_dir}")
-        
+
         print(f"Building index for {len(doc_paths)} documents...")
-        
-        # Get embeddings (from cache or generate)
-        embeddings_dict = self.embedder.embed_documents(doc_paths)
-        
-        # Load document texts
+
+        with self._lock.write():
+            files = self._scan_corpus(doc_paths)
+            self.keywords = KeywordIndex()
+            self.metadata.clear()
+
+            loaded = not force_rebuild and self._load_snapshot(files, doc_paths)
+            if not loaded:
+                # Another engine may be rebuilding: once it is done the
+                # reloaded store matches the snapshot it wrote
+                self.doc_store.acquire(timeout=STORE_LOCK_TIMEOUT)
+                loaded = not force_rebuild and self._load_snapshot(files, doc_paths)
+
+            if loaded:
+                self.doc_store.release()
+                if self.keywords is None:
+                    # Rebuild keyword statistics from the stored texts, not the corpus files
+                    self.keywords = KeywordIndex()
+                    for doc_id, text in self.doc_store.items():
+                        self.keywords.add(doc_id, text)
+                for doc_id in list(self.doc_id_map) + list(self.duplicates):
+                    self.metadata.add(doc_id)
+                self._index_changed()
+                print(f"✓ Index loaded from snapshot with {self.index.ntotal} documents")
+                return
+
+            # Stream embeddings (from cache or generate); texts go into the
+            # store and keyword statistics as the pipeline reads them. The
+            # old manifest goes first: a crash mid-build must not load it
+            self._snapshot_paths()[1].unlink(missing_ok=True)
+            self.doc_store.clear()
+            self._close_index()
+            self.index = None
+            self._set_tombstones(np.zeros(0, dtype='int64'))
+            self.doc_ids = []
+            self.doc_id_map = {}
+            self.passages = {}
+            self.duplicates = {}
+            self._copies = {}
+            self._owners = {}
+            hashes = {}
+            stream = self._iter_pipeline(
+                doc_paths, chunk_size, num_workers, num_readers, on_document=self._ingest_text
+            )
+
+            if needs_training(self.index_config["index_type"]):
+                # First pass fills the cache and keeps a training sample,
+                # second pass streams the vectors back out of the cache
+                dimension = self.embedder.dimension
+                index = self._new_index(dimension, len(doc_paths))
+                sampler = ReservoirSampler(sample_size(index))
+                for chunk in stream:
+                    for row in chunk:
+                        hashes[row[0]] = row[1]
+                        for vector in self._row_vectors(row):
+                            sampler.add(vector)
+                self.index = self._train_index(index, sampler.sample())
+
+                if self.chunking is None:
+                    stream = self._iter_cached(list(hashes.items()), chunk_size)
+                else:
+                    # Every passage is a cache hit now; texts come from the store
+                    stream = self._iter_texts(
+                        ((doc_id, self.doc_store.get(doc_id)) for doc_id in hashes), chunk_size, num_workers
+                    )
+
+            # Build FAISS index; position in doc_ids is the document number
+            for chunk in stream:
+                hashes.update(self._add_rows(chunk, len(doc_paths)))
+
+            for doc_id, info in files.items():
+                info["hash"] = hashes[doc_id]
+            self.files = files
+            self._index_changed()
+
+            print(f"✓ Index built with {self.index.ntotal} documents")
+
+        self.save_snapshot()
+        self.doc_store.release()
+
+        # Vectors of documents deleted or changed since the last build
+        pruned = self.cache.prune(keep_doc_ids=files)
+        if pruned:
+            print(f"✓ Pruned {pruned} unused cached embeddings")
+
+    def _iter_pipeline(self, doc_paths: List[Path], chunk_size: int = 1000, num_workers: int = 1,
+                       num_readers: int = 1, on_document=None):
+        """Embedding pipeline in document or passage mode, reading each file once"""
+        return self._iter_texts(
+            self.embedder.read_documents(doc_paths, chunk_size, num_readers),
+            chunk_size, num_workers, on_document
+        )
+
+    def _iter_texts(self, documents, chunk_size: int = 1000, num_workers: int = 1, on_document=None,
+                    embedder: Optional[EmbeddingGenerator] = None):
+        """
+        Embedding pipeline over (doc_id, text[, hash]) documents already read
+        embedder: another model's generator (re-embedding), default the active one
+        """
+        window = stride = None
+        if self.chunking is not None:
+            window, stride = self.chunking["window"], self.chunking["stride"]
+        return (embedder or self.embedder).iter_text_embeddings(
+            documents, chunk_size=chunk_size, num_workers=num_workers, window=window, stride=stride,
+            on_document=on_document
+        )
+
+    def _ingest_text(self, doc_id: str, text: str):
+        """Store a document's text and index its keywords and metadata"""
+        self.doc_store.put(doc_id, text)
+        self.keywords.add(doc_id, text)
+        self.metadata.add(doc_id)
+
+    def _row_vectors(self, row: tuple) -> np.ndarray:
+        """Vectors of one pipeline row: one per document or one per passage"""
+        if self.chunking is None:
+            return row[2].reshape(1, -1)
+        return row[3]
+
+    def _faiss_ids(self, num: int, count: int) -> np.ndarray:
+        """FAISS ids of a document's count vectors"""
+        return (np.int64(num) << self._chunk_bits) + np.arange(count, dtype='int64')
+
+    def _doc_faiss_ids(self, num: int) -> np.ndarray:
+        """FAISS ids of an indexed document"""
+        count = len(self.passages[self.doc_ids[num]]) if self.chunking else 1
+        return self._faiss_ids(num, count)
+
+    def _add_rows(self, rows: List[tuple], n_vectors: int) -> dict:
+        """
+        Assign document numbers to pipeline rows and add their vectors
+        Returns {doc_id: hash} of the added documents
+        """
+        hashes = {}
+        ids = []
+        vectors = []
+
+        for row in rows:
+            doc_id = row[0]
+            hashes[doc_id] = row[1]
+            if self.collapse_duplicates:
+                owner = self._owners.get(row[1])
+                if owner is not None:
+                    # Same content as an indexed document: share its vectors
+                    self.duplicates[doc_id] = owner
+                    self._copies.setdefault(owner, []).append(doc_id)
+                    continue
+                self._owners[row[1]] = doc_id
+
+            matrix = self._row_vectors(row)
+            if self.chunking is not None:
+                self.passages[doc_id] = row[2]
+
+            num = len(self.doc_ids)
+            self.doc_ids.append(doc_id)
+            self.doc_id_map[doc_id] = num
+            ids.append(self._faiss_ids(num, len(matrix)))
+            vectors.append(matrix)
+
+        if not ids:
+            return hashes
+
+        vectors = np.vstack(vectors).astype('float32')
+        if self.index is None:
+            self.index = self._new_index(vectors.shape[1], n_vectors)
+
+        self.index.add_with_ids(vectors, np.concatenate(ids))
+        return hashes
+
+    def _iter_cached(self, hashes: List[Tuple[str, str]], chunk_size: int):
+        """Stream (doc_id, hash, embedding) chunks back out of the embedding cache"""
+        for start in range(0, len(hashes), chunk_size):
+            chunk = hashes[start:start + chunk_size]
+            cached = self.cache.get_many(chunk)
+            yield [(doc_id, text_hash, cached[doc_id]) for doc_id, text_hash in chunk]
+
+    def _new_index(self, dimension: int, n_vectors: int, index_type: Optional[str] = None):
+        """
+        Create an empty index of the configured type (inner product = cosine similarity)
+        With several shards each one is sized for its share of n_vectors
+        """
+        config = dict(self.index_config)
+        configured_type = config.pop("index_type")
+        n_shards = config.pop("shards")
+        index_type = index_type or configured_type
+
+        if n_shards == 1:
+            return create_index(index_type, dimension, n_vectors, **config)
+
+        per_shard = max(1, n_vectors // n_shards)
+        return ShardedIndex.create(
+            n_shards, lambda: create_index(index_type, dimension, per_shard, **config), self._chunk_bits
+        )
+
+    def _close_index(self):
+        """Release the search threads of a sharded index about to be replaced"""
+        if isinstance(self.index, ShardedIndex):
+            self.index.close()
+
+    def _train_index(self, index, sample: np.ndarray):
+        """
+        Train approximate indexes on a sample of the cached embeddings
+        Falls back to a flat index when there is too little data to train
+        """
+        if index.is_trained:
+            return index
+
+        if not can_train(index, len(sample)):
+            print(f"⚠ Too few documents to train '{self.index_config['index_type']}' index, using flat index")
+            if isinstance(index, ShardedIndex):
+                index.close()
+            return self._new_index(index.d, len(sample), index_type="flat")
+
+        print(f"Training {self.index_config['index_type']} index on {len(sample)} vectors...")
+        index.train(sample)
+        return index
+
+    def add_documents(self, doc_paths: List[Path], persist: bool = True) -> int:
+        """
+        Add new or changed documents to the index without a full rebuild
+        Unchanged documents are skipped, only changed ones are embedded
+        persist: schedule a snapshot write (see save_snapshot)
+        Returns number of documents added or updated
+        """
+        if self.index is None:
+            raise ValueError("Index not built. Call build_index() first.")
+
+        doc_paths = [Path(p) for p in doc_paths]
+        paths = {doc_path.stem: doc_path for doc_path in doc_paths}
+        texts = {}
+        changed = []
+
+        # Files unchanged since they were last hashed are not read at all,
+        # others are read once and go straight into the pipeline
+        for doc_id, text, text_hash in self.embedder.read_documents(doc_paths, skip_unchanged=True):
+            doc_path = paths[doc_id]
+            entry = self.files.get(doc_id)
+            if self._is_indexed(doc_id) and entry is not None and entry["hash"] == text_hash:
+                continue
+
+            if text is None:
+                _, text, _ = read_document(doc_path)
+            texts[doc_id] = (text, text_hash)
+            changed.append(doc_path)
+
+        if not changed:
+            return 0
+
+        documents = [(doc_path.stem,) + texts[doc_path.stem] for doc_path in changed]
+        model_version = self.model_version
+        rows = [row for chunk in self._iter_texts(documents) for row in chunk]
+
+        with self._lock.write():
+            if self.model_version != model_version:
+                # reembed() switched models while embedding
+                rows = [row for chunk in self._iter_texts(documents) for row in chunk]
+
+            # Drop stale vectors of updated documents first
+            self._release_docs([doc_id for doc_id in texts if self._is_indexed(doc_id)])
+
+            self._add_rows(rows, len(rows))
+
+            for doc_path in changed:
+                doc_id = doc_path.stem
+                text, text_hash = texts[doc_id]
+                self.doc_store.put(doc_id, text)
+                self.keywords.add(doc_id, text)
+                self.metadata.add(doc_id)
+                stat = doc_path.stat()
+                self.files[doc_id] = {
+                    "size": stat.st_size,
+                    "mtime_ns": stat.st_mtime_ns,
+                    "hash": text_hash,
+                }
+
+            self._index_changed()
+
+            if persist:
+                self._schedule_snapshot()
+
+        print(f"✓ Index updated with {len(changed)} documents ({self.index.ntotal} total)")
+        return len(changed)
+
+    def update_document(self, doc_path: Path, persist: bool = True) -> bool:
+        """Re-index a single document if its content changed"""
+        return self.add_documents([doc_path], persist=persist) > 0
+
+    def remove_document(self, doc_id: str, persist: bool = True) -> bool:
+        """Remove a document from the index, returns False if unknown"""
+        with self._lock.write():
+            if not self._is_indexed(doc_id):
+                return False
+
+            self._release_docs([doc_id])
+            self.doc_store.remove(doc_id)
+            self.keywords.remove(doc_id)
+            self.metadata.remove(doc_id)
+            self.files.pop(doc_id, None)
+            self._index_changed()
+
+            if persist:
+                self._schedule_snapshot()
+
+        return True
+
+    def _index_changed(self):
+        """Invalidate cached result sets and filter selectors after any index mutation"""
+        self.index_version += 1
+        if self.result_cache is not None:
+            self.result_cache.clear()
+        self._selectors.clear()
+
+    def _is_indexed(self, doc_id: str) -> bool:
+        """Document has vectors in the index, or shares those of a duplicate"""
+        return doc_id in self.doc_id_map or doc_id in self.duplicates
+
+    def _release_docs(self, doc_ids: List[str]):
+        """
+        Take documents out of the index: duplicates are just forgotten, an
+        indexed document with duplicates hands its slot (and vectors) to
+        one of them, any other has its vectors removed
+        """
+        nums = []
+        for doc_id in doc_ids:
+            owner = self.duplicates.pop(doc_id, None)
+            if owner is not None:
+                self._copies[owner].remove(doc_id)
+                if not self._copies[owner]:
+                    del self._copies[owner]
+                continue
+
+            num = self.doc_id_map[doc_id]
+            text_hash = self.files.get(doc_id, {}).get("hash")
+            copies = self._copies.pop(doc_id, None)
+            if not copies:
+                if self._owners.get(text_hash) == doc_id:
+                    del self._owners[text_hash]
+                nums.append(num)
+                continue
+
+            heir = copies.pop(0)
+            del self.duplicates[heir]
+            for copy in copies:
+                self.duplicates[copy] = heir
+            if copies:
+                self._copies[heir] = copies
+            self.doc_ids[num] = heir
+            del self.doc_id_map[doc_id]
+            self.doc_id_map[heir] = num
+            if self.chunking is not None:
+                self.passages[heir] = self.passages.pop(doc_id)
+            self._owners[text_hash] = heir
+
+        if nums:
+            self._remove_docs(nums)
+
+    def _remove_docs(self, nums: List[int]):
+        """
+        Remove documents' vectors and tombstone their doc_ids slots
+        An HNSW graph cannot drop vectors, they are tombstoned instead and
+        the index is compacted in the background past COMPACTION_THRESHOLD
+        """
+        ids = np.concatenate([self._doc_faiss_ids(num) for num in nums])
+        if supports_removal(self.index):
+            self.index.remove_ids(ids)
+        else:
+            self._set_tombstones(np.union1d(self.tombstones, ids))
+            if len(self.tombstones) > COMPACTION_THRESHOLD * self.index.ntotal:
+                self._start_compaction()
+
+        for num in nums:
+            doc_id = self.doc_ids[num]
+            self.doc_ids[num] = None
+            self.doc_id_map.pop(doc_id, None)
+            self.passages.pop(doc_id, None)
+
+    def _set_tombstones(self, ids: np.ndarray):
+        """Replace the tombstoned FAISS ids and the selector hiding them"""
+        self.tombstones = ids
+        self._tombstone_selector = exclusion_selector(ids) if len(ids) else None
+
+    def _start_compaction(self):
+        """Run _compact_index on a thread unless one is already running"""
+        if self._compaction_thread is not None and self._compaction_thread.is_alive():
+            return
+        self._compaction_thread = threading.Thread(target=self._compact_index, name="index-compaction", daemon=True)
+        self._compaction_thread.start()
+
+    def _compact_index(self):
+        """
+        Rebuild the index without its tombstoned vectors: live vectors are
+        copied out under the shared lock and the new index is built without
+        the lock. The swap, under the exclusive lock, first replays what
+        changed meanwhile: vectors added since the copy are copied over,
+        those removed since are tombstoned in the new index
+        """
+        with self._lock.read():
+            if not len(self.tombstones):
+                return
+            source = self.index
+            keep = self._live_faiss_ids()
+            vectors = source.reconstruct_batch(keep) if len(keep) else None
+            dimension = source.d
+
+        if vectors is None:
+            index = self._new_index(dimension, 0)
+        else:
+            index = self._new_index(dimension, len(vectors))
+            index = self._train_index(index, training_sample(vectors, index))
+            index.add_with_ids(vectors, keep)
+
+        with self._lock.write():
+            if self.index is not source:
+                # Replaced meanwhile (rebuild, re-embedding) by an index built from live documents
+                if isinstance(index, ShardedIndex):
+                    index.close()
+                return
+
+            live = self._live_faiss_ids()
+            added = np.setdiff1d(live, keep)
+            if len(added):
+                index.add_with_ids(source.reconstruct_batch(added), added)
+            self._close_index()
+            self.index = index
+            self._set_tombstones(np.setdiff1d(keep, live))
+            self._index_changed()
+            self._schedule_snapshot()
+
+    def _live_faiss_ids(self) -> np.ndarray:
+        """FAISS ids of every indexed document's vectors"""
+        ids = [self._doc_faiss_ids(num) for num, doc_id in enumerate(self.doc_ids) if doc_id is not None]
+        return np.concatenate(ids) if ids else np.zeros(0, dtype='int64')
+
+    def _cached_vectors(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact (FAISS ids, vectors) of everything indexed, read back from the cache"""
+        ids = []
+        vectors = []
+
+        if self.chunking is None:
+            cached = self.cache.get_many((doc_id, self.files[doc_id]["hash"]) for doc_id in self.doc_id_map)
+            for doc_id, num in self.doc_id_map.items():
+                ids.append(num)
+                vectors.append(cached[doc_id])
+        else:
+            keys = []
+            for doc_id in self.doc_id_map:
+                text = self.doc_store.get(doc_id)
+                for chunk_no, (start, end) in enumerate(self.passages[doc_id]):
+                    keys.append((doc_id, chunk_no, self.embedder.compute_hash(text[start:end])))
+            cached = self.cache.get_passages_many(keys)
+            for doc_id, chunk_no, _ in keys:
+                ids.append((self.doc_id_map[doc_id] << self._chunk_bits) + chunk_no)
+                vectors.append(cached[(doc_id, chunk_no)])
+
+        return np.array(ids, dtype='int64'), np.array(vectors).astype('float32')
+
+    def _scan_corpus(self, doc_paths: List[Path]) -> dict:
+        """Stat every document: {doc_id: {size, mtime_ns}}"""
+        files = {}
+        for doc_path in doc_paths:
+            stat = doc_path.stat()
+            files[doc_path.stem] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        return files
+
+    def _snapshot_paths(self) -> Tuple[Path, Path]:
+        """Paths of the snapshot index file and manifest"""
+        return self.index_dir / "index.faiss", self.index_dir / "manifest.json"
+
+    def _shards_dir(self) -> Path:
+        """Shard files and layout.json of a sharded snapshot"""
+        return self.index_dir / "shards"
+
+    def _passages_path(self) -> Path:
+        """Passage spans of the snapshot (passage mode only)"""
+        return self.index_dir / "passages.npz"
+
+    def _keywords_path(self) -> Path:
+        """Keyword index of the snapshot"""
+        return self.index_dir / "keywords.npz"
+
+    def _read_manifest(self) -> Optional[dict]:
+        """Read snapshot manifest, None if missing or unreadable"""
+        _, manifest_path = self._snapshot_paths()
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _load_snapshot(self, files: dict, doc_paths: List[Path]) -> bool:
+        """
+        Load index from snapshot if its manifest matches the corpus
+        Files whose size/mtime changed are re-hashed, so a touched but
+        unmodified file does not invalidate the snapshot; the cache's file
+        manifest spares re-reading files already hashed since
+        The keyword index is loaded too, or set to None when it must be rebuilt
+        """
+        index_path, _ = self._snapshot_paths()
+        manifest = self._read_manifest()
+        sharded = self.index_config["shards"] > 1
+
+        if manifest is None or not (sharded or index_path.exists()):
+            return False
+
+        if manifest.get("version") != SNAPSHOT_VERSION:
+            return False
+
+        if manifest.get("model") != self.embedder.model_name:
+            return False
+
+        if manifest.get("model_revision", "") != self.embedder.model_revision:
+            return False
+
+        # Manifest hashes are compared with freshly computed ones
+        if manifest.get("hash_algo", "sha256") != self.embedder.hasher.algorithm:
+            return False
+
+        if manifest.get("index_config") != self.index_config:
+            return False
+
+        if manifest.get("chunking") != self.chunking:
+            return False
+
+        stored = manifest.get("files", {})
+        if stored.keys() != files.keys():
+            return False
+
+        touched = []
         for doc_path in doc_paths:
             doc_id = doc_path.stem
-            with open(doc_path, 'r', encoding='utf-8') as f:
-                self.doc_texts[doc_id] = f.read()
-        
-        # Build FAISS index
-        self.doc_ids = list(embeddings_dict.keys())
-        embeddings_matrix = np.array([embeddings_dict[doc_id] for doc_id in self.doc_ids])
-        
-        dimension = embeddings_matrix.shape[1]
-        self.index = faiss.IndexFlatIP(dimension)  # Inner product (cosine similarity)
-        self.index.add(embeddings_matrix.astype('float32'))
-        
-        print(f"✓ Index built with {self.index.ntotal} documents")
-    
-    def search(self, query: str, top_k: int = 5) -> List[dict]:
+            info, entry = files[doc_id], stored[doc_id]
+            info["hash"] = entry["hash"]
+            if entry["size"] != info["size"] or entry["mtime_ns"] != info["mtime_ns"]:
+                touched.append(doc_path)
+
+        for doc_id, _, text_hash in self.embedder.read_documents(touched, skip_unchanged=True):
+            if stored[doc_id]["hash"] != text_hash:
+                return False
+
+        if sharded:
+            # Shards are read from disk on first use
+            index = ShardedIndex.load(self._shards_dir())
+            if index is None or index.n_shards != self.index_config["shards"]:
+                return False
+        else:
+            index = faiss.read_index(str(index_path))
+        doc_ids = manifest["doc_ids"]
+        doc_id_map = {doc_id: idx for idx, doc_id in enumerate(doc_ids) if doc_id is not None}
+
+        passages = {}
+        if self.chunking is not None:
+            try:
+                stored_spans = np.load(self._passages_path())
+            except (OSError, ValueError):
+                return False
+            counts, spans = stored_spans["counts"], stored_spans["spans"]
+            offsets = np.concatenate([[0], np.cumsum(counts)])
+            for num, doc_id in enumerate(doc_ids):
+                if doc_id is not None:
+                    passages[doc_id] = spans[offsets[num]:offsets[num + 1]]
+
+        n_vectors = sum(len(spans) for spans in passages.values()) if self.chunking else len(doc_id_map)
+        tombstones = np.array(manifest.get("tombstones", []), dtype='int64')
+        if index.ntotal != n_vectors + len(tombstones):
+            return False
+
+        # Present (possibly empty) exactly when the snapshot collapsed duplicates
+        duplicates = manifest.get("duplicates")
+        if (duplicates is not None) != self.collapse_duplicates:
+            return False
+        duplicates = duplicates or {}
+        if any(owner not in doc_id_map for owner in duplicates.values()):
+            return False
+
+        stored_docs = list(doc_id_map) + list(duplicates)
+        if len(self.doc_store) != len(stored_docs) or any(doc_id not in self.doc_store for doc_id in stored_docs):
+            return False
+
+        self._close_index()
+        self.index = index
+        self.doc_ids = doc_ids
+        self.doc_id_map = doc_id_map
+        self.passages = passages
+        self._set_tombstones(tombstones)
+        self.files = files
+        self.duplicates = duplicates
+        self._copies = {}
+        for doc_id, owner in duplicates.items():
+            self._copies.setdefault(owner, []).append(doc_id)
+        self._owners = {}
+        if self.collapse_duplicates:
+            self._owners = {files[doc_id]["hash"]: doc_id for doc_id in doc_id_map}
+
+        # Written with the snapshot under the tag its manifest records
+        self.keywords = None
+        if manifest.get("keywords"):
+            keywords = KeywordIndex.load(self._keywords_path(), manifest["keywords"])
+            if keywords is not None and keywords.doc_nums.keys() == set(stored_docs):
+                self.keywords = keywords
+        return True
+
+    def save_snapshot(self):
+        """
+        Write the snapshot now, replacing a scheduled write
+        Searches keep running meanwhile; index mutations wait for it
+        """
+        with self._snapshot_timer_lock:
+            if self._snapshot_timer is not None:
+                self._snapshot_timer.cancel()
+                self._snapshot_timer = None
+
+        with self._snapshot_write_lock, self._lock.read():
+            self._save_snapshot()
+
+    def flush_snapshot(self):
+        """Write a scheduled snapshot at once, no-op when none is pending"""
+        with self._snapshot_timer_lock:
+            pending = self._snapshot_timer is not None
+        if pending:
+            self.save_snapshot()
+
+    def _schedule_snapshot(self):
+        """
+        Write the snapshot snapshot_delay seconds from now on a timer thread,
+        unless a write is already scheduled (it will include this change)
+        """
+        with self._snapshot_timer_lock:
+            if self._snapshot_timer is None:
+                self._snapshot_timer = threading.Timer(self.snapshot_delay, self.flush_snapshot)
+                self._snapshot_timer.daemon = True
+                self._snapshot_timer.start()
+
+    def _save_snapshot(self):
+        """
+        Write index file, keyword index and manifest atomically (manifest
+        last); called with the lock held
+        """
+        index_path, manifest_path = self._snapshot_paths()
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        # Ties the keyword file to this manifest; dead postings are compacted as it is written
+        keywords_tag = secrets.token_hex(8)
+        self.keywords.save(self._keywords_path(), keywords_tag)
+
+        manifest = {
+            "version": SNAPSHOT_VERSION,
+            "model": self.embedder.model_name,
+            "model_revision": self.embedder.model_revision,
+            "hash_algo": self.embedder.hasher.algorithm,
+            "index_config": self.index_config,
+            "search_params": {"nprobe": self.nprobe, "ef_search": self.ef_search},
+            "chunking": self.chunking,
+            "doc_ids": self.doc_ids,
+            "files": self.files,
+            "duplicates": self.duplicates if self.collapse_duplicates else None,
+            "tombstones": self.tombstones.tolist(),
+            "keywords": keywords_tag,
+        }
+
+        if isinstance(self.index, ShardedIndex):
+            self.index.save(self._shards_dir())
+        else:
+            tmp_index = index_path.with_suffix(".faiss.tmp")
+            faiss.write_index(self.index, str(tmp_index))
+            os.replace(tmp_index, index_path)
+
+        if self.chunking is not None:
+            empty = np.zeros((0, 2), dtype=np.int64)
+            spans = [self.passages[doc_id] if doc_id is not None else empty for doc_id in self.doc_ids]
+            passages_path = self._passages_path()
+            tmp_passages = passages_path.with_suffix(".tmp.npz")
+            np.savez(
+                tmp_passages,
+                counts=np.array([len(span) for span in spans], dtype=np.int64),
+                spans=np.concatenate(spans) if spans else empty
+            )
+            os.replace(tmp_passages, passages_path)
+
+        if self.doc_store.dead_space() > COMPACTION_THRESHOLD:
+            self.doc_store.compact()
+        else:
+            self.doc_store.flush()
+
+        tmp_manifest = manifest_path.with_suffix(".json.tmp")
+        with open(tmp_manifest, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_manifest, manifest_path)
+
+    def search(self, query: str, top_k: int = 5, nprobe: Optional[int] = None,
+               ef_search: Optional[int] = None, mode: str = "vector", fusion: str = "rrf",
+               alpha: float = 0.5, filters: Optional[Filters] = None,
+               timings: Optional[dict] = None) -> List[dict]:
         """
         Search for similar documents
+        mode: vector (semantic), keyword (BM25) or hybrid (both, fused)
+        nprobe (IVF) and ef_search (HNSW) trade latency for recall per query
+        filters: {"category": value or [values]}, e.g. {"category": "rec.sport"}
+        timings: dict that receives milliseconds per search stage
         Returns list of {doc_id, score, preview, explanation}
         """
+        return self.search_many(
+            [query], top_k, nprobe=nprobe, ef_search=ef_search, mode=mode, fusion=fusion, alpha=alpha,
+            filters=filters, timings=timings
+        )[0]
+
+    def search_many(self, queries: List[str], top_k: int = 5, nprobe: Optional[int] = None,
+                    ef_search: Optional[int] = None, mode: str = "vector", fusion: str = "rrf",
+                    alpha: float = 0.5, filters: Optional[Filters] = None,
+                    timings: Optional[dict] = None) -> List[List[dict]]:
+        """
+        Search several queries with one batched encode and one index search
+        Hybrid mode fuses vector and BM25 candidate lists with reciprocal-rank
+        fusion ("rrf") or alpha-weighted normalized scores ("weighted")
+        Metadata filters are applied inside the FAISS search via an IDSelector
+        Every stage is timed into the metrics registry and, when given, timings
+        Returns one result list per query, in input order
+        """
+        self._check_search_args(mode, fusion, filters)
+
+        if not queries:
+            return []
+
+        # Serve repeated queries from the result cache
+        results = [None] * len(queries)
+        keys = [None] * len(queries)
+        if self.result_cache is not None:
+            with stage_timer("result_cache", timings):
+                for i, query in enumerate(queries):
+                    keys[i] = (normalize_query(query), top_k, nprobe, ef_search, mode, fusion, alpha,
+                               filter_key(filters), self.index_version)
+                    results[i] = self.result_cache.get(keys[i])
+
+        pending = [i for i, result in enumerate(results) if result is None]
+        SEARCH_QUERIES.inc(len(queries) - len(pending), mode=mode, cache="hit")
+        SEARCH_QUERIES.inc(len(pending), mode=mode, cache="miss")
+        if not pending:
+            return results
+        pending_queries = [queries[i] for i in pending]
+
+        query_embeddings = None
+        model_version = self.model_version
+        if mode != "keyword":
+            with stage_timer("encode", timings):
+                query_embeddings = self._embed_queries(pending_queries)
+
+        with self._lock.read():
+            if query_embeddings is not None and self.model_version != model_version:
+                # reembed() switched models while encoding
+                query_embeddings = self._embed_queries(pending_queries)
+            ranked = self._rank(pending_queries, query_embeddings, top_k, nprobe, ef_search,
+                                mode, fusion, alpha, filters, timings=timings)
+
+            with stage_timer("build_results", timings):
+                for i, (hits, best_passages) in zip(pending, ranked):
+                    results[i] = self._build_results(queries[i], hits, best_passages)
+                    if self.result_cache is not None and keys[i][-1] == self.index_version:
+                        self.result_cache.set(keys[i], results[i])
+
+        return results
+
+    def search_page(self, query: Optional[str] = None, page_size: int = 10, cursor: Optional[str] = None,
+                    depth: int = PAGINATION_DEPTH, min_score: Optional[float] = None,
+                    nprobe: Optional[int] = None, ef_search: Optional[int] = None, mode: str = "vector",
+                    fusion: str = "rrf", alpha: float = 0.5, filters: Optional[Filters] = None) -> dict:
+        """
+        One page of a ranked result list
+        The first call ranks up to depth results once and caches the list;
+        the returned cursor ("<token>:<offset>") serves later pages from it
+        without re-embedding or re-searching, and other parameters are then
+        ignored. min_score switches the vector candidates to a range search
+        keeping every hit above the score (up to depth documents)
+        Returns {results, next_cursor (None on the last page), total}
+        """
+        if page_size <= 0:
+            raise ValueError("page_size must be positive")
+
+        if cursor is not None:
+            token, offset = self._parse_cursor(cursor)
+            entry = self.cursors.get(token)
+            if entry is None:
+                raise CursorExpired(f"Cursor '{cursor}' is unknown or expired")
+        else:
+            if query is None:
+                raise ValueError("query or cursor is required")
+            if depth < page_size:
+                raise ValueError("depth must be at least page_size")
+            self._check_search_args(mode, fusion, filters)
+
+            model_version = self.model_version
+            query_embeddings = self._embed_queries([query]) if mode != "keyword" else None
+            with self._lock.read():
+                if query_embeddings is not None and self.model_version != model_version:
+                    query_embeddings = self._embed_queries([query])
+                (hits, best_passages), = self._rank([query], query_embeddings, depth, nprobe, ef_search,
+                                                    mode, fusion, alpha, filters, min_score)
+            token, offset = secrets.token_urlsafe(16), 0
+            entry = {"query": query, "hits": hits, "best_passages": best_passages}
+            self.cursors.set(token, entry)
+
+        hits = entry["hits"]
+        with self._lock.read():
+            # Documents removed since the list was ranked are left out of the page
+            page = [(doc_id, score, dict(explanation))
+                    for doc_id, score, explanation in hits[offset:offset + page_size]
+                    if self._is_indexed(doc_id)]
+            results = self._build_results(entry["query"], page, entry["best_passages"])
+
+        next_offset = offset + page_size
+        return {
+            "results": results,
+            "next_cursor": f"{token}:{next_offset}" if next_offset < len(hits) else None,
+            "total": len(hits),
+        }
+
+    def _check_search_args(self, mode: str, fusion: str, filters: Optional[Filters]):
+        """Raise ValueError for searches that cannot run"""
         if self.index is None:
             raise ValueError("Index not built. Call build_index() first.")
-        
-        # Embed query
-        query_embedding = self.embedder.embed_text(query)
-        query_embedding = query_embedding.reshape(1, -1).astype('float32')
-        
-        # Search
-        scores, indices = self.index.search(query_embedding, top_k)
-        
-        # Prepare results
+
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode '{mode}', expected one of {SEARCH_MODES}")
+
+        if mode == "hybrid" and fusion not in FUSION_METHODS:
+            raise ValueError(f"Unknown fusion method '{fusion}', expected one of {FUSION_METHODS}")
+
+        self.metadata.validate(filters)
+
+    def _parse_cursor(self, cursor: str) -> Tuple[str, int]:
+        """Split "<token>:<offset>", ValueError if malformed"""
+        token, _, offset = cursor.rpartition(':')
+        if not token or not offset.isdigit():
+            raise ValueError(f"Malformed cursor '{cursor}'")
+        return token, int(offset)
+
+    def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        """Query matrix (single queries may be coalesced by the embedder's batcher)"""
+        if len(queries) == 1:
+            query_embeddings = self.embedder.embed_text(queries[0]).reshape(1, -1)
+        else:
+            query_embeddings = self.embedder.embed_texts(queries)
+        return query_embeddings.astype('float32')
+
+    def _rank(self, queries: List[str], query_embeddings: Optional[np.ndarray], top_k: int,
+              nprobe: Optional[int], ef_search: Optional[int], mode: str, fusion: str, alpha: float,
+              filters: Optional[Filters], min_score: Optional[float] = None,
+              timings: Optional[dict] = None) -> List[Tuple[list, dict]]:
+        """
+        Ranked (doc_id, score, explanation) hits and best passages per query
+        Called with the lock held (shared); query_embeddings is None in keyword mode
+        """
+        with stage_timer("filter", timings):
+            allowed, selector, selected_ids = self._filter_selector(filters)
+        if allowed is not None and not allowed:
+            return [([], {}) for _ in queries]
+
+        # Hybrid fuses deeper candidate lists than it returns
+        candidates = top_k if mode == "vector" else max(top_k * HYBRID_CANDIDATE_FACTOR, 50)
+        # Several passages of one document may rank together
+        fetch = candidates * PASSAGE_OVERFETCH if self.chunking else candidates
+        rerank = self.rerank if self.rerank is not None else is_quantized(self.index)
+        if rerank:
+            fetch *= self.rerank_factor
+
+        post_filter = selector is not None and not supports_selector(self.index)
+        if post_filter:
+            # Filter the hits afterwards, fetching deep enough that the
+            # selected share of the index still fills the candidate list
+            ntotal = self.index.ntotal
+            fetch = min(ntotal, -(-fetch * ntotal // len(selected_ids)))
+            selector = None
+        if allowed is None:
+            # Filter selectors only cover live documents already
+            selector = self._tombstone_selector
+
+        if mode != "keyword":
+            with stage_timer("vector_search", timings):
+                params = search_params(
+                    self.index, nprobe=nprobe or self.nprobe, ef_search=ef_search or self.ef_search,
+                    selector=selector, k=fetch,
+                    n_selected=len(selected_ids) if selector is not None and allowed is not None else None
+                )
+                if min_score is None:
+                    scores, indices = self.index.search(query_embeddings, fetch, params=params)
+                else:
+                    scores, indices = self._range_search(query_embeddings, min_score, fetch, params)
+                if post_filter:
+                    rejected = ~np.isin(indices, selected_ids)
+                    scores[rejected] = -np.inf
+                    indices[rejected] = -1
+            if rerank:
+                with stage_timer("rerank", timings):
+                    scores, indices = self._rerank(query_embeddings, scores, indices)
+
+        ranked = []
+        for row, query in enumerate(queries):
+            vector_hits, best_passages = [], {}
+            if mode != "keyword":
+                with stage_timer("pooling", timings):
+                    vector_hits, best_passages = self._pool_hits(scores[row], indices[row], candidates, allowed)
+
+            if mode == "vector":
+                hits = [(doc_id, score, {"semantic_similarity": score})
+                        for doc_id, score in vector_hits]
+            elif mode == "keyword":
+                with stage_timer("keyword_search", timings):
+                    keyword_hits = self.keywords.search(query, top_k, allowed)
+                hits = [(doc_id, score, {"semantic_similarity": None, "bm25_score": score})
+                        for doc_id, score in keyword_hits]
+            else:
+                with stage_timer("keyword_search", timings):
+                    keyword_hits = self.keywords.search(query, candidates, allowed)
+                with stage_timer("fusion", timings):
+                    vector_scores = dict(vector_hits)
+                    keyword_scores = dict(keyword_hits)
+                    hits = [
+                        (doc_id, score, {
+                            "semantic_similarity": vector_scores.get(doc_id),
+                            "bm25_score": keyword_scores.get(doc_id),
+                        })
+                        for doc_id, score in fuse(vector_hits, keyword_hits, fusion, alpha)[:top_k]
+                    ]
+            ranked.append((hits, best_passages))
+
+        return ranked
+
+    def _range_search(self, query_embeddings: np.ndarray, min_score: float, limit: int,
+                      params) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        All vectors scoring above min_score, best first and capped at limit,
+        padded like a k-NN result (-1 ids); indexes without range search
+        fall back to a k-NN search of limit cut at min_score
+        """
+        try:
+            lims, distances, labels = self.index.range_search(query_embeddings, min_score, params=params)
+        except RuntimeError:
+            scores, indices = self.index.search(query_embeddings, limit, params=params)
+            indices[scores <= min_score] = -1
+            return scores, indices
+
+        scores = np.full((len(query_embeddings), limit), -np.inf, dtype='float32')
+        indices = np.full((len(query_embeddings), limit), -1, dtype='int64')
+        for row in range(len(query_embeddings)):
+            row_scores = distances[lims[row]:lims[row + 1]]
+            order = np.argsort(-row_scores, kind="stable")[:limit]
+            scores[row, :len(order)] = row_scores[order]
+            indices[row, :len(order)] = labels[lims[row]:lims[row + 1]][order]
+        return scores, indices
+
+    def _filter_selector(self, filters: Optional[Filters]):
+        """
+        (allowed doc_ids, IDSelector over their FAISS ids, those ids) for a
+        filter, (None, None, None) without filters; cached per filter and
+        index version
+        """
+        key = filter_key(filters)
+        if key is None:
+            return None, None, None
+
+        cache_key = (key, self.index_version)
+        cached = self._selectors.get(cache_key)
+        if cached is not None:
+            return cached
+
+        allowed = {doc_id for doc_id in self.metadata.match(filters) if self._is_indexed(doc_id)}
+        selector = ids = None
+        if allowed:
+            # A duplicate is searched through the vectors it shares
+            nums = {self.doc_id_map[self.duplicates.get(doc_id, doc_id)] for doc_id in allowed}
+            ids = np.sort(np.concatenate([self._doc_faiss_ids(num) for num in nums]))
+            selector = id_selector(ids)
+        self._selectors.set(cache_key, (allowed, selector, ids))
+        return allowed, selector, ids
+
+    def _rerank(self, query_embeddings: np.ndarray, scores: np.ndarray,
+                indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Rescore quantized-index candidates with the vectors in the embedding cache
+        and re-sort each row; candidates missing from the cache keep their score
+        """
+        mask = (1 << self._chunk_bits) - 1
+        keys = {}
+        for idx in np.unique(indices):
+            if idx < 0:
+                continue
+            doc_id = self.doc_ids[int(idx) >> self._chunk_bits]
+            keys[int(idx)] = doc_id if self.chunking is None else (doc_id, int(idx) & mask)
+
+        if self.chunking is None:
+            cached = self.cache.get_many(
+                (doc_id, self.files.get(doc_id, {}).get("hash")) for doc_id in keys.values()
+            )
+        else:
+            cached = self.cache.get_passages_many((doc_id, chunk_no, None) for doc_id, chunk_no in keys.values())
+
+        scores = scores.copy()
+        indices = indices.copy()
+        for row in range(len(indices)):
+            for col, idx in enumerate(indices[row]):
+                vector = cached.get(keys.get(int(idx)))
+                if vector is not None:
+                    scores[row, col] = np.dot(query_embeddings[row], vector)
+            order = np.argsort(-scores[row], kind="stable")
+            scores[row] = scores[row][order]
+            indices[row] = indices[row][order]
+
+        return scores, indices
+
+    def _pool_hits(self, scores: np.ndarray, indices: np.ndarray, limit: int,
+                   allowed: Optional[Set[str]] = None) -> Tuple[List[Tuple[str, float]], dict]:
+        """
+        Map one row of FAISS output to ranked (doc_id, score) document hits
+        In passage mode passages are pooled per document (max or sum of top n)
+        and the best passage of each document is returned as {doc_id: chunk_no}
+        allowed: filtered doc_ids; a hit on a document outside it is reported
+        as its allowed duplicate
+        """
+        mask = (1 << self._chunk_bits) - 1
+        pooled = {}
+        pooled_count = {}
+        best_passages = {}
+
+        # FAISS returns hits best first, so a document's first hit is its best passage
+        for score, idx in zip(scores, indices):
+            if idx < 0:  # Fewer than top_k documents indexed
+                continue
+            doc_id = self.doc_ids[int(idx) >> self._chunk_bits]
+            if allowed is not None and doc_id not in allowed:
+                doc_id = next(copy for copy in self._copies.get(doc_id, ()) if copy in allowed)
+            if doc_id not in pooled:
+                pooled[doc_id] = float(score)
+                pooled_count[doc_id] = 1
+                if self.chunking is not None:
+                    best_passages[doc_id] = int(idx) & mask
+            elif self.passage_pooling == "sum" and pooled_count[doc_id] < self.pooling_top_n:
+                pooled[doc_id] += float(score)
+                pooled_count[doc_id] += 1
+
+        ranked = sorted(pooled.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return ranked, best_passages
+
+    def _build_results(self, query: str, hits: List[Tuple[str, float, dict]],
+                       best_passages: Optional[dict] = None) -> List[dict]:
+        """
+        Turn ranked (doc_id, score, explanation) hits into result dicts
+        Previews show the best matching passage when one is known and still
+        exists (a cursor's ranked list may predate an update of the document)
+        """
         results = []
-        query_words = set(query.lower().split())
-        
-        for score, idx in zip(scores[0], indices[0]):
-            doc_id = self.doc_ids[idx]
-            text = self.doc_texts[doc_id]
-            
-            # Generate explanation
-            doc_words = set(text.lower().split())
-            overlap = query_words & doc_words
-            overlap_ratio = len(overlap) / len(query_words) if query_words else 0
-            
+        query_words, query_ids = self.keywords.query_terms(query)
+        best_passages = best_passages or {}
+
+        for doc_id, score, explanation in hits:
+            text = self.doc_store.get(doc_id) or ""
+
+            chunk_no = best_passages.get(doc_id)
+            spans = self.passages.get(self.duplicates.get(doc_id, doc_id))
+            if chunk_no is not None and spans is not None and chunk_no < len(spans):
+                start, end = spans[chunk_no]
+                text = text[start:end]
+                explanation["best_passage"] = chunk_no
+
             # Preview (first 150 chars)
             preview = text[:150] + "..." if len(text) > 150 else text
-            
-            results.append({
+
+            # Complete explanation from precomputed keyword statistics
+            explanation.update(self.keywords.explain(doc_id, query_words, query_ids))
+
+            result = {
                 "doc_id": doc_id,
                 "score": float(score),
                 "preview": preview,
-                "explanation": {
-                    "semantic_similarity": float(score),
-                    "keyword_overlap": list(overlap)[:5],  # Top 5 overlapping words
-                    "overlap_ratio": round(overlap_ratio, 2),
-                    "doc_length": len(text.split())
-                }
-            })
-        
+                "explanation": explanation
+            }
+            if self.collapse_duplicates:
+                owner = self.duplicates.get(doc_id, doc_id)
+                result["duplicates"] = [other for other in [owner] + self._copies.get(owner, []) if other != doc_id]
+            results.append(result)
+
         return results
-    
+
+    def reembed(self, model_name: str, model_revision: Optional[str] = None, chunk_size: int = 1000,
+                num_workers: int = 1, switch: bool = True, background: bool = True) -> dict:
+        """
+        Embed the indexed documents with another model into its own cache
+        namespace while the current model keeps serving searches
+        switch: then build an index of the new vectors and swap model and
+        index in one step (and persist the snapshot)
+        background: run on a thread and return at once; progress is in
+        reembed_status
+        Returns reembed_status
+        """
+        if self.index is None:
+            raise ValueError("Index not built. Call build_index() first.")
+
+        with self._reembed_lock:
+            if self.reembed_status is not None and self.reembed_status["state"] not in ("done", "failed"):
+                raise ValueError("A re-embedding is already running")
+            self.reembed_status = {
+                "model": model_name,
+                "revision": model_revision or "",
+                "state": "loading",
+                "switch": switch,
+                "passes": 0,
+                "documents": 0,
+                "error": None,
+            }
+
+        def job():
+            try:
+                self._reembed(model_name, model_revision, chunk_size, num_workers, switch)
+            except Exception as e:
+                self.reembed_status.update(state="failed", error=str(e))
+                if not background:
+                    raise
+
+        if not background:
+            job()
+            return self.reembed_status
+
+        self._reembed_thread = threading.Thread(target=job, name="reembed", daemon=True)
+        self._reembed_thread.start()
+        return self.reembed_status
+
+    def _reembed(self, model_name: str, model_revision: Optional[str], chunk_size: int,
+                 num_workers: int, switch: bool):
+        """
+        Body of reembed(): fill the new namespace, then build and swap in its
+        index, repeating if documents changed meanwhile (later passes only
+        encode what changed)
+        """
+        status = self.reembed_status
+        embedder = EmbeddingGenerator(
+            model_name, model_revision=model_revision, cache_dtype=self.cache.dtype,
+            cache_path=str(self.cache.cache_path), hash_algo=self.embedder.hasher.algorithm
+        )
+        status["state"] = "embedding"
+
+        try:
+            while True:
+                with self._lock.read():
+                    version = self.index_version
+                    doc_nums = dict(self.doc_id_map)
+                status["passes"] += 1
+
+                if not switch:
+                    for _ in self._reembed_stream(embedder, doc_nums, chunk_size, num_workers):
+                        pass
+                    status["state"] = "done"
+                    embedder.cache.close()
+                    return
+
+                index = self._index_for(embedder, doc_nums, chunk_size, num_workers)
+                with self._lock.write():
+                    if self.index_version == version:
+                        self._switch_embedder(embedder, index)
+                        status["state"] = "done"
+                        return
+                if isinstance(index, ShardedIndex):
+                    index.close()
+        except Exception:
+            embedder.cache.close()
+            raise
+
+    def _reembed_stream(self, embedder: EmbeddingGenerator, doc_nums: dict, chunk_size: int,
+                        num_workers: int):
+        """Pipeline rows of the given documents' stored texts under another model"""
+        status = self.reembed_status
+        status["documents"] = 0
+
+        def count(doc_id, text):
+            status["documents"] += 1
+
+        documents = ((doc_id, text) for doc_id in doc_nums
+                     for text in [self.doc_store.get(doc_id)] if text is not None)
+        return self._iter_texts(documents, chunk_size, num_workers, on_document=count, embedder=embedder)
+
+    def _index_for(self, embedder: EmbeddingGenerator, doc_nums: dict, chunk_size: int, num_workers: int):
+        """
+        New index of documents' vectors under another model, with the same
+        FAISS ids (document numbers and passages) as the current index
+        """
+        if self.chunking is None:
+            n_vectors = len(doc_nums)
+        else:
+            n_vectors = sum(len(self.passages.get(doc_id, ())) for doc_id in doc_nums)
+        index = self._new_index(embedder.dimension, n_vectors)
+
+        if needs_training(self.index_config["index_type"]):
+            # First pass fills the namespace and samples, second reads it back
+            sampler = ReservoirSampler(sample_size(index))
+            for chunk in self._reembed_stream(embedder, doc_nums, chunk_size, num_workers):
+                for row in chunk:
+                    for vector in self._row_vectors(row):
+                        sampler.add(vector)
+            index = self._train_index(index, sampler.sample())
+
+        for chunk in self._reembed_stream(embedder, doc_nums, chunk_size, num_workers):
+            ids = []
+            vectors = []
+            for row in chunk:
+                matrix = self._row_vectors(row)
+                ids.append(self._faiss_ids(doc_nums[row[0]], len(matrix)))
+                vectors.append(matrix)
+            if ids:
+                index.add_with_ids(np.vstack(vectors).astype('float32'), np.concatenate(ids))
+        return index
+
+    def _switch_embedder(self, embedder: EmbeddingGenerator, index):
+        """Make another model and its index the active ones; called with the lock held exclusively"""
+        previous = self.embedder
+        if previous.batcher is not None:
+            embedder.enable_batching(previous.batcher.max_batch_size, previous.batcher.max_wait * 1000)
+
+        self._close_index()
+        self.index = index
+        self._set_tombstones(np.zeros(0, dtype='int64'))  # Built from live documents only
+        self.embedder = embedder
+        self.cache = embedder.cache
+        self.model_version += 1
+        self._index_changed()
+        self._schedule_snapshot()
+        print(f"✓ Switched to model {embedder.model_name} ({index.ntotal} vectors)")
+
+        # Queries still encoding with the old model finish on the calling thread;
+        # its cache connection may still be in use by an ingest and closes with it
+        if previous.batcher is not None:
+            previous.batcher.close()
+
+    def evaluate_recall(self, queries: List[str], top_k: int = 10, nprobe: Optional[int] = None,
+                        ef_search: Optional[int] = None) -> dict:
+        """
+        Measure recall@k and latency of the configured index against an
+        exact flat index over the same vectors
+        """
+        if self.index is None:
+            raise ValueError("Index not built. Call build_index() first.")
+
+        with self._lock.read():
+            ids, vectors = self._cached_vectors()
+
+        exact = faiss.IndexIDMap2(faiss.IndexFlatIP(vectors.shape[1]))
+        exact.add_with_ids(vectors, ids)
+
+        query_matrix = self.embedder.embed_texts(queries).astype('float32')
+
+        start = time.perf_counter()
+        _, exact_ids = exact.search(query_matrix, top_k)
+        exact_time = time.perf_counter() - start
+
+        nprobe = nprobe or self.nprobe
+        ef_search = ef_search or self.ef_search
+        with self._lock.read():
+            params = search_params(self.index, nprobe=nprobe, ef_search=ef_search,
+                                   selector=self._tombstone_selector)
+            start = time.perf_counter()
+            _, approx_ids = self.index.search(query_matrix, top_k, params=params)
+            approx_time = time.perf_counter() - start
+
+        return {
+            "index_type": self.index_config["index_type"],
+            "top_k": top_k,
+            "nprobe": nprobe,
+            "ef_search": ef_search,
+            f"recall@{top_k}": round(recall_at_k(approx_ids, exact_ids), 4),
+            "flat_ms_per_query": round(exact_time * 1000 / len(queries), 3),
+            "index_ms_per_query": round(approx_time * 1000 / len(queries), 3),
+        }
+
+    def close(self):
+        """
+        Finish a running compaction and write a scheduled snapshot, then
+        release the index, the document store's writer lock and the
+        embedding cache; a running re-embedding is abandoned
+        The engine is unusable afterwards
+        """
+        if self._compaction_thread is not None:
+            self._compaction_thread.join()
+        self.flush_snapshot()
+
+        with self._lock.write():
+            self._close_index()
+            self.index = None
+            self.doc_store.close()
+            if self.embedder.batcher is not None:
+                self.embedder.batcher.close()
+            self.cache.close()
+
     def get_document(self, doc_id: str) -> str:
         """Get full document text"""
-        return self.doc_texts.get(doc_id, "")
+        return self.doc_store.get(doc_id) or ""
@@ -0,0 +1,195 @@
+"""
+Sharded FAISS index: N independent indexes searched in parallel
+"""
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+import numpy as np
+import faiss
+
+LAYOUT_FILE = "layout.json"
+
+class ShardedIndex:
+    """
+    Drop-in for the subset of the FAISS index API the engine uses
+    (add_with_ids, remove_ids, search, reconstruct(_batch), train, ntotal, d)
+    A vector goes to shard (document number % n_shards), where the document
+    number is the FAISS id shifted right by chunk_bits, so all passages of a
+    document live in one shard
+    """
+
+    def __init__(self, shards: List, chunk_bits: int = 0):
+        self.shards = list(shards)
+        self.chunk_bits = chunk_bits
+        self.d = self.shards[0].d
+        # Loaded lazily: (path, ntotal) of shards still on disk
+        self._pending = {}
+        self._load_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=len(self.shards), thread_name_prefix="shard")
+
+    @classmethod
+    def create(cls, n_shards: int, factory: Callable[[], object], chunk_bits: int = 0) -> "ShardedIndex":
+        """n_shards empty indexes from factory()"""
+        if n_shards < 1:
+            raise ValueError("n_shards must be at least 1")
+        return cls([factory() for _ in range(n_shards)], chunk_bits)
+
+    @property
+    def n_shards(self) -> int:
+        return len(self.shards)
+
+    @property
+    def ntotal(self) -> int:
+        return sum(self._pending[i][1] if i in self._pending else shard.ntotal
+                   for i, shard in enumerate(self.shards))
+
+    @property
+    def is_trained(self) -> bool:
+        return all(self.shard(i).is_trained for i in range(self.n_shards))
+
+    def shard(self, i: int):
+        """Shard i, read from disk on first use"""
+        if i in self._pending:
+            with self._load_lock:
+                if i in self._pending:
+                    path, _ = self._pending[i]
+                    self.shards[i] = faiss.read_index(str(path))
+                    del self._pending[i]
+        return self.shards[i]
+
+    def route(self, ids: np.ndarray) -> np.ndarray:
+        """Shard number of each FAISS id"""
+        return (np.asarray(ids, dtype='int64') >> self.chunk_bits) % self.n_shards
+
+    def train(self, sample: np.ndarray):
+        """Train every shard on the same sample"""
+        for i in range(self.n_shards):
+            self.shard(i).train(sample)
+
+    def add_with_ids(self, vectors: np.ndarray, ids: np.ndarray):
+        owners = self.route(ids)
+        for i in np.unique(owners):
+            rows = owners == i
+            self.shard(int(i)).add_with_ids(vectors[rows], ids[rows])
+
+    def remove_ids(self, ids: np.ndarray) -> int:
+        ids = np.asarray(ids, dtype='int64')
+        owners = self.route(ids)
+        return sum(self.shard(int(i)).remove_ids(ids[owners == i]) for i in np.unique(owners))
+
+    def reconstruct(self, idx: int) -> np.ndarray:
+        return self.shard(int(self.route([idx])[0])).reconstruct(idx)
+
+    def reconstruct_batch(self, ids: np.ndarray) -> np.ndarray:
+        """Stored vectors of ids, one reconstruct_batch call per shard"""
+        ids = np.asarray(ids, dtype='int64')
+        owners = self.route(ids)
+        vectors = np.empty((len(ids), self.d), dtype='float32')
+        for i in np.unique(owners):
+            rows = owners == i
+            vectors[rows] = self.shard(int(i)).reconstruct_batch(ids[rows])
+        return vectors
+
+    def search(self, queries: np.ndarray, k: int, params=None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Search all shards concurrently (FAISS releases the GIL) and merge
+        their top-k lists into the global top-k by score
+        """
+        futures = [
+            self._pool.submit(self._search_shard, i, queries, k, params)
+            for i in range(self.n_shards)
+        ]
+        results = [future.result() for future in futures]
+        scores = np.hstack([scores for scores, _ in results])
+        indices = np.hstack([indices for _, indices in results])
+
+        order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(scores, order, axis=1), np.take_along_axis(indices, order, axis=1)
+
+    def _search_shard(self, i: int, queries: np.ndarray, k: int, params):
+        return self.shard(i).search(queries, k, params=params)
+
+    def range_search(self, queries: np.ndarray, radius: float, params=None):
+        """Range search on all shards concurrently, results concatenated per query"""
+        futures = [
+            self._pool.submit(self._range_search_shard, i, queries, radius, params)
+            for i in range(self.n_shards)
+        ]
+        results = [future.result() for future in futures]
+
+        lims = [0]
+        distances, labels = [], []
+        for row in range(len(queries)):
+            for shard_lims, shard_distances, shard_labels in results:
+                start, end = shard_lims[row], shard_lims[row + 1]
+                distances.append(shard_distances[start:end])
+                labels.append(shard_labels[start:end])
+            lims.append(lims[-1] + sum(len(part) for part in distances[-self.n_shards:]))
+
+        return np.array(lims, dtype='int64'), np.concatenate(distances), np.concatenate(labels)
+
+    def _range_search_shard(self, i: int, queries: np.ndarray, radius: float, params):
+        return self.shard(i).range_search(queries, radius, params=params)
+
+    def save(self, directory: Path):
+        """Write one index file per shard plus layout.json (written last)"""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        files = []
+
+        for i in range(self.n_shards):
+            name = f"shard_{i:03d}.faiss"
+            path = directory / name
+            if i not in self._pending or Path(self._pending[i][0]) != path:
+                tmp_path = path.with_suffix(".faiss.tmp")
+                faiss.write_index(self.shard(i), str(tmp_path))
+                os.replace(tmp_path, path)
+            files.append({"file": name, "ntotal": self._pending[i][1] if i in self._pending else self.shards[i].ntotal})
+
+        layout = {
+            "n_shards": self.n_shards,
+            "routing": "doc_number_mod",
+            "chunk_bits": self.chunk_bits,
+            "dimension": self.d,
+            "shards": files,
+        }
+        tmp_layout = directory / (LAYOUT_FILE + ".tmp")
+        with open(tmp_layout, 'w', encoding='utf-8') as f:
+            json.dump(layout, f)
+        os.replace(tmp_layout, directory / LAYOUT_FILE)
+
+    @classmethod
+    def load(cls, directory: Path, lazy: bool = True) -> Optional["ShardedIndex"]:
+        """
+        Open a saved layout, None if missing or unreadable
+        lazy: read each shard file on first use instead of up front
+        """
+        directory = Path(directory)
+        try:
+            with open(directory / LAYOUT_FILE, 'r', encoding='utf-8') as f:
+                layout = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        entries = layout["shards"]
+        if any(not (directory / entry["file"]).exists() for entry in entries):
+            return None
+
+        if not lazy:
+            shards = [faiss.read_index(str(directory / entry["file"])) for entry in entries]
+            return cls(shards, layout["chunk_bits"])
+
+        # Stand-in shards until first use; only d is read from them
+        placeholder = faiss.IndexFlatIP(layout["dimension"])
+        index = cls([placeholder] * len(entries), layout["chunk_bits"])
+        index._pending = {
+            i: (directory / entry["file"], entry["ntotal"]) for i, entry in enumerate(entries)
+        }
+        return index
+
+    def close(self):
+        """Stop the search threads"""
+        self._pool.shutdown(wait=False)
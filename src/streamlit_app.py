@@ -64,6 +64,16 @@ def main():
     with st.sidebar:
         st.header("⚙️ Settings")
         top_k = st.slider("Number of results", 1, 20, 5)
+        mode = st.selectbox(
+            "Search mode",
+            ["vector", "hybrid", "keyword"],
+            help="vector: semantic similarity, keyword: BM25, hybrid: both fused"
+        )
+        categories = st.multiselect(
+            "Categories",
+            search_engine.metadata.values("category"),
+            help="Only search documents from these newsgroups (all when empty)"
+        )
         
         st.markdown("---")
         st.markdown("### About")
@@ -97,7 +107,8 @@ def main():
     if search_button and query:
         with st.spinner("Searching..."):
             start_time = time.time()
-            results = search_engine.search(query, top_k)
+            filters = {"category": categories} if categories else None
+            results = search_engine.search(query, top_k, mode=mode, filters=filters)
             search_time = time.time() - start_time
         
         st.success(f"Found {len(results)} results in {search_time:.2f}s")
@@ -115,7 +126,8 @@ def main():
                 exp = result['explanation']
                 
                 col1, col2, col3 = st.columns(3)
-                col1.metric("Semantic Similarity", f"{exp['semantic_similarity']:.3f}")
+                similarity = exp['semantic_similarity']
+                col1.metric("Semantic Similarity", "—" if similarity is None else f"{similarity:.3f}")
                 col2.metric("Keyword Overlap", f"{exp['overlap_ratio']*100:.0f}%")
                 col3.metric("Document Length", f"{exp['doc_length']} words")
                 
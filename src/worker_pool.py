@@ -0,0 +1,41 @@
+"""
+Bounded thread pool for running blocking search work off the event loop
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+class PoolSaturated(Exception):
+    """Raised when the pool already has max_pending jobs queued or running"""
+
+class WorkerPool:
+    def __init__(self, max_workers: int = 4, max_pending: int = 64):
+        """
+        max_workers: threads running blocking calls concurrently
+        max_pending: running + queued jobs before new work is rejected
+        """
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="search")
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Run func(*args, **kwargs) on the pool and await its result
+        Must be called from the event loop thread (pending is not locked)
+        """
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PoolSaturated(f"{self.pending} jobs pending (limit {self.max_pending})")
+
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+        finally:
+            self.pending -= 1
+
+    def shutdown(self):
+        """Stop accepting work and wait for running jobs"""
+        self._executor.shutdown(wait=True)
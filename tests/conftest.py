@@ -0,0 +1,51 @@
+"""
+Tests import the application as the src package, like the benchmarks do
+Run from the repository root: python -m pytest tests
+"""
+import re
+import sys
+from pathlib import Path
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+DIMENSION = 32
+
+class HashingModel:
+    """Deterministic bag-of-words encoder standing in for a downloaded model"""
+
+    def __init__(self, model_name, revision=None):
+        self.model_name = model_name
+
+    def get_sentence_embedding_dimension(self):
+        return DIMENSION
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True, show_progress_bar=None):
+        embeddings = np.zeros((len(texts), DIMENSION), dtype='float32')
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                rng = np.random.default_rng(sum(map(ord, word)) * 7919 + len(word))
+                embeddings[row] += rng.standard_normal(DIMENSION)
+            embeddings[row, 0] += 1e-3  # Empty texts still normalize
+        return embeddings
+
+@pytest.fixture
+def hashing_model(monkeypatch):
+    """Make EmbeddingGenerator load HashingModel instead of a SentenceTransformer"""
+    embedder = pytest.importorskip("src.embedder")
+    monkeypatch.setattr(embedder, "SentenceTransformer", HashingModel)
+    return HashingModel
+
+CATEGORIES = ("sci.space", "rec.autos", "comp.graphics")
+WORDS = ("orbit", "engine", "pixel", "launch", "wheel", "render", "rocket", "brake", "shader", "moon")
+
+def write_corpus(docs_dir, n_docs: int, categories=CATEGORIES):
+    """doc_<n>_<category> files of a few words each, as setup.py names them"""
+    docs_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(0)
+    for n in range(n_docs):
+        category = categories[n % len(categories)].replace('.', '_')
+        words = rng.choice(WORDS, size=12)
+        (docs_dir / f"doc_{n}_{category}.txt").write_text(" ".join(words) + f" note{n}", encoding='utf-8')
+    return docs_dir
@@ -0,0 +1,60 @@
+"""
+API routes that need no search engine
+"""
+import pytest
+
+pytest.importorskip("httpx")
+pytest.importorskip("src.embedder")
+from fastapi.testclient import TestClient
+from src import api
+
+@pytest.fixture
+def client():
+    # Not used as a context manager, so startup does not build an index
+    return TestClient(api.app)
+
+def test_reembed_is_disabled_without_admin_token(client, monkeypatch):
+    monkeypatch.setattr(api, "ADMIN_TOKEN", None)
+    response = client.post("/models/reembed", json={"model": "other"}, headers={"Authorization": "Bearer x"})
+    assert response.status_code == 404
+
+def test_reembed_requires_the_admin_token(client, monkeypatch):
+    monkeypatch.setattr(api, "ADMIN_TOKEN", "s3cret")
+    assert client.post("/models/reembed", json={"model": "other"}).status_code == 403
+    response = client.post("/models/reembed", json={"model": "other"}, headers={"Authorization": "Bearer wrong"})
+    assert response.status_code == 403
+
+    # Authorized, then refused only because no engine is running
+    response = client.post("/models/reembed", json={"model": "other"}, headers={"Authorization": "Bearer s3cret"})
+    assert response.status_code == 503
+
+def test_page_depth_is_capped(client, monkeypatch):
+    monkeypatch.setattr(api, "search_engine", object())
+    response = client.post("/search/page", json={"query": "orbit", "depth": api.MAX_PAGINATION_DEPTH + 1})
+    assert response.status_code == 400
+
+def test_reembed_runs_off_the_event_loop(client, monkeypatch):
+    import threading
+
+    class Engine:
+        def reembed(self, model, revision, switch):
+            self.thread = threading.current_thread().name
+            raise ValueError("A re-embedding is already running")
+
+    engine = Engine()
+    monkeypatch.setattr(api, "ADMIN_TOKEN", "s3cret")
+    monkeypatch.setattr(api, "search_engine", engine)
+    response = client.post("/models/reembed", json={"model": "other"}, headers={"Authorization": "Bearer s3cret"})
+    assert response.status_code == 409
+    assert engine.thread.startswith("search")
+
+@pytest.mark.parametrize("top_k", [0, -1, api.MAX_TOP_K + 1])
+def test_top_k_is_bounded(client, monkeypatch, top_k):
+    monkeypatch.setattr(api, "search_engine", object())
+    assert client.post("/search", json={"query": "orbit", "top_k": top_k}).status_code == 422
+    assert client.post("/search/batch", json={"queries": ["orbit"], "top_k": top_k}).status_code == 422
+
+def test_batch_size_is_capped(client, monkeypatch):
+    monkeypatch.setattr(api, "search_engine", object())
+    response = client.post("/search/batch", json={"queries": ["orbit"] * (api.MAX_BATCH_QUERIES + 1)})
+    assert response.status_code == 400
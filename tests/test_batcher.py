@@ -0,0 +1,81 @@
+"""
+MicroBatcher batching, error fan-out and close/flush behaviour
+"""
+import threading
+import pytest
+from src.batcher import MicroBatcher
+
+class GatedDouble:
+    """batch_fn doubling items; the first call waits for release() so others queue up"""
+
+    def __init__(self):
+        self.batches = []
+        self.threads = set()
+        self.started = threading.Event()
+        self.gate = threading.Event()
+
+    def __call__(self, items):
+        self.batches.append(list(items))
+        self.threads.add(threading.current_thread().name)
+        self.started.set()
+        self.gate.wait(10)
+        return [item * 2 for item in items]
+
+    def release(self):
+        self.gate.set()
+
+def test_queued_items_are_batched_up_to_max_batch_size():
+    fn = GatedDouble()
+    batcher = MicroBatcher(fn, max_batch_size=4, max_wait_ms=50)
+    first = batcher.submit(0)
+    fn.started.wait(10)
+
+    futures = [batcher.submit(n) for n in range(1, 10)]
+    fn.release()
+    assert first.result(10) == 0 and [f.result(10) for f in futures] == [n * 2 for n in range(1, 10)]
+    assert fn.batches == [[0], [1, 2, 3, 4], [5, 6, 7, 8], [9]]
+    assert batcher.stats()["batches"] == 4 and batcher.stats()["items"] == 10
+    batcher.close()
+
+def test_batch_errors_reach_every_future():
+    def fail(items):
+        raise RuntimeError("encode failed")
+
+    batcher = MicroBatcher(fail, max_wait_ms=1)
+    with pytest.raises(RuntimeError, match="encode failed"):
+        batcher(1)
+    assert batcher.stats()["batches"] == 0
+    batcher.close()
+
+def test_close_flushes_queued_items():
+    fn = GatedDouble()
+    batcher = MicroBatcher(fn, max_batch_size=32, max_wait_ms=1000)
+    first = batcher.submit(1)
+    fn.started.wait(10)
+    queued = [batcher.submit(n) for n in (2, 3)]
+
+    closing = threading.Thread(target=batcher.close)
+    closing.start()
+    fn.release()
+    closing.join(10)
+
+    assert not closing.is_alive() and not batcher._thread.is_alive()
+    assert first.result(0) == 2 and [f.result(0) for f in queued] == [4, 6]
+
+def test_close_does_not_wait_out_the_batch_window():
+    fn = GatedDouble()
+    fn.release()
+    batcher = MicroBatcher(fn, max_batch_size=32, max_wait_ms=60000)
+    future = batcher.submit(5)
+    batcher.close()  # The stop marker ends the window
+    assert future.result(0) == 10
+
+def test_submit_after_close_runs_on_the_calling_thread():
+    fn = GatedDouble()
+    fn.release()
+    batcher = MicroBatcher(fn)
+    batcher.close()
+    batcher.close()  # Idempotent
+
+    assert batcher(4) == 8
+    assert fn.threads == {threading.current_thread().name}
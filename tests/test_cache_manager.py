@@ -0,0 +1,151 @@
+"""
+CacheManager migrations from every earlier on-disk layout
+"""
+import sqlite3
+import numpy as np
+import pytest
+from src.cache_manager import CacheManager
+from src.quantization import encode_vector
+
+MODEL = "test/model"
+NOW = "2024-01-01T00:00:00"
+
+def vector(seed: int, dim: int = 4) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+
+def legacy_db(path, statements, rows):
+    """SQLite file holding an older layout: CREATE statements, then {table: [row, ...]}"""
+    conn = sqlite3.connect(path)
+    for statement in statements:
+        conn.execute(statement)
+    for table, table_rows in rows.items():
+        placeholders = ",".join("?" * len(table_rows[0]))
+        conn.executemany(f"INSERT INTO {table} VALUES ({placeholders})", table_rows)
+    conn.commit()
+    conn.close()
+
+def tables(cache: CacheManager) -> set:
+    rows = cache._conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+    return {name for name, in rows}
+
+# Per-document tables before quantized storage and pluggable hashing
+PER_DOC_TABLES = [
+    """CREATE TABLE embeddings (doc_id TEXT PRIMARY KEY, embedding BLOB NOT NULL,
+                                hash TEXT NOT NULL, updated_at TEXT NOT NULL)""",
+    """CREATE TABLE passages (doc_id TEXT NOT NULL, chunk_no INTEGER NOT NULL, embedding BLOB NOT NULL,
+                              hash TEXT NOT NULL, updated_at TEXT NOT NULL, PRIMARY KEY (doc_id, chunk_no))""",
+]
+
+def test_migrates_per_document_tables(tmp_path):
+    path = tmp_path / "cache.db"
+    legacy_db(path, PER_DOC_TABLES, {
+        "embeddings": [("a", vector(1).tobytes(), "ha", NOW), ("b", vector(2).tobytes(), "hb", NOW)],
+        "passages": [("a", 0, vector(3).tobytes(), "pa0", NOW), ("a", 1, vector(4).tobytes(), "pa1", NOW)],
+    })
+
+    cache = CacheManager(str(path), hash_algo="sha256", model=MODEL, dim=4)
+    assert not {"embeddings", "passages"} & tables(cache)
+
+    found = cache.get_many([("a", "ha"), ("b", "hb")])
+    np.testing.assert_array_equal(found["a"], vector(1))
+    np.testing.assert_array_equal(found["b"], vector(2))
+    # Rows without the column were sha256 hashes
+    assert cache.get_many([("a", None)])["a"] is not None
+    passages = cache.get_passages_many([("a", 0, "pa0"), ("a", 1, None)])
+    np.testing.assert_array_equal(passages[("a", 1)], vector(4))
+
+    [namespace] = cache.namespaces()
+    assert (namespace["model"], namespace["revision"], namespace["dim"], namespace["vectors"]) == (MODEL, "", 4, 4)
+
+def test_migrates_per_document_tables_with_dtype_and_hash_algo(tmp_path):
+    path = tmp_path / "cache.db"
+    statements = PER_DOC_TABLES + [
+        f"ALTER TABLE {table} ADD COLUMN {column} TEXT NOT NULL DEFAULT '{default}'"
+        for table in ("embeddings", "passages")
+        for column, default in (("dtype", "float32"), ("hash_algo", "sha256"))
+    ]
+    legacy_db(path, statements, {
+        "embeddings": [
+            ("a", encode_vector(vector(1), "float16"), "ha", NOW, "float16", "blake3"),
+            ("b", encode_vector(vector(2), "int8"), "hb", NOW, "int8", "sha256"),
+            # Same content as a: one vector row
+            ("c", encode_vector(vector(1), "float16"), "ha", NOW, "float16", "blake3"),
+        ],
+        "passages": [("a", 0, encode_vector(vector(3), "float32"), "pa0", NOW, "float32", "blake3")],
+    })
+
+    cache = CacheManager(str(path), hash_algo="blake3", model=MODEL, dim=4)
+    found = cache.get_many([("a", "ha"), ("c", "ha")])
+    np.testing.assert_allclose(found["a"], vector(1), atol=1e-2)
+    np.testing.assert_array_equal(found["a"], found["c"])
+    assert cache.get_passages_many([("a", 0, "pa0")])
+
+    # b was hashed with sha256: only offered as stale for re-verification
+    stale = {}
+    assert cache.get_many([("b", "other")], stale=stale) == {}
+    assert stale["b"][:2] == ("sha256", "hb")
+    np.testing.assert_allclose(stale["b"][2], vector(2), atol=0.05)
+
+    assert cache.namespaces()[0]["vectors"] == 3
+
+def test_legacy_vector_of_another_dimension_gets_its_own_namespace(tmp_path):
+    path = tmp_path / "cache.db"
+    legacy_db(path, PER_DOC_TABLES[:1], {
+        "embeddings": [("a", vector(1).tobytes(), "ha", NOW), ("b", vector(2, dim=8).tobytes(), "hb", NOW)],
+    })
+
+    cache = CacheManager(str(path), model=MODEL, dim=4)
+    assert {(n["dim"], n["vectors"]) for n in cache.namespaces()} == {(4, 1), (8, 1)}
+    assert set(cache.get_many([("a", "ha"), ("b", "hb")])) == {"a"}
+
+def test_migrates_vectors_keyed_by_model(tmp_path):
+    path = tmp_path / "cache.db"
+    legacy_db(path, [
+        """CREATE TABLE vectors (model TEXT NOT NULL, hash_algo TEXT NOT NULL, hash TEXT NOT NULL,
+                                 embedding BLOB NOT NULL, dtype TEXT NOT NULL, updated_at TEXT NOT NULL,
+                                 PRIMARY KEY (model, hash_algo, hash))""",
+        """CREATE TABLE doc_hashes (doc_id TEXT PRIMARY KEY, hash TEXT NOT NULL, hash_algo TEXT NOT NULL,
+                                    updated_at TEXT NOT NULL)""",
+    ], {
+        "vectors": [
+            (MODEL, "sha256", "ha", vector(1).tobytes(), "float32", NOW),
+            ("other/model", "sha256", "ha", vector(2, dim=8).tobytes(), "float32", NOW),
+        ],
+        "doc_hashes": [("a", "ha", "sha256", NOW)],
+    })
+
+    cache = CacheManager(str(path), model=MODEL, dim=4)
+    assert "vectors_by_model" not in tables(cache)
+    np.testing.assert_array_equal(cache.get_many([("a", None)])["a"], vector(1))
+    assert {(n["model"], n["dim"], n["active"]) for n in cache.namespaces()} == {
+        (MODEL, 4, True), ("other/model", 8, False)
+    }
+    cache.close()
+
+    # The other model reads its own vector through the shared mapping
+    other = CacheManager(str(path), model="other/model", dim=8)
+    np.testing.assert_array_equal(other.get_many([("a", "ha")])["a"], vector(2, dim=8))
+
+def test_migration_runs_once(tmp_path):
+    path = tmp_path / "cache.db"
+    legacy_db(path, PER_DOC_TABLES[:1], {"embeddings": [("a", vector(1).tobytes(), "ha", NOW)]})
+    CacheManager(str(path), model=MODEL, dim=4).close()
+
+    cache = CacheManager(str(path), model=MODEL, dim=4)
+    assert cache.namespaces()[0]["vectors"] == 1
+    with pytest.raises(ValueError):
+        cache.set("b", vector(2, dim=8), "hb")
+
+def test_prune_forgets_documents_not_kept(tmp_path):
+    cache = CacheManager(str(tmp_path / "cache.db"), model=MODEL, dim=4)
+    cache.set_many([("a", vector(1), "ha"), ("b", vector(2), "hb"), ("c", vector(1), "ha")])
+    cache.set_passages_many([("d", 0, vector(3), "pd0")])
+    cache.set("b", vector(4), "hb2")  # Orphans hb
+    assert cache.prune() == 1
+
+    # c still shares a's vector, d's passage stays with d
+    assert cache.prune(keep_doc_ids=["c", "d"]) == 1
+    # Looked up by content: a's text is still cached through c
+    assert set(cache.get_many([("a", "ha"), ("b", "hb2"), ("c", "ha")])) == {"a", "c"}
+    assert cache.get_passages_many([("d", 0, "pd0")])
+    assert cache.namespaces()[0]["vectors"] == 2
@@ -0,0 +1,123 @@
+"""
+DocumentStore shared between processes
+"""
+import subprocess
+import sys
+import textwrap
+import threading
+from pathlib import Path
+import pytest
+from src.doc_store import DocumentStore, StoreLocked
+
+ROOT = Path(__file__).resolve().parent.parent
+
+def _reader(store_dir: Path, doc_id: str) -> subprocess.Popen:
+    """Process that maps the store, waits for a line on stdin, then reads doc_id again"""
+    script = textwrap.dedent(f"""
+        import sys
+        sys.path.insert(0, {str(ROOT)!r})
+        from src.doc_store import DocumentStore
+        store = DocumentStore({str(store_dir)!r})
+        print(len(store.get({doc_id!r})), flush=True)
+        sys.stdin.readline()
+        print(len(store.get({doc_id!r})), flush=True)
+    """)
+    return subprocess.Popen([sys.executable, "-c", script], stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE, text=True)
+
+def test_clear_does_not_break_readers_in_other_processes(tmp_path):
+    store = DocumentStore(tmp_path)
+    store.put_many((f"doc_{i}", "x" * 4096) for i in range(256))
+    store.flush()
+
+    reader = _reader(tmp_path, "doc_255")
+    assert reader.stdout.readline().strip() == "4096"
+
+    store.clear()
+    store.put("new", "text")
+    store.flush()
+
+    out, _ = reader.communicate("\n", timeout=30)
+    assert reader.returncode == 0  # Not killed by SIGBUS
+    assert out.strip() == "4096"
+    store.close()
+
+def test_second_writer_is_refused(tmp_path):
+    writer = DocumentStore(tmp_path)
+    writer.put("a", "first")
+    writer.flush()
+
+    script = textwrap.dedent(f"""
+        import sys
+        sys.path.insert(0, {str(ROOT)!r})
+        from src.doc_store import DocumentStore, StoreLocked
+        store = DocumentStore({str(tmp_path)!r})
+        assert store.get("a") == "first"
+        try:
+            store.put("b", "second")
+        except StoreLocked:
+            sys.exit(3)
+    """)
+    assert subprocess.run([sys.executable, "-c", script]).returncode == 3
+
+    writer.close()
+    reopened = DocumentStore(tmp_path)
+    reopened.put("b", "second")
+    assert reopened.get("a") == "first" and reopened.get("b") == "second"
+    reopened.close()
+
+def test_compact_keeps_live_documents(tmp_path):
+    store = DocumentStore(tmp_path, compression="zlib")
+    store.put_many([("a", "one"), ("b", "two"), ("a", "three")])
+    store.remove("b")
+    store.compact()
+    assert dict(store.items()) == {"a": "three"}
+    store.close()
+
+    with pytest.raises(KeyError):
+        dict(DocumentStore(tmp_path).items())["b"]
+
+def test_clear_writes_the_empty_table_first(tmp_path):
+    store = DocumentStore(tmp_path)
+    store.put_many([("a", "one"), ("b", "two")])
+    store.flush()
+    store.clear()  # A crash right after leaves an empty, consistent store
+    store.close()
+
+    reopened = DocumentStore(tmp_path)
+    assert len(reopened) == 0 and reopened.get("a") is None
+
+def test_table_past_the_end_of_the_data_file_is_rejected(tmp_path):
+    store = DocumentStore(tmp_path)
+    store.put_many([("a", "one"), ("b", "two")])
+    store.close()
+    with open(tmp_path / "docs.dat", 'r+b') as f:
+        f.truncate(2)
+
+    reopened = DocumentStore(tmp_path)
+    assert len(reopened) == 0 and reopened.get("b") is None
+
+def test_acquire_waits_for_the_writer_and_reloads_its_table(tmp_path):
+    writer = DocumentStore(tmp_path)
+    waiter = DocumentStore(tmp_path)
+    writer.put("a", "first")
+    with pytest.raises(StoreLocked):
+        waiter.put("b", "second")
+
+    threading.Timer(0.3, writer.release).start()
+    waiter.acquire(timeout=30)
+    waiter.put("b", "second")
+    assert waiter.get("a") == "first" and waiter.get("b") == "second"
+    waiter.close()
+    writer.close()
+
+def test_dead_space_counts_removed_and_overwritten_records(tmp_path):
+    store = DocumentStore(tmp_path)
+    store.put_many([("a", "x" * 100), ("b", "y" * 100), ("c", "z" * 200)])
+    assert store.dead_space() == 0
+    store.put("a", "w" * 100)
+    store.remove("b")
+    assert store.dead_space() == pytest.approx(0.4)
+    store.compact()
+    assert store.dead_space() == 0 and store.get("a") == "w" * 100
+    store.close()
@@ -0,0 +1,49 @@
+"""
+KeywordIndex persistence and compaction
+"""
+import numpy as np
+from src.keyword_index import KeywordIndex
+
+QUERIES = ("orbit", "car engine", "moon text", "unknown")
+
+def make_index() -> KeywordIndex:
+    index = KeywordIndex()
+    index.add("a", "the rocket orbit orbit")
+    index.add("b", "a car engine")
+    index.add("a", "new moon text")  # Re-added: the old postings die
+    index.add("c", "orbit car car")
+    index.remove("b")
+    return index
+
+def test_compact_drops_dead_postings_and_keeps_rankings():
+    index = make_index()
+    before = [index.search(query, 5) for query in QUERIES]
+    index.compact()
+
+    assert index.num_to_doc == ["a", "c"]
+    assert sum(len(docs) for docs, _ in index.postings.values()) == 5
+    assert [index.search(query, 5) for query in QUERIES] == before
+
+def test_save_and_load_round_trip(tmp_path):
+    index = make_index()
+    path = tmp_path / "keywords.npz"
+    index.save(path, tag="snap1")
+
+    loaded = KeywordIndex.load(path, tag="snap1")
+    assert [loaded.search(query, 5) for query in QUERIES] == [index.search(query, 5) for query in QUERIES]
+    assert loaded.vocab == index.vocab
+    assert loaded.doc_lengths == index.doc_lengths
+    for doc_id, tokens in index.doc_tokens.items():
+        np.testing.assert_array_equal(loaded.doc_tokens[doc_id], tokens)
+    words, ids = loaded.query_terms("orbit moon")
+    assert loaded.explain("c", words, ids) == index.explain("c", words, ids)
+
+    # Still updatable after loading
+    loaded.add("d", "orbit")
+    assert {doc_id for doc_id, _ in loaded.search("orbit", 5)} == {"c", "d"}
+
+def test_load_rejects_other_tags_and_missing_files(tmp_path):
+    path = tmp_path / "keywords.npz"
+    make_index().save(path, tag="snap1")
+    assert KeywordIndex.load(path, tag="snap2") is None
+    assert KeywordIndex.load(tmp_path / "missing.npz", tag="snap1") is None
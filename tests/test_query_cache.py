@@ -0,0 +1,61 @@
+"""
+LRUCache eviction by count, by size and by age
+"""
+import types
+import pytest
+from src import query_cache
+from src.query_cache import LRUCache, normalize_query
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable time.monotonic for the cache module"""
+    now = types.SimpleNamespace(value=0.0)
+    monkeypatch.setattr(query_cache, "time", types.SimpleNamespace(monotonic=lambda: now.value))
+    return now
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LRUCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # b is now the oldest
+    cache.set("c", 3)
+
+    assert cache.get("b") is None and cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1 and len(cache) == 2
+
+def test_size_bound_evicts_until_the_bytes_fit():
+    cache = LRUCache(max_entries=100, max_bytes=100, sizeof=len)
+    for key in "abc":
+        cache.set(key, "x" * 40)
+    assert cache.get("a") is None and cache.bytes == 80
+
+    cache.set("b", "x" * 10)  # Replacing releases the old size
+    assert cache.bytes == 50 and cache.get("c") is not None
+
+    cache.set("big", "x" * 101)  # Larger than the whole budget: nothing stays
+    assert len(cache) == 0 and cache.bytes == 0
+
+def test_entries_expire_after_ttl(clock):
+    cache = LRUCache(ttl_seconds=10)
+    cache.set("a", 1)
+    clock.value = 10
+    assert cache.get("a") == 1
+
+    clock.value = 10.5
+    assert cache.get("a") is None and len(cache) == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # Setting again restarts the clock of the entry
+    cache.set("a", 2)
+    clock.value = 20
+    assert cache.get("a") == 2
+
+def test_clear_keeps_counters():
+    cache = LRUCache(sizeof=lambda value: 8)
+    cache.set("a", 1)
+    cache.get("a")
+    cache.clear()
+    assert cache.stats() == {"entries": 0, "bytes": 0, "hits": 1, "misses": 0, "evictions": 0, "hit_rate": 1.0}
+
+def test_normalized_queries_share_a_key():
+    assert normalize_query("  Orbit\tMOON  launch ") == normalize_query("orbit moon launch")
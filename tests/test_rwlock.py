@@ -0,0 +1,55 @@
+"""
+ReadWriteLock: shared readers, exclusive writers
+"""
+import threading
+from src.rwlock import ReadWriteLock
+
+def test_readers_share_the_lock():
+    lock = ReadWriteLock()
+    both_in = threading.Barrier(2, timeout=5)
+
+    def reader():
+        with lock.read():
+            both_in.wait()  # Breaks (raises) unless both readers are inside together
+
+    threads = [threading.Thread(target=reader) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not both_in.broken
+
+def test_writer_waits_for_readers_and_blocks_new_ones():
+    lock = ReadWriteLock()
+    events = []
+    reading = threading.Event()
+    release = threading.Event()
+
+    def first_reader():
+        with lock.read():
+            reading.set()
+            release.wait(5)
+            events.append("reader done")
+
+    def writer():
+        with lock.write():
+            events.append("writer")
+
+    def late_reader():
+        with lock.read():
+            events.append("late reader")
+
+    threads = [threading.Thread(target=first_reader)]
+    threads[0].start()
+    reading.wait(5)
+    threads.append(threading.Thread(target=writer))
+    threads[1].start()
+    while not lock._writers_waiting:
+        pass
+    threads.append(threading.Thread(target=late_reader))
+    threads[2].start()
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert events == ["reader done", "writer", "late reader"]
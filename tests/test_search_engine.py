@@ -0,0 +1,309 @@
+"""
+SearchEngine over a small generated corpus, encoded by the hashing model
+"""
+import pytest
+from src.index_factory import INDEX_TYPES, supports_selector
+from conftest import CATEGORIES, write_corpus
+
+# Enough documents to train every index type instead of falling back to flat
+N_DOCS = 300
+
+def make_engine(tmp_path, **kwargs):
+    from src.search_engine import SearchEngine
+    return SearchEngine(
+        index_dir=str(tmp_path / "index"), cache_path=str(tmp_path / "embeddings.db"),
+        result_cache_size=0, **kwargs
+    )
+
+@pytest.fixture
+def corpus(tmp_path):
+    return write_corpus(tmp_path / "docs", N_DOCS)
+
+@pytest.mark.parametrize("index_type", INDEX_TYPES)
+def test_filtered_search_every_index_type(hashing_model, tmp_path, corpus, index_type):
+    engine = make_engine(tmp_path, index_type=index_type)
+    engine.build_index(str(corpus))
+
+    filters = {"category": "rec.autos"}
+    results = engine.search("engine wheel brake", top_k=5, filters=filters)
+    assert len(results) == 5
+    assert all(r["doc_id"].endswith("_rec_autos") for r in results)
+
+    page = engine.search_page("engine wheel brake", page_size=5, depth=20, min_score=-1.0, filters=filters)
+    assert page["results"]
+    assert all(r["doc_id"].endswith("_rec_autos") for r in page["results"])
+
+@pytest.mark.parametrize("index_type", ["ivf", "ivfpq", "hnsw"])
+def test_selective_filter_fills_top_k_at_default_search_params(hashing_model, tmp_path, index_type):
+    # 5% of the documents match each filter
+    categories = [f"group{i}.misc" for i in range(20)]
+    docs = write_corpus(tmp_path / "docs", 1000, categories)
+    engine = make_engine(tmp_path, index_type=index_type)
+    engine.build_index(str(docs))
+
+    for category in categories[:5]:
+        results = engine.search("orbit pixel brake", top_k=10, filters={"category": category})
+        assert len(results) == 10
+        assert all(r["doc_id"].endswith(category.replace('.', '_')) for r in results)
+
+def test_pq_filters_after_searching(hashing_model, tmp_path, corpus):
+    engine = make_engine(tmp_path, index_type="pq")
+    engine.build_index(str(corpus))
+    # Trained as PQ, not replaced by the flat fallback
+    assert not supports_selector(engine.index)
+
+def test_cursor_page_after_removal(hashing_model, tmp_path):
+    docs = write_corpus(tmp_path / "docs", 40)
+    engine = make_engine(tmp_path, passage_window=4, passage_stride=4)
+    engine.build_index(str(docs))
+
+    first = engine.search_page("orbit rocket launch", page_size=5, depth=20)
+    ranked = [r["doc_id"] for r in first["results"]]
+    later = engine.search_page(cursor=first["next_cursor"], page_size=20)
+    removed = later["results"][0]["doc_id"]
+    engine.remove_document(removed, persist=False)
+
+    # Shrink another listed document to a single passage
+    shrunk = later["results"][1]["doc_id"]
+    (docs / f"{shrunk}.txt").write_text("orbit", encoding='utf-8')
+    engine.add_documents([docs / f"{shrunk}.txt"], persist=False)
+
+    page = engine.search_page(cursor=first["next_cursor"], page_size=20)
+    doc_ids = [r["doc_id"] for r in page["results"]]
+    assert removed not in doc_ids and removed not in ranked
+    assert shrunk in doc_ids
+
+def test_updates_are_persisted_by_one_delayed_snapshot(hashing_model, tmp_path):
+    docs = write_corpus(tmp_path / "docs", 20)
+    engine = make_engine(tmp_path, snapshot_delay=60)
+    engine.build_index(str(docs))
+    manifest = tmp_path / "index" / "manifest.json"
+    built = manifest.stat().st_mtime_ns
+
+    for n in range(20, 23):
+        path = docs / f"doc_{n}_sci_space.txt"
+        path.write_text(f"orbit moon note{n}", encoding='utf-8')
+        engine.add_documents([path])
+    engine.remove_document("doc_0_sci_space")
+    assert manifest.stat().st_mtime_ns == built  # Still scheduled
+
+    # Searches are not blocked while the snapshot holds the lock shared
+    with engine._lock.read():
+        assert engine.search("orbit moon", top_k=3)
+    engine.flush_snapshot()
+    assert engine._snapshot_timer is None
+
+    (docs / "doc_0_sci_space.txt").unlink()
+    reloaded = make_engine(tmp_path)
+    reloaded.build_index(str(docs))
+    assert reloaded.doc_ids == engine.doc_ids
+
+def test_hnsw_removals_are_tombstoned_then_compacted(hashing_model, tmp_path):
+    docs = write_corpus(tmp_path / "docs", 50)
+    engine = make_engine(tmp_path, index_type="hnsw", snapshot_delay=60)
+    engine.build_index(str(docs))
+
+    removed = [f"doc_{n}_{CATEGORIES[n % 3].replace('.', '_')}" for n in range(3)]
+    for doc_id in removed:
+        engine.remove_document(doc_id)
+    assert engine.index.ntotal == 50 and len(engine.tombstones) == 3
+    assert engine._compaction_thread is None  # Below the threshold
+    hits = engine.search("orbit engine pixel launch wheel render", top_k=50)
+    assert len(hits) == 47 and not set(removed) & {r["doc_id"] for r in hits}
+
+    # Tombstones survive a snapshot round trip
+    engine.save_snapshot()
+    for doc_id in removed:
+        (docs / f"{doc_id}.txt").unlink()
+    reloaded = make_engine(tmp_path, index_type="hnsw")
+    reloaded.build_index(str(docs))
+    assert reloaded.tombstones.tolist() == engine.tombstones.tolist()
+
+    for n in range(3, 8):
+        engine.remove_document(f"doc_{n}_{CATEGORIES[n % 3].replace('.', '_')}")
+    engine._compaction_thread.join(30)
+    assert engine.index.ntotal == 42 and not len(engine.tombstones)
+    assert len(engine.search("orbit engine pixel launch wheel render", top_k=50)) == 42
+
+def test_snapshot_restores_the_keyword_index(hashing_model, tmp_path, monkeypatch):
+    docs = write_corpus(tmp_path / "docs", 30)
+    engine = make_engine(tmp_path)
+    engine.build_index(str(docs))
+    expected = engine.search("orbit rocket", top_k=5, mode="keyword")
+
+    from src.keyword_index import KeywordIndex
+
+    def tokenize_again(self, doc_id, text):
+        raise AssertionError("keyword index rebuilt from the stored texts")
+
+    monkeypatch.setattr(KeywordIndex, "add", tokenize_again)
+    reloaded = make_engine(tmp_path)
+    reloaded.build_index(str(docs))
+    assert reloaded.search("orbit rocket", top_k=5, mode="keyword") == expected
+
+@pytest.mark.parametrize("passage_window", [None, 4])
+def test_removing_an_owner_hands_its_vectors_to_a_duplicate(hashing_model, tmp_path, passage_window):
+    docs = write_corpus(tmp_path / "docs", 20)
+    text = "orbit rocket launch moon orbit rocket"
+    owner, copies = "doc_100_sci_space", ["doc_101_rec_autos", "doc_102_sci_space"]
+    for doc_id in [owner] + copies:
+        (docs / f"{doc_id}.txt").write_text(text, encoding='utf-8')
+    engine = make_engine(tmp_path, collapse_duplicates=True, passage_window=passage_window)
+    engine.build_index(str(docs))
+
+    assert engine.duplicates == {copy: owner for copy in copies}
+    text_hash = engine.embedder.compute_hash(text)
+    assert engine._owners[text_hash] == owner
+    vectors = engine.index.ntotal
+
+    engine.remove_document(owner, persist=False)
+    heir = copies[0]
+    assert engine.index.ntotal == vectors  # Vectors kept for the heir
+    assert engine.duplicates == {copies[1]: heir}
+    assert owner not in engine.doc_id_map and heir in engine.doc_id_map
+    assert engine._owners[text_hash] == heir
+
+    [top] = engine.search(text, top_k=1)
+    assert top["doc_id"] == heir and top["duplicates"] == [copies[1]]
+    # A filter matching only the remaining copy still finds the shared vectors
+    [filtered] = engine.search(text, top_k=1, filters={"category": "sci.space"})
+    assert filtered["doc_id"] == copies[1] and filtered["duplicates"] == [heir]
+
+    engine.remove_document(copies[1], persist=False)
+    assert engine.duplicates == {} and engine._copies == {}
+    engine.remove_document(heir, persist=False)
+    assert engine.index.ntotal < vectors
+    assert text_hash not in engine._owners
+    assert not {r["doc_id"] for r in engine.search(text, top_k=25)} & {owner, *copies}
+
+def test_snapshot_is_not_loaded_after_a_crash_mid_rebuild(hashing_model, tmp_path):
+    docs = write_corpus(tmp_path / "docs", 20)
+    engine = make_engine(tmp_path)
+    engine.build_index(str(docs))
+    # What a rebuild leaves behind when killed right after clearing the store
+    engine._snapshot_paths()[1].unlink()
+    engine.doc_store.clear()
+    engine.doc_store.close()
+
+    restarted = make_engine(tmp_path)
+    restarted.build_index(str(docs))
+    assert len(restarted.doc_store) == 20
+    assert restarted.get_document("doc_3_sci_space")
+
+def test_engines_sharing_an_index_dir_wait_for_the_rebuild(hashing_model, tmp_path):
+    import threading
+    docs = write_corpus(tmp_path / "docs", 20)
+    engines = [make_engine(tmp_path) for _ in range(3)]
+    threads = [threading.Thread(target=engine.build_index, args=(str(docs),)) for engine in engines]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(60)
+
+    # None died with StoreLocked; the others loaded the snapshot of the one that built
+    assert all(engine.index is not None and engine.index.ntotal == 20 for engine in engines)
+    for engine in engines:
+        engine.close()
+
+    reopened = make_engine(tmp_path)
+    reopened.build_index(str(docs))
+    path = docs / "doc_20_sci_space.txt"
+    path.write_text("orbit moon", encoding='utf-8')
+    assert reopened.add_documents([path]) == 1
+    reopened.close()
+
+def test_snapshot_compacts_the_document_store(hashing_model, tmp_path):
+    docs = write_corpus(tmp_path / "docs", 20)
+    engine = make_engine(tmp_path, snapshot_delay=60)
+    engine.build_index(str(docs))
+    for n in range(5):
+        engine.remove_document(f"doc_{n}_{CATEGORIES[n % 3].replace('.', '_')}")
+    assert engine.doc_store.dead_space() > 0.1
+
+    engine.save_snapshot()
+    assert engine.doc_store.dead_space() == 0
+    assert engine.get_document("doc_6_sci_space")
+    engine.close()
+
+def test_switched_model_survives_a_restart(hashing_model, tmp_path, capsys):
+    docs = write_corpus(tmp_path / "docs", 20)
+    engine = make_engine(tmp_path)
+    engine.build_index(str(docs))
+    engine.reembed("other/model", "v2", background=False)
+    engine.close()
+
+    restarted = make_engine(tmp_path)
+    assert (restarted.embedder.model_name, restarted.embedder.model_revision) == ("other/model", "v2")
+    capsys.readouterr()
+    restarted.build_index(str(docs))
+    assert "loaded from snapshot" in capsys.readouterr().out
+    assert restarted.index.ntotal == 20
+
+def test_default_search_params_keep_ivf_recall(hashing_model, tmp_path, corpus):
+    import json
+    from conftest import WORDS
+    from src.search_engine import DEFAULT_NPROBE
+    engine = make_engine(tmp_path, index_type="ivf")
+    engine.build_index(str(corpus))
+
+    queries = [" ".join(WORDS[i:i + 3]) for i in range(20)]
+    report = engine.evaluate_recall(queries)
+    assert report["nprobe"] == DEFAULT_NPROBE and report["recall@10"] >= 0.9
+    assert report["recall@10"] > engine.evaluate_recall(queries, nprobe=1)["recall@10"]
+    manifest = json.loads((tmp_path / "index" / "manifest.json").read_text())
+    assert manifest["search_params"]["nprobe"] == DEFAULT_NPROBE
+
+def test_compaction_replays_changes_made_while_it_built(hashing_model, tmp_path):
+    docs = write_corpus(tmp_path / "docs", 50)
+    engine = make_engine(tmp_path, index_type="hnsw", snapshot_delay=60)
+    engine.build_index(str(docs))
+    added = docs / "doc_50_sci_space.txt"
+    added.write_text("orbit moon", encoding='utf-8')
+
+    removed = engine._doc_faiss_ids(engine.doc_id_map["doc_10_rec_autos"])
+    train = engine._train_index
+    builds = []
+
+    def train_while_updating(index, sample):
+        # Runs without the engine lock, between the copy and the swap
+        builds.append(len(sample))
+        engine.remove_document("doc_10_rec_autos")
+        engine.add_documents([added])
+        return train(index, sample)
+
+    engine._train_index = train_while_updating
+    for n in range(6):
+        engine.remove_document(f"doc_{n}_{CATEGORIES[n % 3].replace('.', '_')}")
+    engine._compaction_thread.join(30)
+
+    assert len(builds) == 1  # Swapped in on the first try
+    assert engine.tombstones.tolist() == removed.tolist()
+    assert engine.index.ntotal == 45
+    hits = {r["doc_id"] for r in engine.search("orbit moon", top_k=50)}
+    assert len(hits) == 44 and "doc_50_sci_space" in hits and "doc_10_rec_autos" not in hits
+
+def test_rebuild_prunes_embeddings_of_deleted_documents(hashing_model, tmp_path):
+    docs = write_corpus(tmp_path / "docs", 20)
+    engine = make_engine(tmp_path)
+    engine.build_index(str(docs))
+    engine.close()
+
+    (docs / "doc_0_sci_space.txt").unlink()
+    (docs / "doc_3_sci_space.txt").write_text("orbit moon rewritten", encoding='utf-8')
+    rebuilt = make_engine(tmp_path)
+    rebuilt.build_index(str(docs))
+    assert rebuilt.cache.namespaces()[0]["vectors"] == 19
+
+def test_rerank_follows_the_index_built(hashing_model, tmp_path):
+    from src.index_factory import is_quantized
+    small = make_engine(tmp_path / "small", index_type="ivfpq")
+    small.build_index(str(write_corpus(tmp_path / "small_docs", 20)))
+    large = make_engine(tmp_path / "large", index_type="ivfpq")
+    large.build_index(str(write_corpus(tmp_path / "large_docs", N_DOCS)))
+
+    # Too few documents to train: the flat fallback is exact, nothing to rerank
+    for engine, quantized in ((small, False), (large, True)):
+        assert is_quantized(engine.index) == quantized
+        timings = {}
+        engine.search("orbit moon", timings=timings)
+        assert ("rerank" in timings) == quantized
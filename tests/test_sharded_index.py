@@ -0,0 +1,95 @@
+"""
+ShardedIndex against one flat index holding the same vectors
+"""
+import faiss
+import numpy as np
+import pytest
+from src.sharded_index import ShardedIndex
+
+DIMENSION = 16
+
+def flat():
+    return faiss.IndexIDMap2(faiss.IndexFlatIP(DIMENSION))
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((300, DIMENSION)).astype('float32')
+    ids = np.arange(300, dtype='int64') * 7  # Not contiguous, spread over 3 shards
+    queries = rng.standard_normal((5, DIMENSION)).astype('float32')
+    return vectors, ids, queries
+
+def build(vectors, ids, n_shards=3, chunk_bits=0):
+    sharded = ShardedIndex.create(n_shards, flat, chunk_bits)
+    sharded.add_with_ids(vectors, ids)
+    exact = flat()
+    exact.add_with_ids(vectors, ids)
+    return sharded, exact
+
+def test_search_merges_shards_into_the_global_top_k(data):
+    vectors, ids, queries = data
+    sharded, exact = build(vectors, ids)
+    assert sharded.ntotal == 300 and all(shard.ntotal for shard in sharded.shards)
+
+    scores, indices = sharded.search(queries, 10)
+    exact_scores, exact_indices = exact.search(queries, 10)
+    np.testing.assert_array_equal(indices, exact_indices)
+    np.testing.assert_allclose(scores, exact_scores, rtol=1e-5)
+
+    # Deeper than the whole index: missing slots are padded with -1
+    _, indices = sharded.search(queries, 400)
+    assert (indices[:, :300] >= 0).all() and (indices[:, 300:] == -1).all()
+    sharded.close()
+
+def test_range_search_concatenates_hits_per_query(data):
+    vectors, ids, queries = data
+    sharded, exact = build(vectors, ids)
+
+    lims, distances, labels = sharded.range_search(queries, 2.0)
+    exact_lims, _, exact_labels = exact.range_search(queries, 2.0)
+    np.testing.assert_array_equal(lims, exact_lims)
+    for row in range(len(queries)):
+        hits = labels[lims[row]:lims[row + 1]]
+        assert set(hits) == set(exact_labels[exact_lims[row]:exact_lims[row + 1]])
+        assert (distances[lims[row]:lims[row + 1]] >= 2.0).all()
+    sharded.close()
+
+def test_passages_of_a_document_share_a_shard(data):
+    vectors, _, _ = data
+    chunk_bits = 4
+    ids = (np.arange(100, dtype='int64').repeat(3) << chunk_bits) + np.tile(np.arange(3), 100)
+    sharded, _ = build(vectors, ids, chunk_bits=chunk_bits)
+
+    for i, shard in enumerate(sharded.shards):
+        stored = faiss.vector_to_array(shard.id_map)
+        assert ((stored >> chunk_bits) % 3 == i).all()
+    np.testing.assert_array_equal(sharded.reconstruct_batch(ids[::7]), vectors[::7])
+    sharded.close()
+
+def test_saved_shards_load_on_first_use(tmp_path, data):
+    vectors, ids, queries = data
+    sharded, exact = build(vectors, ids)
+    sharded.save(tmp_path)
+    sharded.close()
+
+    loaded = ShardedIndex.load(tmp_path)
+    assert len(loaded._pending) == 3
+    assert loaded.ntotal == 300 and loaded.d == DIMENSION  # From the layout, nothing read yet
+
+    # ids[0] == 0 routes to shard 0 only
+    np.testing.assert_array_equal(loaded.reconstruct(int(ids[0])), vectors[0])
+    assert sorted(loaded._pending) == [1, 2]
+
+    _, indices = loaded.search(queries, 10)
+    np.testing.assert_array_equal(indices, exact.search(queries, 10)[1])
+    assert not loaded._pending
+    loaded.close()
+
+def test_load_rejects_a_missing_shard_file(tmp_path, data):
+    vectors, ids, _ = data
+    sharded, _ = build(vectors, ids)
+    sharded.save(tmp_path)
+    sharded.close()
+
+    (tmp_path / "shard_001.faiss").unlink()
+    assert ShardedIndex.load(tmp_path) is None
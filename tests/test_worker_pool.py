@@ -0,0 +1,54 @@
+"""
+WorkerPool backpressure: jobs beyond max_pending are rejected, not queued
+"""
+import asyncio
+import threading
+import pytest
+from src.worker_pool import WorkerPool, PoolSaturated
+
+def test_saturated_pool_rejects_then_recovers():
+    pool = WorkerPool(max_workers=1, max_pending=2)
+    gate = threading.Event()
+
+    async def scenario():
+        blocked = [asyncio.ensure_future(pool.run(gate.wait, 10)) for _ in range(2)]
+        await asyncio.sleep(0)  # Both counted as pending
+        assert pool.pending == 2
+
+        with pytest.raises(PoolSaturated):
+            await pool.run(lambda: "rejected")
+        assert pool.rejected == 1
+
+        gate.set()
+        assert await asyncio.gather(*blocked) == [True, True]
+        assert pool.pending == 0
+        return await pool.run(lambda x: x + 1, 41)
+
+    assert asyncio.run(scenario()) == 42
+    pool.shutdown()
+
+def test_job_errors_release_their_slot():
+    pool = WorkerPool(max_workers=1, max_pending=1)
+
+    def fail():
+        raise ValueError("bad query")
+
+    async def scenario():
+        with pytest.raises(ValueError):
+            await pool.run(fail)
+        return pool.pending
+
+    assert asyncio.run(scenario()) == 0 and pool.rejected == 0
+    pool.shutdown()
+
+def test_api_answers_503_when_saturated(monkeypatch):
+    pytest.importorskip("src.embedder")
+    from fastapi import HTTPException
+    from src import api
+
+    monkeypatch.setattr(api, "worker_pool", WorkerPool(max_workers=1, max_pending=0))
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(api.run_blocking(lambda: "never runs"))
+    assert error.value.status_code == 503
+    assert error.value.headers == {"Retry-After": "1"}
+    api.worker_pool.shutdown()